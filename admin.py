@@ -1,8 +1,12 @@
+import asyncio
 from typing import List, Dict
 from datetime import datetime
+from telegram.error import TelegramError
 from config import Config
-from db import Database
+from db import Database, WRITE_CONFLICT, WRITE_CONFLICT_MESSAGE
 from utils import Utils
+from cache import memoize, cache_snapshots
+from throttle import Priority
 
 class AdminManager:
     """Admin management system"""
@@ -15,8 +19,11 @@ class AdminManager:
         """Check if user is admin"""
         return user_id in self.config.ADMINS or user_id == self.config.BOT_OWNER_ID
     
+    # Every chat message writes users, so writes would drop this on each
+    # one: rely on the TTL alone, and the figures may be up to 60s old
+    @memoize(depends_on={}, ttl=60)
     async def get_bot_stats(self) -> str:
-        """Get bot statistics"""
+        """Get bot statistics (up to 60 seconds stale)"""
         stats = self.db.get_stats()
         
         stats_text = f"""
@@ -40,16 +47,54 @@ class AdminManager:
         """
         return stats_text
     
+    async def get_cache_stats(self) -> str:
+        """Get cache hit ratios, memory and latency"""
+        snapshots = cache_snapshots()
+        if not snapshots:
+            return "🧠 কোনো ক্যাশ চালু নেই।"
+        
+        stats_text = "🧠 **ক্যাশ পরিসংখ্যান:**\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+        for snap in sorted(snapshots, key=lambda s: s["name"]):
+            get_latency = snap["latency"]["get"]
+            stats_text += (
+                f"\n📦 **{snap['name']}** ({snap['policy']})\n"
+                f"• Entries: {snap['entries']:,} | {snap['bytes'] / 1024:.1f} KB\n"
+                f"• Hit ratio: {snap['hit_ratio'] * 100:.1f}% ({snap['hits']:,}/{snap['hits'] + snap['misses']:,})\n"
+                f"• Evicted: {snap['evictions']:,} | Expired: {snap['expirations']:,}\n"
+                f"• get p50/p99: {get_latency['p50_us']:.1f}/{get_latency['p99_us']:.1f} µs\n"
+            )
+            for name, ns in sorted(snap["namespaces"].items()):
+                stats_text += (
+                    f"   ◦ `{name}`: {ns['hit_ratio'] * 100:.0f}% hit, "
+                    f"{ns['loads']} loads, {ns['avg_load_ms']:.1f} ms avg\n"
+                )
+        return stats_text
+    
+    async def get_load_status(self, status: Dict) -> str:
+        """Format LoadShedder.status() for admins"""
+        thresholds = " / ".join(
+            f"{lag:.0f} ms, {depth}"
+            for lag, depth in zip(status["lag_thresholds"], status["queue_thresholds"])
+        )
+        return (
+            f"🚦 **লোড শেডিং:** লেভেল {status['level']}/{status['max_level']}\n"
+            f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+            f"• Loop lag: {status['lag_ms']:.0f} ms (peak {status['peak_lag_ms']:.0f} ms)\n"
+            f"• Queued updates: {status['queue_depth']}\n"
+            f"• {', '.join(status['shed_types'])} limits: ×{status['scale']:g}\n"
+            f"• Thresholds (lag, queue): {thresholds}\n"
+            f"• Scales per level: {', '.join(f'×{s:g}' for s in status['scales'])}\n"
+            f"• Level held for {status['level_age']:.0f}s\n"
+        )
+    
     async def broadcast_message(self, admin_id: int, message: str) -> Dict:
-        """Broadcast message to all users (simulated)"""
+        """Validate a broadcast; deliver_broadcast() does the sending"""
         if not self.is_admin(admin_id):
             return {"success": False, "message": "শুধুমাত্র অ্যাডমিন ব্রডকাস্ট করতে পারবেন!"}
         
         if len(message) < 5:
             return {"success": False, "message": "বার্তাটি খুব ছোট!"}
         
-        # In real bot, you would send to all users
-        # This is simulation
         total_users = len(self.db.users)
         
         return {
@@ -58,6 +103,25 @@ class AdminManager:
             "sent_to": total_users
         }
     
+    async def deliver_broadcast(self, bot, message: str, batch_size: int = 30) -> Dict:
+        """Send a broadcast to every user in the bulk lane (replies keep priority)"""
+        sent = failed = 0
+        user_ids = [int(user_id) for user_id in list(self.db.users)]
+        for start in range(0, len(user_ids), batch_size):
+            results = await asyncio.gather(*(
+                bot.send_message(user_id, message, rate_limit_args={"priority": Priority.BULK})
+                for user_id in user_ids[start:start + batch_size]
+            ), return_exceptions=True)
+            for result in results:
+                if isinstance(result, TelegramError):
+                    failed += 1
+                elif isinstance(result, BaseException):
+                    raise result
+                else:
+                    sent += 1
+        print(f"📢 Broadcast delivered: {sent} sent, {failed} failed")
+        return {"sent": sent, "failed": failed}
+    
     async def manage_user(self, admin_id: int, target_id: int, action: str, reason: str = "") -> Dict:
         """Manage user (warn/ban/unban)"""
         if not self.is_admin(admin_id):
@@ -68,8 +132,10 @@ class AdminManager:
             return {"success": False, "message": "ইউজার খুঁজে পাওয়া যায়নি!"}
         
         if action == "warn":
-            warnings = user.get("warnings", 0) + 1
-            self.db.update_user(target_id, {"warnings": warnings})
+            user = self.db.modify_user(target_id, lambda u: {"warnings": u.get("warnings", 0) + 1})
+            if user is WRITE_CONFLICT:
+                return {"success": False, "message": WRITE_CONFLICT_MESSAGE}
+            warnings = user["warnings"] if user else 0
             
             if warnings >= 3:
                 self.db.update_user(target_id, {"is_banned": True})
@@ -104,8 +170,11 @@ class AdminManager:
                 return {"success": False, "message": "সঠিক সংখ্যা দিন!"}
             
             amount = int(reason)
-            user["coins"] += amount
-            self.db.update_user(target_id, {"coins": user["coins"]})
+            user = self.db.modify_user(target_id, lambda u: {"coins": u["coins"] + amount})
+            if user is WRITE_CONFLICT:
+                return {"success": False, "message": WRITE_CONFLICT_MESSAGE}
+            if not user:
+                return {"success": False, "message": "ইউজার খুঁজে পাওয়া যায়নি!"}
             
             return {
                 "success": True,
@@ -158,7 +227,7 @@ class AdminManager:
 📊 **অ্যাকটিভিটি:**
 • মোট মেসেজ: {user.get('total_messages', 0)}
 • শেষ দেখা: {user.get('last_seen', 'N/A')[:16]}
-• ইনভেন্টরি আইটেম: {len(user.get('inventory', []))}
+• ইনভেন্টরি আইটেম: {sum(user.get('inventory', {}).values())}
 
 🚨 **স্ট্যাটাস:** {"❌ ব্যান" if user.get('is_banned') else "✅ অ্যাকটিভ"}
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
@@ -1,12 +1,35 @@
+import asyncio
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, List, Optional
 from db import Database
+from cache import memoize
 
 class Analytics:
     """Analytics and statistics system"""
     
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, replica=None):
         self.db = db
+        # Optional replica.ReplicaClient; heavy reads go to the standby
+        self.replica = replica
+    
+    async def _find(self, collection: str, where: Optional[Dict] = None,
+                    order_by: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        """Query the standby if configured, else the primary"""
+        if self.replica:
+            try:
+                return await self.replica.find(collection, where, order_by, limit)
+            except (OSError, ValueError, asyncio.TimeoutError) as e:
+                print(f"⚠️ Replica query failed, using primary: {e}")
+        return self.db.find(collection, where=where, order_by=order_by, limit=limit)
+    
+    async def _count(self, collection: str, where: Optional[Dict] = None) -> int:
+        """Count on the standby if configured, else the primary"""
+        if self.replica:
+            try:
+                return await self.replica.count(collection, where)
+            except (OSError, ValueError, asyncio.TimeoutError) as e:
+                print(f"⚠️ Replica query failed, using primary: {e}")
+        return self.db.count(collection, where=where)
     
     async def get_daily_stats(self, date_str: str = None) -> Dict:
         """Get daily statistics"""
@@ -64,6 +87,7 @@ class Analytics:
         
         return growth_data
     
+    @memoize(depends_on={"games": None})
     async def get_game_analytics(self) -> Dict:
         """Get game analytics"""
         # Collect game statistics from database
@@ -105,43 +129,36 @@ class Analytics:
     
     async def get_top_users(self, limit: int = 10) -> List[Dict]:
         """Get top users by coins"""
-        users_list = []
-        
-        for user_id_str, user_data in self.db.users.items():
-            users_list.append({
-                "user_id": int(user_id_str),
+        # Walks the coins index, richest first
+        return [
+            {
+                "user_id": int(user_data.get("id", 0)),
                 "username": user_data.get("username", ""),
                 "coins": user_data.get("coins", 0),
                 "level": user_data.get("level", 1),
                 "total_messages": user_data.get("total_messages", 0)
-            })
-        
-        # Sort by coins (descending)
-        users_list.sort(key=lambda x: x["coins"], reverse=True)
-        
-        return users_list[:limit]
+            }
+            for user_data in await self._find("users", order_by="-coins", limit=limit)
+        ]
     
+    @memoize(depends_on={"payments": None})
     async def get_revenue_report(self) -> Dict:
         """Get revenue report"""
         # Analyze payment data
-        payments = self.db.payments.values()
+        deposits = await self._find("payments", where={"status": "COMPLETED", "type": "DEPOSIT"})
         
         total_revenue = 0
         completed_payments = 0
-        pending_payments = 0
+        pending_payments = await self._count("payments", where={"status": "PENDING"})
         method_breakdown = {}
         
-        for payment in payments:
-            if payment.get("type") == "DEPOSIT" and payment.get("status") == "COMPLETED":
-                amount = payment.get("amount", 0)
-                total_revenue += amount
-                completed_payments += 1
-                
-                method = payment.get("method", "unknown")
-                method_breakdown[method] = method_breakdown.get(method, 0) + amount
+        for payment in deposits:
+            amount = payment.get("amount", 0)
+            total_revenue += amount
+            completed_payments += 1
             
-            elif payment.get("status") == "PENDING":
-                pending_payments += 1
+            method = payment.get("method", "unknown")
+            method_breakdown[method] = method_breakdown.get(method, 0) + amount
         
         return {
             "total_revenue": total_revenue,
@@ -154,8 +171,9 @@ class Analytics:
     async def get_system_health(self) -> Dict:
         """Get system health metrics"""
         total_users = len(self.db.users)
-        active_users = sum(1 for u in self.db.users.values() 
-                          if (datetime.now() - datetime.fromisoformat(u.get("last_seen", "2020-01-01"))).days < 7)
+        active_users = await self._count("users", where={
+            "last_seen": (">", (datetime.now() - timedelta(days=7)).isoformat())
+        })
         
         total_coins = sum(u.get("coins", 0) for u in self.db.users.values())
         total_messages = sum(u.get("total_messages", 0) for u in self.db.users.values())
@@ -228,6 +246,25 @@ class Analytics:
 {stats['growth_rate']} গ্রোথ রেকর্ড করা হয়েছে।
             """
         
+        elif report_type == "revenue":
+            stats = await self.get_revenue_report()
+            methods = "\n".join(
+                f"• {method}: ৳{amount:,.2f}" for method, amount in stats["method_breakdown"].items()
+            ) or "• -"
+            
+            report = f"""
+💰 **রাজস্ব রিপোর্ট**
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+• মোট রাজস্ব: ৳{stats['total_revenue']:,.2f}
+• সম্পন্ন পেমেন্ট: {stats['completed_payments']}
+• পেন্ডিং পেমেন্ট: {stats['pending_payments']}
+• গড় লেনদেন: ৳{stats['avg_transaction']:,.2f}
+
+💳 **মেথড অনুযায়ী:**
+{methods}
+            """
+        
         else:
             report = "❌ অজানা রিপোর্ট টাইপ!"
         
@@ -68,13 +68,10 @@ class AutoMessager:
     async def check_birthdays(self):
         """Check for user birthdays"""
         today = datetime.now().strftime("%m-%d")
-        birthday_users = []
-        
-        for user_id_str, user_data in self.db.users.items():
-            if user_data.get("birthday", "").endswith(today):
-                birthday_users.append(int(user_id_str))
-        
-        return birthday_users
+        return [
+            int(user_data["id"])
+            for user_data in self.db.find("users", where={"birthday": ("endswith", today)})
+        ]
     
     async def send_birthday_wish(self, user_id: int):
         """Send birthday wish"""
@@ -89,10 +86,7 @@ class AutoMessager:
         """
         
         # Add birthday bonus
-        user = self.db.get_user(user_id)
-        if user:
-            user["coins"] += 500
-            self.db.update_user(user_id, {"coins": user["coins"]})
+        self.db.modify_user(user_id, lambda u: {"coins": u["coins"] + 500})
         
         return wish
     
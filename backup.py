@@ -64,6 +64,11 @@ class BackupManager:
                     json.dump(self.db.groups, f, indent=2, ensure_ascii=False)
                 backup_data["groups"] = len(self.db.groups)
             
+            # Cold user records
+            if hasattr(self.db, 'cold_dir') and os.path.isdir(self.db.cold_dir):
+                shutil.copytree(self.db.cold_dir, os.path.join(backup_path, "cold"))
+                backup_data["cold_records"] = len(os.listdir(self.db.cold_dir))
+            
             # Create backup info file
             info = {
                 "name": backup_name,
@@ -236,6 +241,21 @@ class BackupManager:
                     self.db.groups = json.load(f)
                 restore_stats["groups"] = len(self.db.groups)
             
+            # Cold user records
+            cold_dir = os.path.join(temp_dir, "cold")
+            if os.path.isdir(cold_dir):
+                shutil.rmtree(self.db.cold_dir, ignore_errors=True)
+                shutil.copytree(cold_dir, self.db.cold_dir)
+                restore_stats["cold_records"] = len(os.listdir(cold_dir))
+            
+            # Drop cached cold records, rebuild shop index, upgrade old records
+            with self.db.lock:
+                self.db._cold.clear()
+                self.db._index_shop()
+                self.db._migrate_inventories()
+                self.db._split_cold_fields()
+                self.db.rebuild_indexes()
+            
             # Save restored data
             self.db._save_json("users.json", self.db.users)
             self.db._save_json("payments.json", self.db.payments)
@@ -5,17 +5,23 @@ Professional Telegram Bot for Termux
 """
 
 import asyncio
+import functools
 import logging
 from datetime import datetime
 import sys
 import os
+import time
+from typing import Dict, Optional, Tuple
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    TypeHandler,
+    ApplicationHandlerStop,
     filters,
     ContextTypes,
     ConversationHandler
@@ -30,6 +36,14 @@ from games import GamesManager
 from shop import ShopManager
 from admin import AdminManager
 from security import SecurityManager
+from rate_limit import RateLimiter, shared_rate_store
+from throttle import TelegramThrottler, api_seconds
+from load_shedder import LoadShedder
+from replica import ReplicationPublisher, ReplicaClient
+from analytics import Analytics
+from checkpoint import Checkpointer
+from cache import get_memoizer
+from responses import ResponseRegistry
 
 # Setup logging
 logging.basicConfig(
@@ -41,9 +55,30 @@ logger = logging.getLogger(__name__)
 # Conversation states
 AMOUNT, METHOD, ACCOUNT, QUESTION, ANSWER = range(5)
 
+# RateLimiter limit type per command / button (everything else is "commands")
+COMMAND_LIMITS = {
+    "dice": "games",
+    "slot": "games",
+    "quiz": "games",
+    "daily": "games",
+    "deposit": "deposits",
+    "withdraw": "withdrawals"
+}
+# Arguments a command needs to act; with fewer it only shows its usage
+# and counts as an ordinary command
+COMMAND_MIN_ARGS = {
+    "deposit": 1,
+    "withdraw": 2
+}
+CALLBACK_LIMITS = (
+    ("game_", "games"),
+    ("daily_bonus", "games"),
+    ("deposit_", "deposits")
+)
+
 class MARPdBot:
-    def __init__(self):
-        """Initialize the bot"""
+    def __init__(self, db: Database = None):
+        """Initialize the bot (db is passed in when a standby takes over)"""
         self.config = Config()
         
         # Validate config
@@ -54,16 +89,40 @@ class MARPdBot:
         self.config.show_banner()
         
         # Initialize managers
-        self.db = Database()
+        self.db = db or Database()
         self.payments = PaymentManager(self.db)
         self.games = GamesManager(self.db)
         self.shop = ShopManager(self.db)
         self.admin = AdminManager(self.db)
         self.security = SecurityManager(self.db)
+        self.rate_limiter = RateLimiter(backend=shared_rate_store())
+        self.load_shedder = LoadShedder(self.rate_limiter)
+        # user_id -> monotonic time until which "rate limited" isn't repeated
+        self.rate_notices = {}
+        
+        # Change stream for a warm standby (python replica.py)
+        self.replication = ReplicationPublisher(self.db) if self.config.REPLICATION_ENABLED else None
+        # Reports read from the standby when REPLICA_READS is on (primary as fallback)
+        self.analytics = Analytics(self.db, replica=ReplicaClient() if self.config.REPLICA_READS else None)
+        
+        # Precompiled texts and keyboards for the static commands
+        self.responses = ResponseRegistry(self.config, self.db)
         
         # User sessions
         self.user_sessions = {}
         
+        # Warm restart: restore abuse counters, open quizzes and (after a
+        # clean stop only) memo caches
+        self.checkpoints = Checkpointer()
+        self.checkpoints.register("sessions", self)
+        self.checkpoints.register("security", self.security)
+        self.checkpoints.register("rate_limits", self.rate_limiter)
+        self.memo_managers = (self.admin, self.shop, self.analytics)
+        for manager in self.memo_managers:
+            self.checkpoints.register(f"memo.{type(manager).__name__}", get_memoizer(manager).store,
+                                      clean_only=True)
+        self.checkpoints.load()
+        
         print("\n✅ Bot initialized successfully!")
         print("⏳ Starting bot...\n")
     
@@ -96,6 +155,8 @@ class MARPdBot:
         # Admin commands
         application.add_handler(CommandHandler("admin", self.admin_command))
         application.add_handler(CommandHandler("stats", self.stats_command))
+        application.add_handler(CommandHandler("cachestats", self.cachestats_command))
+        application.add_handler(CommandHandler("load", self.load_command))
         application.add_handler(CommandHandler("broadcast", self.broadcast_command))
         application.add_handler(CommandHandler("userinfo", self.userinfo_command))
         application.add_handler(CommandHandler("backup", self.backup_command))
@@ -106,11 +167,108 @@ class MARPdBot:
         # Callback query handler
         application.add_handler(CallbackQueryHandler(self.button_handler))
         
+        # One user load and one write-back per update
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                handler.callback = self._request_scoped(handler.callback)
+        
+        # Rate limits run first and never touch the database
+        application.add_handler(TypeHandler(Update, self.rate_limit_gate), group=-1)
+        
         # Error handler
         application.add_error_handler(self.error_handler)
     
+    def _request_scoped(self, callback):
+        """Run a handler inside a Database.request_scope() and measure its cost
+        
+        Only the handler's own time counts: API calls (network and waits
+        for an outbound slot) are subtracted.
+        """
+        @functools.wraps(callback)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            api_time = [0.0]
+            token = api_seconds.set(api_time)
+            started = time.perf_counter()
+            try:
+                with self.db.request_scope():
+                    return await callback(update, context)
+            finally:
+                elapsed = time.perf_counter() - started - api_time[0]
+                api_seconds.reset(token)
+                classified = self._classify(update)
+                if classified is not None:
+                    self.rate_limiter.record_cost(classified[1], max(elapsed, 0.0))
+        return wrapper
+    
+    def _classify(self, update: Update) -> Optional[Tuple[str, str]]:
+        """(RateLimiter limit type, cost name) for an update (None = not limited)"""
+        if update.callback_query:
+            data = update.callback_query.data or ""
+            cost_name = RateLimiter.cost_name(callback_data=data)
+            for prefix, limit_type in CALLBACK_LIMITS:
+                if data.startswith(prefix):
+                    return limit_type, cost_name
+            return "commands", cost_name
+        
+        message = update.effective_message
+        if message is None:
+            return None
+        text = message.text or ""
+        words = text[1:].split() if text.startswith("/") else []
+        if words:
+            command = words[0].split("@", 1)[0].lower()
+            if len(words) - 1 < COMMAND_MIN_ARGS.get(command, 0):
+                return "commands", RateLimiter.cost_name(command=command)
+            return COMMAND_LIMITS.get(command, "commands"), RateLimiter.cost_name(command=command)
+        return "messages", RateLimiter.cost_name()
+    
+    async def rate_limit_gate(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Stop over-limit and temp-banned users before any other handler runs"""
+        user = update.effective_user
+        if user is None or self.admin.is_admin(user.id):
+            return
+        classified = self._classify(update)
+        if classified is None:
+            return
+        limit_type, cost_name = classified
+        
+        ban = self.rate_limiter.is_temp_banned(user.id)
+        if ban["banned"]:
+            await self._notify_limited(update, ban["message"], ban["time_left"])
+            raise ApplicationHandlerStop
+        
+        # Expensive commands also draw on a per-user compute budget; both
+        # are used only when both allow the request
+        result = await self.rate_limiter.check_limits_async(user.id, {
+            limit_type: 1,
+            "compute": self.rate_limiter.command_cost(cost_name)
+        })
+        if not result["allowed"]:
+            await self._notify_limited(update, result["message"], result["retry_after"])
+            raise ApplicationHandlerStop
+    
+    async def _notify_limited(self, update: Update, text: str, wait: float):
+        """Tell a limited user why, at most once per wait"""
+        if update.callback_query:
+            await update.callback_query.answer(text)
+            return
+        
+        now = time.monotonic()
+        user_id = update.effective_user.id
+        if self.rate_notices.get(user_id, 0) > now:
+            return
+        if len(self.rate_notices) > 10000:
+            self.rate_notices = {k: until for k, until in self.rate_notices.items() if until > now}
+        self.rate_notices[user_id] = now + wait
+        await update.effective_message.reply_text(text)
+    
     # =============== COMMAND HANDLERS ===============
     
+    def _language(self, user_id: int) -> str:
+        """User's language setting"""
+        user = self.db.users.get(str(user_id))
+        return (user or {}).get("settings", {}).get("language", "bn")
+    
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
         user = update.effective_user
@@ -125,44 +283,12 @@ class MARPdBot:
                 "last_name": user.last_name or ""
             })
         
-        welcome_text = f"""
-🎉 **স্বাগতম {user.first_name}!** 🎉
-
-🤖 **{self.config.BOT_NAME}** - সর্বশেষ ভার্সন {self.config.VERSION}
-
-💰 **আপনার স্টার্টার বোনাস:**
-• {Utils.format_currency(db_user.get('balance', 0))} ব্যালেন্স
-• {Utils.format_coins(db_user.get('coins', 0))} কয়েন
-
-🎮 **গেম খেলুন:** /games
-🛍️ **শপ ব্রাউজ করুন:** /shop
-💳 **ব্যালেন্স চেক:** /balance
-
-📱 **পেমেন্ট মেথড:**
-• নগদ: {self.config.NAGOD_NUMBER}
-• বিকাশ: {self.config.BIKASH_NUMBER}
-
-🔧 **সাহায্যের জন্য:** /help
-
-**"সাফল্য চাইলে আগে বিশ্বাস করতে হবে!"**
-        """
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("🎮 গেমস", callback_data="games_menu"),
-                InlineKeyboardButton("🛍️ শপ", callback_data="shop_menu")
-            ],
-            [
-                InlineKeyboardButton("💰 ব্যালেন্স", callback_data="balance"),
-                InlineKeyboardButton("📊 প্রোফাইল", callback_data="profile")
-            ],
-            [
-                InlineKeyboardButton("ℹ️ সাহায্য", callback_data="help"),
-                InlineKeyboardButton("⭐ ডেইলি বোনাস", callback_data="daily_bonus")
-            ]
-        ]
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        welcome_text, reply_markup = self.responses.render(
+            "start", self._language(user_id),
+            first_name=user.first_name,
+            balance=Utils.format_currency(db_user.get('balance', 0)),
+            coins=Utils.format_coins(db_user.get('coins', 0))
+        )
         
         await update.message.reply_text(
             welcome_text,
@@ -172,42 +298,7 @@ class MARPdBot:
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command"""
-        help_text = """
-🆘 **সাহায্য - সকল কমান্ড**
-
-🎯 **সাধারণ কমান্ড:**
-/start - বট শুরু করুন
-/help - সাহায্য দেখুন
-/profile - আপনার প্রোফাইল
-/settings - সেটিংস (শীঘ্রই)
-
-💰 **ইকোনমি কমান্ড:**
-/balance - ব্যালেন্স চেক
-/deposit - ডিপোজিট করুন
-/withdraw - উইথড্র করুন
-/payments - পেমেন্ট হিস্টরি
-
-🎮 **গেমস কমান্ড:**
-/games - সকল গেম দেখুন
-/dice [bet] - ডাইস গেম খেলুন
-/slot [bet] - স্লট মেশিন
-/quiz - কুইজ গেম
-/daily - ডেইলি বোনাস নিন
-
-🛍️ **শপ কমান্ড:**
-/shop - শপ ব্রাউজ করুন
-/inventory - আপনার ইনভেন্টরি
-/buy [item_id] - আইটেম কিনুন
-
-👑 **অ্যাডমিন কমান্ড:**
-/admin - অ্যাডমিন প্যানেল
-/stats - বট পরিসংখ্যান
-/broadcast [msg] - ব্রডকাস্ট
-/userinfo [id] - ইউজার তথ্য
-
-📞 **সাপোর্ট:**
-রিপোর্টের জন্য সরাসরি অ্যাডমিনকে কন্টাক্ট করুন: @{}
-        """.format(self.config.OWNER_USERNAME)
+        help_text, _ = self.responses.render("help", self._language(update.effective_user.id))
         
         await update.message.reply_text(help_text, parse_mode='Markdown')
     
@@ -246,7 +337,7 @@ class MARPdBot:
 📊 **অ্যাকটিভিটি:**
 • মোট মেসেজ: {db_user.get('total_messages', 0)}
 • শেষ দেখা: {db_user.get('last_seen', '')[:16]}
-• ইনভেন্টরি: {len(db_user.get('inventory', []))} আইটেম
+• ইনভেন্টরি: {sum(db_user.get('inventory', {}).values())} আইটেম
 
 🎯 **উদ্ধৃতি:** {Utils.get_random_quote()}
         """
@@ -453,56 +544,7 @@ class MARPdBot:
     
     async def games_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /games command"""
-        games_text = """
-🎮 **গেমস জোন**
-
-🎲 **ডাইস গেম:**
-• বেট করে ডাইস রোল করুন
-• বটের চেয়ে বেশি পেলে জিতবেন
-• কমান্ড: `/dice [bet]`
-• ন্যূনতম বেট: 10 কয়েন
-
-🎰 **স্লট মেশিন:**
-• ৩টি মিললে জ্যাকপট!
-• কমান্ড: `/slot [bet]`
-• ন্যূনতম বেট: 20 কয়েন
-
-🧠 **কুইজ গেম:**
-• জ্ঞান পরীক্ষা করুন
-• সঠিক উত্তরে 50 কয়েন
-• কমান্ড: `/quiz`
-
-🎁 **ডেইলি বোনাস:**
-• প্রতিদিন ফ্রি কয়েন
-• স্ট্রীক বাড়লে বোনাস বাড়ে
-• কমান্ড: `/daily`
-
-🏆 **লিডারবোর্ড:**
-• শীর্ষ খেলোয়াড়দের দেখুন
-• সাপ্তাহিক পুরস্কার
-
-⚡ **টিপস:**
-• ছোট বেট দিয়ে শুরু করুন
-• ডেইলি বোনাস নিতে ভুলবেন না
-• লাকি হলে বিশাল জিততে পারেন!
-        """
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("🎲 ডাইস (10)", callback_data="game_dice_10"),
-                InlineKeyboardButton("🎰 স্লট (20)", callback_data="game_slot_20")
-            ],
-            [
-                InlineKeyboardButton("🧠 কুইজ", callback_data="game_quiz"),
-                InlineKeyboardButton("🎁 ডেইলি", callback_data="daily_bonus")
-            ],
-            [
-                InlineKeyboardButton("🏆 লিডারবোর্ড", callback_data="leaderboard"),
-                InlineKeyboardButton("📊 স্ট্যাটস", callback_data="game_stats")
-            ]
-        ]
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        games_text, reply_markup = self.responses.render("games", self._language(update.effective_user.id))
         
         await update.message.reply_text(
             games_text,
@@ -644,41 +686,12 @@ class MARPdBot:
     
     async def shop_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /shop command"""
-        items = self.shop.get_shop_items()
+        shop_text, reply_markup = self.responses.render("shop", self._language(update.effective_user.id))
         
-        if not items:
-            await update.message.reply_text("❌ শপে এখন কোনো আইটেম নেই!")
+        if reply_markup is None:
+            await update.message.reply_text(shop_text)
             return
         
-        shop_text = "🛍️ **শপ - সকল আইটেম**\n\n"
-        
-        keyboard = []
-        row = []
-        
-        for i, item in enumerate(items):
-            shop_text += f"{item.get('icon', '📦')} **{item['name']}**\n"
-            shop_text += f"   💰 দাম: {Utils.format_coins(item['price'])}\n"
-            shop_text += f"   📝 {item.get('description', '')}\n"
-            shop_text += f"   🆔 ID: `{item['id']}`\n\n"
-            
-            # Add buy button
-            row.append(InlineKeyboardButton(
-                f"{item.get('icon', '📦')} {item['price']}",
-                callback_data=f"buy_{item['id']}"
-            ))
-            
-            if len(row) == 2 or i == len(items) - 1:
-                keyboard.append(row)
-                row = []
-        
-        # Add navigation buttons
-        keyboard.append([
-            InlineKeyboardButton("📦 ইনভেন্টরি", callback_data="inventory"),
-            InlineKeyboardButton("🔄 রিফ্রেশ", callback_data="refresh_shop")
-        ])
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await update.message.reply_text(
             shop_text,
             reply_markup=reply_markup,
@@ -723,55 +736,13 @@ class MARPdBot:
             await update.message.reply_text("❌ এই কমান্ড শুধুমাত্র অ্যাডমিনদের জন্য!")
             return
         
-        admin_text = f"""
-👑 **অ্যাডমিন প্যানেল**
-
-👤 **অ্যাডমিন:** @{update.effective_user.username}
-🤖 **বট:** @{self.config.BOT_USERNAME}
-
-📊 **কুইক স্ট্যাটস:**
-• মোট ইউজার: {len(self.db.users):,}
-• অ্যাকটিভ পেমেন্ট: {sum(1 for p in self.db.payments.values() if p.get('status') == 'PENDING')}
-• টোটাল কয়েন: {Utils.format_coins(sum(u.get('coins', 0) for u in self.db.users.values()))}
-
-🛠️ **অ্যাডমিন টুলস:**
-• /stats - বিস্তারিত পরিসংখ্যান
-• /broadcast [msg] - ব্রডকাস্ট বার্তা
-• /userinfo [id] - ইউজার তথ্য
-• /backup - ডাটাবেস ব্যাকআপ
-
-👤 **ইউজার ম্যানেজমেন্ট:**
-• `/warn [id] [reason]` - সতর্কতা দিন
-• `/ban [id] [reason]` - ইউজার ব্যান করুন
-• `/unban [id]` - ইউজার আনব্যান করুন
-• `/addcoins [id] [amount]` - কয়েন যোগ করুন
-
-💳 **পেমেন্ট ম্যানেজমেন্ট:**
-• পেমেন্ট আইডি দিয়ে কনফার্ম/রিজেক্ট
-• ম্যানুয়াল চেকের জন্য স্ক্রিনশট
-
-⚙️ **সিস্টেম:**
-• লগস চেক করুন
-• পারফরম্যান্স মনিটর করুন
-• ব্যাকআপ নিয়মিত নিন
-        """
-        
-        keyboard = [
-            [
-                InlineKeyboardButton("📊 স্ট্যাটস", callback_data="admin_stats"),
-                InlineKeyboardButton("📢 ব্রডকাস্ট", callback_data="admin_broadcast")
-            ],
-            [
-                InlineKeyboardButton("💾 ব্যাকআপ", callback_data="admin_backup"),
-                InlineKeyboardButton("👥 ইউজার", callback_data="admin_users")
-            ],
-            [
-                InlineKeyboardButton("💳 পেমেন্ট", callback_data="admin_payments"),
-                InlineKeyboardButton("🚨 লগস", callback_data="admin_logs")
-            ]
-        ]
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        admin_text, reply_markup = self.responses.render(
+            "admin", self._language(user_id),
+            username=update.effective_user.username,
+            total_users=len(self.db.users),
+            pending_payments=self.db.count('payments', where={'status': 'PENDING'}),
+            total_coins=Utils.format_coins(sum(u.get('coins', 0) for u in self.db.users.values()))
+        )
         
         await update.message.reply_text(
             admin_text,
@@ -787,9 +758,34 @@ class MARPdBot:
             await update.message.reply_text("❌ এই কমান্ড শুধুমাত্র অ্যাডমিনদের জন্য!")
             return
         
-        stats_text = await self.admin.get_bot_stats()
+        if context.args:
+            stats_text = await self.analytics.generate_report(context.args[0].lower())
+        else:
+            stats_text = await self.admin.get_bot_stats()
         await update.message.reply_text(stats_text, parse_mode='Markdown')
     
+    async def cachestats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /cachestats command"""
+        user_id = update.effective_user.id
+        
+        if not self.admin.is_admin(user_id):
+            await update.effective_message.reply_text("❌ এই কমান্ড শুধুমাত্র অ্যাডমিনদের জন্য!")
+            return
+        
+        stats_text = await self.admin.get_cache_stats()
+        await update.effective_message.reply_text(stats_text, parse_mode='Markdown')
+    
+    async def load_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /load command"""
+        user_id = update.effective_user.id
+        
+        if not self.admin.is_admin(user_id):
+            await update.effective_message.reply_text("❌ এই কমান্ড শুধুমাত্র অ্যাডমিনদের জন্য!")
+            return
+        
+        stats_text = await self.admin.get_load_status(self.load_shedder.status())
+        await update.effective_message.reply_text(stats_text, parse_mode='Markdown')
+    
     async def broadcast_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /broadcast command"""
         user_id = update.effective_user.id
@@ -807,6 +803,8 @@ class MARPdBot:
         result = await self.admin.broadcast_message(user_id, message)
         
         if result["success"]:
+            # Sent in the background, paced behind interactive replies
+            context.application.create_task(self.admin.deliver_broadcast(context.bot, message))
             await update.message.reply_text(f"✅ {result['message']}")
         else:
             await update.message.reply_text(f"❌ {result['message']}")
@@ -862,6 +860,12 @@ class MARPdBot:
                     f"⚠️ সতর্কতা! নিষিদ্ধ কন্টেন্ট: {', '.join(security_check['violations'])}\n"
                     f"আরও সতর্কতা পেলে ব্যান হতে পারেন!"
                 )
+            elif security_check["action"] == "delete":
+                # Campaign copy: removed without a warning
+                try:
+                    await update.message.delete()
+                except TelegramError as e:
+                    print(f"⚠️ Could not delete campaign message from {user_id}: {e}")
             return
         
         # Update user message count
@@ -1022,6 +1026,8 @@ class MARPdBot:
             
             if action == "stats":
                 await self.stats_command(update, context)
+            elif action == "cache":
+                await self.cachestats_command(update, context)
             elif action == "backup":
                 result = await self.admin.create_backup(user_id)
                 await query.edit_message_text(f"📊 {result['message']}")
@@ -1041,10 +1047,51 @@ class MARPdBot:
     
     # =============== RUN BOT ===============
     
+    # Open quizzes older than this are not restored from a checkpoint
+    SESSION_TTL = 3600
+    
+    def export_state(self) -> Dict:
+        """User sessions for a checkpoint"""
+        return self.user_sessions
+    
+    def import_state(self, state: Dict, now: float):
+        """Restore sessions that are still fresh"""
+        cutoff = datetime.fromtimestamp(now - self.SESSION_TTL)
+        for user_id, session in state.items():
+            if session.get("timestamp", cutoff) > cutoff:
+                self.user_sessions[user_id] = session
+    
+    async def post_init(self, application: Application):
+        """Start background services on the bot's event loop"""
+        self.checkpoints.start()
+        self.load_shedder.start(queue_depth=application.update_queue.qsize)
+        for manager in self.memo_managers:
+            get_memoizer(manager).cache.start_sweeper()
+        if self.replication:
+            await self.replication.start()
+    
+    async def post_shutdown(self, application: Application):
+        """Stop background services"""
+        self.load_shedder.stop()
+        if self.replication:
+            await self.replication.stop()
+        await self.checkpoints.stop()
+        for manager in self.memo_managers:
+            memoizer = get_memoizer(manager)
+            memoizer.cache.stop_sweeper()
+            memoizer.flush()
+    
     def run(self):
         """Run the bot"""
         # Create application
-        application = Application.builder().token(self.config.BOT_TOKEN).build()
+        application = (
+            Application.builder()
+            .token(self.config.BOT_TOKEN)
+            .rate_limiter(TelegramThrottler())
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+            .build()
+        )
         
         # Setup handlers
         self.setup_handlers(application)
@@ -1,50 +1,579 @@
+import asyncio
+import functools
+import heapq
+import inspect
+import logging
+import math
+import os
+import pickle
+import random
+import re
+import sqlite3
+import sys
 import time
-from typing import Any, Dict, Optional
+import weakref
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional, Union
 import threading
 
+logger = logging.getLogger(__name__)
+
+# Every live Cache, for cache_snapshots()
+_caches = weakref.WeakSet()
+
+def deep_size(obj: Any, max_depth: int = 6) -> int:
+    """Bytes held by an object and everything it references (shared objects once)"""
+    seen = set()
+    size = 0
+    stack = [(obj, 0)]
+    while stack:
+        current, depth = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if depth >= max_depth:
+            continue
+        if isinstance(current, dict):
+            for k, v in current.items():
+                stack.append((k, depth + 1))
+                stack.append((v, depth + 1))
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            for v in current:
+                stack.append((v, depth + 1))
+        elif hasattr(current, "__dict__"):
+            stack.append((current.__dict__, depth + 1))
+    return size
+
+def default_namespace(key: str) -> str:
+    """Namespace of a key: the part before the first ':' or '['"""
+    return re.split(r"[:\[]", key, 1)[0]
+
+class LatencyHistogram:
+    """Power-of-two nanosecond buckets; constant memory, O(1) record"""
+    
+    def __init__(self):
+        self.buckets = [0] * 64
+        self.count = 0
+        self.max_ns = 0
+    
+    def record(self, ns: int):
+        """Add one sample"""
+        self.buckets[min(max(ns, 1).bit_length(), 63)] += 1
+        self.count += 1
+        if ns > self.max_ns:
+            self.max_ns = ns
+    
+    def percentile(self, p: float) -> float:
+        """Upper bound of the bucket holding the p-th percentile, in microseconds"""
+        if not self.count:
+            return 0.0
+        target = self.count * p / 100
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return (1 << i) / 1000
+        return self.max_ns / 1000
+    
+    def snapshot(self) -> Dict:
+        """Summary for stats output"""
+        return {
+            "count": self.count,
+            "p50_us": self.percentile(50),
+            "p90_us": self.percentile(90),
+            "p99_us": self.percentile(99),
+            "max_us": self.max_ns / 1000
+        }
+
+class LRUPolicy:
+    """Evict the least recently used key"""
+    
+    def __init__(self, capacity: int = 0):
+        self.order = OrderedDict()
+    
+    def record_insert(self, key: str):
+        """Track a new key"""
+        self.order[key] = None
+    
+    def record_access(self, key: str):
+        """Mark a key as used"""
+        self.order.move_to_end(key)
+    
+    def record_remove(self, key: str):
+        """Forget a key"""
+        self.order.pop(key, None)
+    
+    def victim(self) -> Optional[str]:
+        """Key to evict next"""
+        return next(iter(self.order), None)
+
+class LFUPolicy:
+    """Evict the least frequently used key (LRU among ties), O(1)"""
+    
+    def __init__(self, capacity: int = 0):
+        self.freq: Dict[str, int] = {}
+        # frequency -> keys in recency order
+        self.buckets: Dict[int, OrderedDict] = {}
+        self.min_freq = 0
+    
+    def record_insert(self, key: str):
+        """Track a new key"""
+        self.freq[key] = 1
+        self.buckets.setdefault(1, OrderedDict())[key] = None
+        self.min_freq = 1
+    
+    def record_access(self, key: str):
+        """Bump a key's frequency"""
+        f = self.freq[key]
+        bucket = self.buckets[f]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[f]
+            if self.min_freq == f:
+                self.min_freq = f + 1
+        self.freq[key] = f + 1
+        self.buckets.setdefault(f + 1, OrderedDict())[key] = None
+    
+    def record_remove(self, key: str):
+        """Forget a key"""
+        f = self.freq.pop(key, None)
+        if f is None:
+            return
+        bucket = self.buckets[f]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[f]
+            if self.min_freq == f:
+                # Only reached when the minimum bucket empties on removal
+                self.min_freq = min(self.buckets) if self.buckets else 0
+    
+    def victim(self) -> Optional[str]:
+        """Key to evict next"""
+        bucket = self.buckets.get(self.min_freq)
+        return next(iter(bucket), None) if bucket else None
+
+class FrequencySketch:
+    """Count-min sketch with periodic halving (the TinyLFU popularity filter)"""
+    
+    DEPTH = 4
+    
+    def __init__(self, capacity: int):
+        width = 16
+        while width < capacity:
+            width <<= 1
+        self.mask = width - 1
+        self.table = [bytearray(width) for _ in range(self.DEPTH)]
+        self.sample_size = 10 * max(capacity, 16)
+        self.additions = 0
+    
+    def _indexes(self, key: str):
+        """One counter per row"""
+        h = hash(key)
+        for row in range(self.DEPTH):
+            h = (h * 0x9E3779B1 + row) & 0xFFFFFFFF
+            yield row, (h ^ (h >> 15)) & self.mask
+    
+    def increment(self, key: str):
+        """Count one access (4-bit saturating counters)"""
+        for row, i in self._indexes(key):
+            if self.table[row][i] < 15:
+                self.table[row][i] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self._age()
+    
+    def frequency(self, key: str) -> int:
+        """Estimated recent access count"""
+        return min(self.table[row][i] for row, i in self._indexes(key))
+    
+    def _age(self):
+        """Halve all counters so old popularity fades"""
+        for row in self.table:
+            for i in range(len(row)):
+                row[i] >>= 1
+        self.additions //= 2
+
+class WTinyLFUPolicy:
+    """Window TinyLFU: small LRU window, segmented LRU main area, sketch admission
+    
+    New keys land in the window. Under pressure the window's oldest key
+    only displaces the main area's victim if the sketch says it is more
+    popular, so one-off keys cannot flush a hot working set.
+    """
+    
+    def __init__(self, capacity: int = 10000):
+        capacity = max(capacity, 1)
+        self.window_size = max(1, capacity // 100)
+        self.main_size = max(1, capacity - self.window_size)
+        self.protected_size = max(1, self.main_size * 4 // 5)
+        self.window = OrderedDict()
+        self.probation = OrderedDict()
+        self.protected = OrderedDict()
+        self.sketch = FrequencySketch(capacity)
+    
+    def record_insert(self, key: str):
+        """Track a new key"""
+        self.sketch.increment(key)
+        self.window[key] = None
+        # Until the main area is full, window overflow moves in for free
+        while (len(self.window) > self.window_size and
+               len(self.probation) + len(self.protected) < self.main_size):
+            moved, _ = self.window.popitem(last=False)
+            self.probation[moved] = None
+    
+    def record_access(self, key: str):
+        """Mark a key as used; probation hits are promoted"""
+        self.sketch.increment(key)
+        if key in self.window:
+            self.window.move_to_end(key)
+        elif key in self.protected:
+            self.protected.move_to_end(key)
+        elif key in self.probation:
+            del self.probation[key]
+            self.protected[key] = None
+            if len(self.protected) > self.protected_size:
+                demoted, _ = self.protected.popitem(last=False)
+                self.probation[demoted] = None
+    
+    def record_remove(self, key: str):
+        """Forget a key"""
+        for segment in (self.window, self.probation, self.protected):
+            if key in segment:
+                del segment[key]
+                return
+    
+    def victim(self) -> Optional[str]:
+        """Key to evict next"""
+        main = self.probation or self.protected
+        if self.window and (len(self.window) > self.window_size or not main):
+            candidate = next(iter(self.window))
+            if not main:
+                return candidate
+            rival = next(iter(main))
+            if self.sketch.frequency(candidate) > self.sketch.frequency(rival):
+                # Admit the candidate into the main area; the rival goes
+                del self.window[candidate]
+                self.probation[candidate] = None
+                return rival
+            return candidate
+        if main:
+            return next(iter(main))
+        return next(iter(self.window), None)
+
+class KeyTrie:
+    """Radix tree of cache keys for prefix lookups in O(matching keys)"""
+    
+    __slots__ = ("root", "size")
+    
+    class Node:
+        __slots__ = ("children", "terminal")
+        
+        def __init__(self):
+            # first char of edge label -> [label, child]
+            self.children: Dict[str, list] = {}
+            self.terminal = False
+    
+    def __init__(self):
+        self.root = KeyTrie.Node()
+        self.size = 0
+    
+    def add(self, key: str):
+        """Insert a key (no-op if present)"""
+        node, rest = self.root, key
+        while rest:
+            edge = node.children.get(rest[0])
+            if edge is None:
+                child = KeyTrie.Node()
+                node.children[rest[0]] = [rest, child]
+                node, rest = child, ""
+                break
+            label, child = edge
+            common = 0
+            limit = min(len(label), len(rest))
+            while common < limit and label[common] == rest[common]:
+                common += 1
+            if common < len(label):
+                # Split the edge at the first differing char
+                middle = KeyTrie.Node()
+                middle.children[label[common]] = [label[common:], child]
+                edge[0], edge[1] = label[:common], middle
+                child = middle
+            node, rest = child, rest[common:]
+        if not node.terminal:
+            node.terminal = True
+            self.size += 1
+    
+    def discard(self, key: str):
+        """Remove a key, merging edges left with a single child"""
+        path = []  # (parent, edge)
+        node, rest = self.root, key
+        while rest:
+            edge = node.children.get(rest[0])
+            if edge is None or not rest.startswith(edge[0]):
+                return
+            path.append((node, edge))
+            node, rest = edge[1], rest[len(edge[0]):]
+        if not node.terminal:
+            return
+        node.terminal = False
+        self.size -= 1
+        
+        # Prune an empty leaf, then fold a pass-through node into its edge
+        if path and not node.children:
+            parent, edge = path.pop()
+            del parent.children[edge[0][0]]
+            node = parent
+        if path and not node.terminal and len(node.children) == 1:
+            _, edge = path[-1]
+            label, child = next(iter(node.children.values()))
+            edge[0], edge[1] = edge[0] + label, child
+    
+    def iter_prefix(self, prefix: str):
+        """Yield every key starting with prefix"""
+        node, rest, path = self.root, prefix, ""
+        while rest:
+            edge = node.children.get(rest[0])
+            if edge is None:
+                return
+            label, child = edge
+            if label.startswith(rest):
+                path, rest = path + label, ""
+            elif rest.startswith(label):
+                path, rest = path + label, rest[len(label):]
+            else:
+                return
+            node = child
+        
+        stack = [(node, path)]
+        while stack:
+            node, path = stack.pop()
+            if node.terminal:
+                yield path
+            for label, child in node.children.values():
+                stack.append((child, path + label))
+
+EVICTION_POLICIES = {
+    "lru": LRUPolicy,
+    "lfu": LFUPolicy,
+    "wtinylfu": WTinyLFUPolicy
+}
+
 class Cache:
     """Simple in-memory cache system"""
     
-    def __init__(self, default_ttl: int = 300):  # 5 minutes default
+    def __init__(self, default_ttl: int = 300,  # 5 minutes default
+                 max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 policy: Union[str, Any] = "lru", name: str = "cache",
+                 namespace_fn: Callable[[str], str] = default_namespace,
+                 size_sample_rate: int = 16):
         self.cache: Dict[str, Dict] = {}
         self.default_ttl = default_ttl
-        self.lock = threading.Lock()
+        self.lock = threading.RLock()
+        self.name = name
+        
+        # Called as on_evict(key, item) for capacity evictions (not expiry)
+        self.on_evict: Optional[Callable[[str, Dict], None]] = None
+        
+        # Secondary indexes for invalidation: key prefixes and tags
+        self.key_trie = KeyTrie()
+        self.tags: Dict[str, set] = {}
+        
+        # Instrumentation: per-namespace counters and get/set latency
+        self.namespace_fn = namespace_fn
+        self.namespaces: Dict[str, Dict] = {}
+        self.size_sample_rate = size_sample_rate
+        self.latency = {"get": LatencyHistogram(), "set": LatencyHistogram()}
+        _caches.add(self)
+        
+        # Size limits (None = unbounded) and eviction
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.evictions = 0
+        if isinstance(policy, str):
+            policy = EVICTION_POLICIES[policy](max_entries or 10000)
+        self.policy = policy
+        
+        # Expiry min-heap of (evict_at, key); entries go stale when a key is
+        # re-set or removed and are skipped when popped
+        self.expiry_heap = []
+        self.expirations = 0
+        self.sweeper_task = None
         
-        # Start cleanup thread
-        self.cleanup_thread = threading.Thread(target=self._cleanup_loop, daemon=True)
-        self.cleanup_thread.start()
+        # get_or_compute: key -> future of the load in progress
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.refresh_tasks = set()
+        # get_or_set: key -> lock held by the thread computing it
+        self.key_locks: Dict[str, threading.Lock] = {}
     
-    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
-        """Set cache value"""
+    def set(self, key: str, value: Any, ttl: Optional[int] = None, tags=()) -> bool:
+        """Set cache value, optionally labelled with tags for invalidate_tag()"""
+        return self._store(key, value, ttl, tags=tags)
+    
+    def _namespace(self, key: str) -> Dict:
+        """Counters for the namespace a key belongs to"""
+        name = self.namespace_fn(key)
+        stats = self.namespaces.get(name)
+        if stats is None:
+            stats = self.namespaces[name] = {
+                "name": name, "hits": 0, "misses": 0, "evictions": 0, "expirations": 0,
+                "loads": 0, "load_errors": 0, "load_time": 0.0, "entries": 0, "bytes": 0,
+                "sets": 0, "size_ratio": 1.0
+            }
+        return stats
+    
+    def _entry_size(self, ns: Dict, key: str, value: Any) -> int:
+        """Deep size on every size_sample_rate-th set, scaled shallow size otherwise"""
+        shallow = sys.getsizeof(key) + sys.getsizeof(value)
+        if ns["sets"] % self.size_sample_rate == 0:
+            size = sys.getsizeof(key) + deep_size(value)
+            # Smooth the deep/shallow ratio so one odd value doesn't skew it
+            ns["size_ratio"] = 0.8 * ns["size_ratio"] + 0.2 * (size / shallow) if ns["sets"] else size / shallow
+        else:
+            size = int(shallow * ns["size_ratio"])
+        ns["sets"] += 1
+        return size
+    
+    def _store(self, key: str, value: Any, ttl: Optional[int] = None,
+               stale_ttl: float = 0, delta: float = 0, tags=()) -> bool:
+        """Insert/replace an entry
+        
+        Past `expires` the value is stale: get() misses, but get_or_compute
+        may still serve it for `stale_ttl` more seconds while refreshing.
+        `delta` is how long the value took to compute (for early refresh).
+        """
+        started = time.perf_counter_ns()
         with self.lock:
+            ns = self._namespace(key)
+            size = self._entry_size(ns, key, value)
+            if self.max_bytes is not None and size > self.max_bytes:
+                # Would evict everything and still not fit; don't leave the
+                # previous value readable as if it were current
+                if key in self.cache:
+                    self._remove(key)
+                return False
+            
             expire_time = time.time() + (ttl or self.default_ttl)
+            evict_at = expire_time + stale_ttl
+            if key in self.cache:
+                old = self.cache[key]
+                self.current_bytes -= old["size"]
+                old["ns"]["bytes"] -= old["size"]
+                old["ns"]["entries"] -= 1
+                self._untag(key, old["tags"])
+                self.policy.record_access(key)
+            else:
+                self.policy.record_insert(key)
+                self.key_trie.add(key)
+            tags = tuple(tags)
+            for tag in tags:
+                self.tags.setdefault(tag, set()).add(key)
+            ns["entries"] += 1
+            ns["bytes"] += size
             self.cache[key] = {
                 "value": value,
                 "expires": expire_time,
-                "created": time.time()
+                "evict_at": evict_at,
+                "created": time.time(),
+                "size": size,
+                "delta": delta,
+                "ns": ns,
+                "tags": tags
             }
+            self.current_bytes += size
+            heapq.heappush(self.expiry_heap, (evict_at, key))
+            
+            # Piggyback a little expiry work so memory stays bounded
+            # even when no sweeper is running
+            self._expire_due(limit=8)
+            self._enforce_limits()
+            if len(self.expiry_heap) > 2 * len(self.cache) + 64:
+                self._compact_heap()
+            self.latency["set"].record(time.perf_counter_ns() - started)
             return True
     
+    def _enforce_limits(self):
+        """Evict until within max_entries / max_bytes"""
+        while ((self.max_entries is not None and len(self.cache) > self.max_entries) or
+               (self.max_bytes is not None and self.current_bytes > self.max_bytes)):
+            victim = self.policy.victim()
+            if victim is None:
+                break
+            item = self._remove(victim)
+            item["ns"]["evictions"] += 1
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(victim, item)
+    
+    def _remove(self, key: str) -> Dict:
+        """Drop an entry and its bookkeeping"""
+        item = self.cache.pop(key)
+        self.current_bytes -= item["size"]
+        item["ns"]["bytes"] -= item["size"]
+        item["ns"]["entries"] -= 1
+        self.policy.record_remove(key)
+        self.key_trie.discard(key)
+        self._untag(key, item["tags"])
+        return item
+    
+    def _untag(self, key: str, tags):
+        """Drop key from its tag sets"""
+        for tag in tags:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+    
+    def invalidate_tag(self, tag: str) -> int:
+        """Delete every entry carrying tag"""
+        with self.lock:
+            keys = self.tags.pop(tag, ())
+            for key in list(keys):
+                if key in self.cache:
+                    self._remove(key)
+            return len(keys)
+    
+    def delete_prefix(self, prefix: str) -> int:
+        """Delete every key starting with prefix"""
+        with self.lock:
+            keys = list(self.key_trie.iter_prefix(prefix))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+    
     def get(self, key: str) -> Optional[Any]:
         """Get cache value"""
+        started = time.perf_counter_ns()
         with self.lock:
-            if key in self.cache:
-                item = self.cache[key]
-                
-                # Check if expired
-                if time.time() > item["expires"]:
-                    del self.cache[key]
-                    return None
-                
+            value = self._lookup(key)
+            self.latency["get"].record(time.perf_counter_ns() - started)
+            return value
+    
+    def _lookup(self, key: str) -> Optional[Any]:
+        """get() without the timing"""
+        item = self.cache.get(key)
+        if item is not None:
+            # Check if expired
+            now = time.time()
+            if now > item["evict_at"]:
+                self._remove(key)["ns"]["expirations"] += 1
+                self.expirations += 1
+            elif now <= item["expires"]:
+                item["ns"]["hits"] += 1
+                self.policy.record_access(key)
                 return item["value"]
-            
-            return None
+            # else stale, kept only for get_or_compute
+        
+        self._namespace(key)["misses"] += 1
+        return None
     
     def delete(self, key: str) -> bool:
         """Delete cache key"""
         with self.lock:
             if key in self.cache:
-                del self.cache[key]
+                self._remove(key)
                 return True
             return False
     
@@ -53,19 +582,43 @@ class Cache:
         with self.lock:
             if key in self.cache:
                 # Check if expired
-                if time.time() > self.cache[key]["expires"]:
-                    del self.cache[key]
+                item = self.cache[key]
+                now = time.time()
+                if now > item["evict_at"]:
+                    self._remove(key)
                     return False
-                return True
+                return now <= item["expires"]
             return False
     
     def clear(self) -> int:
         """Clear all cache"""
         with self.lock:
             count = len(self.cache)
-            self.cache.clear()
+            for key in list(self.cache):
+                self._remove(key)
             return count
     
+    def export_state(self) -> List[tuple]:
+        """Live entries for a checkpoint"""
+        with self.lock:
+            now = time.time()
+            return [
+                (key, item["value"], item["expires"], item["evict_at"], item["tags"], item["delta"])
+                for key, item in self.cache.items()
+                if item["evict_at"] > now
+            ]
+    
+    def import_state(self, entries: List[tuple], now: float):
+        """Restore checkpointed entries with their remaining lifetime"""
+        for key, value, expires, evict_at, tags, delta in entries:
+            if evict_at <= now:
+                continue
+            if expires > now:
+                self._store(key, value, expires - now, evict_at - expires, delta, tags)
+            else:
+                # Only the stale-while-revalidate window is left
+                self._store(key, value, 1e-6, evict_at - now, delta, tags)
+    
     def ttl(self, key: str) -> Optional[float]:
         """Get remaining TTL for key"""
         with self.lock:
@@ -75,61 +628,220 @@ class Cache:
                 return max(0, remaining)
             return None
     
-    def _cleanup_loop(self):
-        """Background cleanup loop"""
-        while True:
-            self._cleanup_expired()
-            time.sleep(60)  # Cleanup every minute
+    def _expire_due(self, limit: Optional[int] = None) -> int:
+        """Remove entries whose expiry has passed; touches only due heap entries"""
+        removed = 0
+        now = time.time()
+        heap = self.expiry_heap
+        while heap and heap[0][0] < now and (limit is None or removed < limit):
+            evict_at, key = heapq.heappop(heap)
+            item = self.cache.get(key)
+            if item is not None and item["evict_at"] == evict_at:
+                self._remove(key)["ns"]["expirations"] += 1
+                self.expirations += 1
+                removed += 1
+        return removed
+    
+    def _compact_heap(self):
+        """Drop stale heap entries (keys re-set or removed since being pushed)"""
+        self.expiry_heap = [(item["evict_at"], key) for key, item in self.cache.items()]
+        heapq.heapify(self.expiry_heap)
     
-    def _cleanup_expired(self):
+    def _cleanup_expired(self) -> int:
         """Remove expired cache items"""
         with self.lock:
-            current_time = time.time()
-            expired_keys = [
-                key for key, item in self.cache.items()
-                if current_time > item["expires"]
-            ]
-            
-            for key in expired_keys:
-                del self.cache[key]
-            
-            if expired_keys:
-                print(f"🧹 Cleaned {len(expired_keys)} expired cache items")
+            removed = self._expire_due()
+        if removed:
+            logger.debug("Cleaned %d expired cache items", removed)
+        return removed
+    
+    async def run_sweeper(self, max_interval: float = 60, batch: int = 500):
+        """Expire entries on the event loop, sleeping until the next one is due"""
+        while True:
+            with self.lock:
+                removed = self._expire_due(limit=batch)
+                next_due = self.expiry_heap[0][0] if self.expiry_heap else None
+            if removed:
+                logger.debug("Cleaned %d expired cache items", removed)
+            if removed >= batch:
+                delay = 0  # more are due; yield to other tasks and continue
+            elif next_due is None:
+                delay = max_interval
+            else:
+                delay = min(max(next_due - time.time(), 0.05), max_interval)
+            await asyncio.sleep(delay)
+    
+    def start_sweeper(self, max_interval: float = 60) -> asyncio.Task:
+        """Schedule run_sweeper on the running loop (call from async code)"""
+        if self.sweeper_task is None or self.sweeper_task.done():
+            self.sweeper_task = asyncio.get_running_loop().create_task(self.run_sweeper(max_interval))
+        return self.sweeper_task
+    
+    def stop_sweeper(self):
+        """Cancel the sweeper task"""
+        if self.sweeper_task is not None:
+            self.sweeper_task.cancel()
+            self.sweeper_task = None
     
     def stats(self) -> Dict:
         """Get cache statistics"""
         with self.lock:
-            current_time = time.time()
-            active_items = 0
-            expired_items = 0
-            total_size = 0
-            
-            for item in self.cache.values():
-                if current_time > item["expires"]:
-                    expired_items += 1
-                else:
-                    active_items += 1
-                    # Estimate size (rough)
-                    total_size += len(str(item["value"]))
+            # Only due entries are touched; everything left is live
+            self._expire_due()
             
             return {
                 "total_items": len(self.cache),
-                "active_items": active_items,
-                "expired_items": expired_items,
-                "memory_usage_kb": total_size / 1024,
+                "active_items": len(self.cache),
+                "expired_items": 0,
+                "memory_usage_kb": self.current_bytes / 1024,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "policy": type(self.policy).__name__,
                 "default_ttl": self.default_ttl
             }
     
+    def snapshot(self) -> Dict:
+        """Structured metrics: totals, per-namespace counters and latency"""
+        with self.lock:
+            self._expire_due()
+            namespaces = {}
+            for name, ns in self.namespaces.items():
+                lookups = ns["hits"] + ns["misses"]
+                namespaces[name] = {
+                    "hits": ns["hits"],
+                    "misses": ns["misses"],
+                    "hit_ratio": ns["hits"] / lookups if lookups else 0.0,
+                    "evictions": ns["evictions"],
+                    "expirations": ns["expirations"],
+                    "loads": ns["loads"],
+                    "load_errors": ns["load_errors"],
+                    "avg_load_ms": ns["load_time"] * 1000 / ns["loads"] if ns["loads"] else 0.0,
+                    "entries": ns["entries"],
+                    "bytes": ns["bytes"]
+                }
+            hits = sum(ns["hits"] for ns in namespaces.values())
+            misses = sum(ns["misses"] for ns in namespaces.values())
+            return {
+                "name": self.name,
+                "entries": len(self.cache),
+                "bytes": self.current_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "policy": type(self.policy).__name__,
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "namespaces": namespaces,
+                "latency": {op: histogram.snapshot() for op, histogram in self.latency.items()}
+            }
+    
     def get_or_set(self, key: str, getter_func, ttl: Optional[int] = None) -> Any:
-        """Get value or set if not exists"""
+        """Get value or set if not exists (one thread computes per key)"""
         value = self.get(key)
         
         if value is None:
-            value = getter_func()
-            self.set(key, value, ttl)
+            with self.lock:
+                key_lock = self.key_locks.setdefault(key, threading.Lock())
+            with key_lock:
+                # Another thread may have filled it while we waited
+                value = self.get(key)
+                if value is None:
+                    value = getter_func()
+                    self.set(key, value, ttl)
+            with self.lock:
+                if not key_lock.locked():
+                    self.key_locks.pop(key, None)
+        
+        return value
+    
+    async def get_or_compute(self, key: str, compute: Callable, ttl: Optional[int] = None,
+                             stale_ttl: float = 0, beta: float = 1.0, tags=()) -> Any:
+        """Get value or compute it once, however many callers miss together
+        
+        compute may be a plain function or return an awaitable. Concurrent
+        misses share one in-flight load. Within `stale_ttl` after expiry the
+        old value is returned while a background refresh runs, and fresh
+        values are refreshed early with a probability that grows as expiry
+        nears (XFetch; beta > 1 refreshes earlier, 0 disables it).
+        """
+        started = time.perf_counter_ns()
+        now = time.time()
+        with self.lock:
+            item = self.cache.get(key)
+            hit = item is not None and now <= item["evict_at"]
+            if hit:
+                item["ns"]["hits"] += 1
+                self.policy.record_access(key)
+                value = item["value"]
+                if now > item["expires"]:
+                    self._refresh_in_background(key, compute, ttl, stale_ttl, tags)
+                elif beta > 0 and item["delta"] > 0:
+                    # 1 - random() is in (0, 1], so log() is defined
+                    gap = -item["delta"] * beta * math.log(1 - random.random())
+                    if now + gap >= item["expires"]:
+                        self._refresh_in_background(key, compute, ttl, stale_ttl, tags)
+            else:
+                self._namespace(key)["misses"] += 1
+            self.latency["get"].record(time.perf_counter_ns() - started)
+        
+        if hit:
+            return value
+        return await self._load(key, compute, ttl, stale_ttl, tags)
+    
+    async def _load(self, key: str, compute: Callable, ttl: Optional[int], stale_ttl: float,
+                    tags=()) -> Any:
+        """Compute and store a value, joining a load already in flight"""
+        future = self.inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+        
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        started = time.time()
+        try:
+            value = compute()
+            if inspect.isawaitable(value):
+                value = await value
+        except BaseException as e:
+            with self.lock:
+                self._namespace(key)["load_errors"] += 1
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # waiters re-raise it; don't warn if there are none
+            raise
+        finally:
+            self.inflight.pop(key, None)
         
+        delta = time.time() - started
+        with self.lock:
+            ns = self._namespace(key)
+            ns["loads"] += 1
+            ns["load_time"] += delta
+        self._store(key, value, ttl, stale_ttl, delta=delta, tags=tags)
+        future.set_result(value)
         return value
     
+    def _refresh_in_background(self, key: str, compute: Callable, ttl: Optional[int], stale_ttl: float,
+                               tags=()):
+        """Start a refresh unless one is already running"""
+        if key in self.inflight:
+            return
+        task = asyncio.get_running_loop().create_task(self._load(key, compute, ttl, stale_ttl, tags))
+        self.refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_done)
+    
+    def _refresh_done(self, task: asyncio.Task):
+        """Log failed background refreshes (the stale value stays served)"""
+        self.refresh_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Cache refresh failed: %s", task.exception())
+    
     def increment(self, key: str, amount: int = 1, ttl: Optional[int] = None) -> int:
         """Increment cache value"""
         with self.lock:
@@ -152,14 +864,412 @@ class Cache:
     def keys(self, pattern: str = "*") -> list:
         """Get cache keys matching pattern"""
         with self.lock:
-            all_keys = list(self.cache.keys())
+            self._expire_due()
             
             if pattern == "*":
-                return all_keys
+                return list(self.cache.keys())
             
             # Simple pattern matching (supports * at end)
             if pattern.endswith("*"):
-                prefix = pattern[:-1]
-                return [k for k in all_keys if k.startswith(prefix)]
+                return list(self.key_trie.iter_prefix(pattern[:-1]))
             
-            return [k for k in all_keys if k == pattern]
\ No newline at end of file
+            return [pattern] if pattern in self.cache else []
+
+class DiskCache:
+    """SQLite-backed cache tier with its own byte cap (least recently used goes first)"""
+    
+    def __init__(self, path: str, max_bytes: int = 20 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL,
+                evict_at REAL NOT NULL, delta REAL NOT NULL, size INTEGER NOT NULL,
+                accessed REAL NOT NULL)""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS entries_evict_at ON entries(evict_at)")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS tags (
+                tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key)) WITHOUT ROWID""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS tags_key ON tags(key)")
+            self.conn.execute("DELETE FROM entries WHERE evict_at < ?", (time.time(),))
+            self.conn.execute("DELETE FROM tags WHERE key NOT IN (SELECT key FROM entries)")
+        
+        # Key set in memory so misses and overwrites need no query
+        self.keys = {row[0] for row in self.conn.execute("SELECT key FROM entries")}
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def put(self, key: str, value: Any, expires: float, evict_at: float,
+            delta: float = 0, tags=()) -> bool:
+        """Store an entry with absolute expiry times"""
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        size = len(blob) + len(key)
+        if size > self.max_bytes:
+            return False
+        
+        with self.lock, self.conn:
+            if key in self.keys:
+                self._delete(key)
+            self.conn.execute(
+                "INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, blob, expires, evict_at, delta, size, time.time())
+            )
+            self.conn.executemany("INSERT OR IGNORE INTO tags VALUES (?, ?)", [(tag, key) for tag in tags])
+            self.keys.add(key)
+            self.total_bytes += size
+            if self.total_bytes > self.max_bytes:
+                self._shrink()
+            return True
+    
+    def _delete(self, key: str):
+        """Delete one entry (caller holds the lock and a transaction)"""
+        row = self.conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self.conn.execute("DELETE FROM tags WHERE key = ?", (key,))
+        self.keys.discard(key)
+        if row:
+            self.total_bytes -= row[0]
+    
+    def _shrink(self):
+        """Drop expired entries, then the least recently used, to 90% of the cap"""
+        for (key,) in self.conn.execute("SELECT key FROM entries WHERE evict_at < ?", (time.time(),)).fetchall():
+            self._delete(key)
+        while self.total_bytes > self.max_bytes * 0.9 and self.keys:
+            batch = self.conn.execute("SELECT key FROM entries ORDER BY accessed LIMIT 64").fetchall()
+            for (key,) in batch:
+                self._delete(key)
+                self.evictions += 1
+                if self.total_bytes <= self.max_bytes * 0.9:
+                    break
+    
+    def take(self, key: str) -> Optional[tuple]:
+        """Remove and return (value, expires, evict_at, delta, tags), or None"""
+        if key not in self.keys:
+            self.misses += 1
+            return None
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT value, expires, evict_at, delta FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            tags = tuple(t for (t,) in self.conn.execute("SELECT tag FROM tags WHERE key = ?", (key,)))
+            self._delete(key)
+        if row is None or row[2] < time.time():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return (pickle.loads(row[0]), row[1], row[2], row[3], tags)
+    
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+    
+    def delete(self, key: str) -> bool:
+        """Delete cache key"""
+        if key not in self.keys:
+            return False
+        with self.lock, self.conn:
+            self._delete(key)
+        return True
+    
+    def delete_prefix(self, prefix: str) -> int:
+        """Delete every key starting with prefix"""
+        with self.lock, self.conn:
+            keys = self.conn.execute(
+                "SELECT key FROM entries WHERE key >= ? AND key < ?", (prefix, prefix + chr(0x10FFFF))
+            ).fetchall()
+            for (key,) in keys:
+                self._delete(key)
+        return len(keys)
+    
+    def invalidate_tag(self, tag: str) -> int:
+        """Delete every entry carrying tag"""
+        with self.lock, self.conn:
+            keys = self.conn.execute("SELECT key FROM tags WHERE tag = ?", (tag,)).fetchall()
+            for (key,) in keys:
+                self._delete(key)
+        return len(keys)
+    
+    def clear(self) -> int:
+        """Clear all cache"""
+        with self.lock, self.conn:
+            count = len(self.keys)
+            self.conn.execute("DELETE FROM entries")
+            self.conn.execute("DELETE FROM tags")
+            self.keys.clear()
+            self.total_bytes = 0
+            return count
+    
+    def stats(self) -> Dict:
+        """Get cache statistics"""
+        return {
+            "path": self.path,
+            "entries": len(self.keys),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+class TieredCache:
+    """In-memory Cache (L1) in front of a DiskCache (L2)
+    
+    L1 capacity evictions are demoted to L2, and an L2 hit is promoted
+    back into L1 (tiers are exclusive). flush() demotes everything live,
+    so a graceful shutdown keeps the warm set for the next start.
+    
+    Tag invalidations and clears hit L1 at once, but only queue the L2
+    work: they run inside Database write listeners, under the db lock.
+    The queue is applied on the event loop right after the write (and in
+    any case before the next L2 read or write), so a crash can only
+    leave stale L2 entries for writes of the loop iteration in progress.
+    """
+    
+    def __init__(self, l1: Cache, l2: DiskCache):
+        self.l1 = l1
+        self.l2 = l2
+        self.lock = l1.lock
+        # Evicted entries waiting to be written to L2 outside the L1 lock
+        self.demotions = deque()
+        # Invalidated tags (and whether to clear) not yet applied to L2
+        self.stale_tags = set()
+        self.clear_pending = False
+        # Loop that applies the queue (learnt from the first async call)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.invalidation_scheduled = False
+        l1.on_evict = self._on_evict
+    
+    def _on_evict(self, key: str, item: Dict):
+        """L1 eviction hook (runs under the L1 lock)"""
+        self.demotions.append((key, item["value"], item["expires"], item["evict_at"], item["delta"], item["tags"]))
+    
+    def _schedule_invalidation(self):
+        """Have the loop apply the queue once the caller is done (under the L1 lock)"""
+        if self.invalidation_scheduled:
+            return
+        try:
+            self.loop = asyncio.get_running_loop()
+        except RuntimeError:
+            pass  # a worker thread: use the loop seen before
+        if self.loop is None or self.loop.is_closed():
+            return  # no loop yet; the next L2 access applies it
+        self.invalidation_scheduled = True
+        self.loop.call_soon_threadsafe(self._invalidate_pending)
+    
+    def _invalidate_pending(self):
+        """Apply queued tag invalidations and clears to L2"""
+        with self.lock:
+            tags, self.stale_tags = self.stale_tags, set()
+            clear, self.clear_pending = self.clear_pending, False
+            self.invalidation_scheduled = False
+        if clear:
+            self.l2.clear()
+        for tag in tags:
+            self.l2.invalidate_tag(tag)
+    
+    def _demote_pending(self):
+        """Write queued evictions to L2 (after queued invalidations)"""
+        self._invalidate_pending()
+        now = time.time()
+        while self.demotions:
+            key, value, expires, evict_at, delta, tags = self.demotions.popleft()
+            if evict_at > now:
+                self.l2.put(key, value, expires, evict_at, delta, tags)
+    
+    def _promote(self, key: str) -> bool:
+        """Move an L2 entry into L1"""
+        self._invalidate_pending()
+        entry = self.l2.take(key)
+        if entry is None:
+            return False
+        value, expires, evict_at, delta, tags = entry
+        now = time.time()
+        self.l1.import_state([(key, value, expires, evict_at, tags, delta)], now)
+        self._demote_pending()
+        return True
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Get cache value from either tier"""
+        value = self.l1.get(key)
+        if value is None and key in self.l2 and self._promote(key):
+            value = self.l1.get(key)
+        return value
+    
+    def set(self, key: str, value: Any, ttl: Optional[int] = None, tags=()) -> bool:
+        """Set cache value in L1 (dropping any older L2 copy)"""
+        self.l2.delete(key)
+        stored = self.l1.set(key, value, ttl, tags)
+        self._demote_pending()
+        return stored
+    
+    async def get_or_compute(self, key: str, compute: Callable, ttl: Optional[int] = None,
+                             stale_ttl: float = 0, beta: float = 1.0, tags=()) -> Any:
+        """Cache.get_or_compute, looking in L2 before computing"""
+        self.loop = asyncio.get_running_loop()
+        if key not in self.l1.cache and key in self.l2:
+            self._promote(key)
+        value = await self.l1.get_or_compute(key, compute, ttl, stale_ttl, beta, tags)
+        self._demote_pending()
+        return value
+    
+    def delete(self, key: str) -> bool:
+        """Delete cache key from both tiers"""
+        in_l1 = self.l1.delete(key)
+        in_l2 = self.l2.delete(key)
+        return in_l1 or in_l2
+    
+    def invalidate_tag(self, tag: str) -> int:
+        """Delete every entry carrying tag from L1 now and from L2 before its next use
+        
+        Returns the L1 count only.
+        """
+        with self.lock:
+            self.stale_tags.add(tag)
+            self._schedule_invalidation()
+            return self.l1.invalidate_tag(tag)
+    
+    def delete_prefix(self, prefix: str) -> int:
+        """Delete every key starting with prefix in both tiers"""
+        return self.l1.delete_prefix(prefix) + self.l2.delete_prefix(prefix)
+    
+    def clear(self) -> int:
+        """Clear L1 now and L2 before its next use (returns the L1 count)"""
+        with self.lock:
+            self.demotions.clear()
+            self.stale_tags.clear()
+            self.clear_pending = True
+            self._schedule_invalidation()
+            return self.l1.clear()
+    
+    def export_state(self) -> List[tuple]:
+        """L1 entries for a checkpoint"""
+        return self.l1.export_state()
+    
+    def import_state(self, entries: List[tuple], now: float):
+        """Restore checkpointed L1 entries, dropping their L2 copies (e.g. from flush())"""
+        self._invalidate_pending()
+        for entry in entries:
+            self.l2.delete(entry[0])
+        self.l1.import_state(entries, now)
+        self._demote_pending()
+    
+    def flush(self) -> int:
+        """Demote every live L1 entry to L2 (e.g. on shutdown)"""
+        self._demote_pending()
+        entries = self.l1.export_state()
+        for key, value, expires, evict_at, tags, delta in entries:
+            self.l2.put(key, value, expires, evict_at, delta, tags)
+        return len(entries)
+
+_shared_l2 = None
+
+def shared_disk_cache() -> Optional[DiskCache]:
+    """The process-wide L2 from config, or None when disabled"""
+    global _shared_l2
+    from config import Config
+    if not Config.CACHE_L2_ENABLED:
+        return None
+    if _shared_l2 is None:
+        _shared_l2 = DiskCache(Config.CACHE_L2_PATH, Config.CACHE_L2_MAX_MB * 1024 * 1024)
+    return _shared_l2
+
+def cache_snapshots() -> List[Dict]:
+    """snapshot() of every live Cache"""
+    return [cache.snapshot() for cache in list(_caches)]
+
+class Memoizer:
+    """Per-instance memo cache invalidated by Database writes
+    
+    Entries are tagged "<collection>:*" (any write matters) or
+    "<collection>:<record key>", and writes invalidate by tag.
+    """
+    
+    def __init__(self, db, ttl: int = 300, max_entries: int = 1000, name: str = "memo",
+                 l2: Optional[DiskCache] = None):
+        self.cache = Cache(default_ttl=ttl, max_entries=max_entries, name=name)
+        # With an L2, evicted results go to disk instead of being recomputed
+        self.store = TieredCache(self.cache, l2) if l2 is not None else self.cache
+        # memo key -> [tags, invalidated] while it is being computed
+        self.loading: Dict[str, list] = {}
+        db.add_change_listener(self.on_change)
+    
+    def on_change(self, collection: str, key: Optional[str], record):
+        """Database change listener"""
+        with self.cache.lock:
+            if collection == "*":
+                self.store.clear()
+                stale = None
+            else:
+                stale = {f"{collection}:*"}
+                if key is not None:
+                    stale.add(f"{collection}:{key}")
+                for tag in stale:
+                    self.store.invalidate_tag(tag)
+            for pending in self.loading.values():
+                if stale is None or stale & pending[0]:
+                    pending[1] = True
+    
+    async def call(self, memo_key: str, tags, compute: Callable, ttl: Optional[int]):
+        """Cached result of compute(), single-flight per memo_key"""
+        def load():
+            with self.cache.lock:
+                self.loading[memo_key] = [set(tags), False]
+            return compute()
+        
+        try:
+            value = await self.store.get_or_compute(memo_key, load, ttl=ttl, beta=0, tags=tags)
+        finally:
+            # A write landed mid-compute: hand this result out once, don't keep it
+            with self.cache.lock:
+                pending = self.loading.pop(memo_key, None)
+                if pending and pending[1]:
+                    self.store.delete(memo_key)
+        return value
+    
+    def flush(self):
+        """Persist live results to the L2, if there is one"""
+        if isinstance(self.store, TieredCache):
+            self.store.flush()
+
+def get_memoizer(manager) -> Memoizer:
+    """The memo cache of a manager instance, created on first use"""
+    memoizer = manager.__dict__.get("_memoizer")
+    if memoizer is None:
+        memoizer = manager.__dict__.setdefault(
+            "_memoizer", Memoizer(manager.db, name=type(manager).__name__, l2=shared_disk_cache())
+        )
+    return memoizer
+
+def memoize(depends_on: Dict[str, Optional[str]], ttl: Optional[int] = None):
+    """Memoize an async manager method by its arguments
+    
+    depends_on maps a Database collection to the argument naming the
+    record the result depends on, or None if any write to the collection
+    matters, e.g. {"users": "user_id", "shop": None}. The manager must
+    have a `db` attribute; its memo cache is created on first call.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+        
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            memoizer = get_memoizer(self)
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            call_args = list(bound.arguments.items())[1:]  # without self
+            memo_key = f"{func.__qualname__}{call_args!r}"
+            tags = [
+                f"{collection}:*" if arg is None else f"{collection}:{bound.arguments[arg]}"
+                for collection, arg in depends_on.items()
+            ]
+            return await memoizer.call(memo_key, tags, lambda: func(self, *args, **kwargs), ttl)
+        
+        return wrapper
+    return decorator
\ No newline at end of file
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import pickle
+import time
+import zlib
+from typing import Any, Dict
+
+from config import Config
+
+class Checkpointer:
+    """Snapshots in-memory runtime state so a restart comes back warm
+    
+    Providers implement export_state() -> picklable data and
+    import_state(data, now), dropping anything that expired while the
+    bot was down. Only files this process wrote are loaded (pickle).
+    
+    Providers registered with clean_only=True (caches derived from the
+    database) are only restored from the checkpoint stop() writes: a
+    periodic one may predate writes made before a crash.
+    """
+    
+    FORMAT_VERSION = 1
+    
+    def __init__(self, path: str = None, interval: int = None):
+        self.path = path or Config.CHECKPOINT_PATH
+        self.interval = interval or Config.CHECKPOINT_INTERVAL
+        self.providers: Dict[str, Any] = {}
+        self.clean_only = set()
+        self.task = None
+    
+    def register(self, name: str, provider, clean_only: bool = False):
+        """Add a state provider under a stable name"""
+        self.providers[name] = provider
+        if clean_only:
+            self.clean_only.add(name)
+    
+    def _serialize(self, clean: bool = False) -> bytes:
+        """Collect every provider's state into one compressed blob"""
+        state = {}
+        for name, provider in self.providers.items():
+            try:
+                state[name] = provider.export_state()
+            except Exception as e:
+                print(f"⚠️ Checkpoint skipped {name}: {e}")
+        payload = {"version": self.FORMAT_VERSION, "saved_at": time.time(), "clean": clean, "state": state}
+        return zlib.compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL), 6)
+    
+    def _write(self, blob: bytes) -> bool:
+        """Atomically replace the checkpoint file"""
+        tmp_path = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            return True
+        except OSError as e:
+            print(f"❌ Error writing checkpoint: {e}")
+            return False
+    
+    def save(self) -> bool:
+        """Write a checkpoint now"""
+        return self._write(self._serialize())
+    
+    def load(self) -> int:
+        """Restore registered providers; returns how many were restored"""
+        if not os.path.exists(self.path):
+            return 0
+        
+        started = time.time()
+        try:
+            with open(self.path, "rb") as f:
+                payload = pickle.loads(zlib.decompress(f.read()))
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable checkpoint: {e}")
+            return 0
+        
+        if payload.get("version") != self.FORMAT_VERSION:
+            print("⚠️ Ignoring checkpoint from another version")
+            return 0
+        
+        now = time.time()
+        restored = 0
+        clean = payload.get("clean", False)
+        for name, data in payload["state"].items():
+            provider = self.providers.get(name)
+            if provider is None or (name in self.clean_only and not clean):
+                continue
+            try:
+                provider.import_state(data, now)
+                restored += 1
+            except Exception as e:
+                print(f"⚠️ Could not restore {name}: {e}")
+        
+        age = now - payload["saved_at"]
+        print(f"♻️ Restored {restored} state providers from a {age:.0f}s old checkpoint "
+              f"in {(time.time() - started) * 1000:.0f} ms")
+        return restored
+    
+    async def run(self):
+        """Periodic checkpoints; serialization on the loop, disk I/O in a thread"""
+        while True:
+            await asyncio.sleep(self.interval)
+            await asyncio.to_thread(self._write, self._serialize())
+    
+    def start(self) -> asyncio.Task:
+        """Start periodic checkpoints on the running loop"""
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return self.task
+    
+    async def stop(self, final_save: bool = True):
+        """Stop periodic checkpoints and write a last one"""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if final_save:
+            await asyncio.to_thread(self._write, self._serialize(clean=True))
\ No newline at end of file
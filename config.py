@@ -35,6 +35,57 @@ class Config:
     # Admin IDs
     ADMINS = [BOT_OWNER_ID]
     
+    # Warm standby replication (see replica.py)
+    REPLICATION_ENABLED = os.getenv("REPLICATION_ENABLED", "false").lower() == "true"
+    REPLICATION_HOST = os.getenv("REPLICATION_HOST", "127.0.0.1")
+    REPLICATION_PORT = int(os.getenv("REPLICATION_PORT", 8765))
+    REPLICA_QUERY_PORT = int(os.getenv("REPLICA_QUERY_PORT", 8766))
+    # Send analytics reads (/stats reports) to the standby's query port
+    REPLICA_READS = os.getenv("REPLICA_READS", "false").lower() == "true"
+    FAILOVER_TIMEOUT = int(os.getenv("FAILOVER_TIMEOUT", 10))  # seconds
+    
+    # Runtime state checkpoints (see checkpoint.py)
+    CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "data/runtime.ckpt")
+    CHECKPOINT_INTERVAL = int(os.getenv("CHECKPOINT_INTERVAL", 60))  # seconds
+    
+    # Disk-backed second cache tier for memoized results (see cache.DiskCache)
+    CACHE_L2_ENABLED = os.getenv("CACHE_L2_ENABLED", "false").lower() == "true"
+    CACHE_L2_PATH = os.getenv("CACHE_L2_PATH", "data/cache_l2.sqlite")
+    CACHE_L2_MAX_MB = int(os.getenv("CACHE_L2_MAX_MB", 20))
+    
+    # Extra banned terms for the chat filter, one per line (see wordfilter.py)
+    BAD_WORDS_FILE = os.getenv("BAD_WORDS_FILE", "data/bad_words.txt")
+    
+    # Near-duplicate spam (see neardup.py): window in seconds, estimated
+    # similarity that makes two messages near-copies, near-copies allowed per
+    # user within the repeat window, distinct users sending near-copies that
+    # make a campaign, and the shortest text that can be part of one
+    SPAM_WINDOW = float(os.getenv("SPAM_WINDOW", 300))
+    SPAM_SIMILARITY = float(os.getenv("SPAM_SIMILARITY", 0.6))
+    SPAM_REPEAT_LIMIT = int(os.getenv("SPAM_REPEAT_LIMIT", 3))
+    SPAM_REPEAT_WINDOW = float(os.getenv("SPAM_REPEAT_WINDOW", 60))
+    SPAM_CAMPAIGN_USERS = int(os.getenv("SPAM_CAMPAIGN_USERS", 5))
+    SPAM_MIN_CHARS = int(os.getenv("SPAM_MIN_CHARS", 40))
+    
+    # Rate limit state: "memory" (per process) or "sqlite" (shared by every process)
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+    RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "data/rate_limits.sqlite")
+    
+    # Handler latency worth one unit of a user's "compute" rate limit
+    COST_UNIT_MS = float(os.getenv("COST_UNIT_MS", 50))
+    
+    # Load shedding (see load_shedder.py): thresholds for levels 1, 2, 3 and
+    # the games/chat limit multiplier at levels 0-3
+    SHED_LAG_MS = [float(v) for v in os.getenv("SHED_LAG_MS", "100,250,500").split(",")]
+    SHED_QUEUE_DEPTH = [int(v) for v in os.getenv("SHED_QUEUE_DEPTH", "20,100,400").split(",")]
+    SHED_SCALES = [float(v) for v in os.getenv("SHED_SCALES", "1,0.5,0.25,0.1").split(",")]
+    
+    # Outbound Telegram API pacing (see throttle.py)
+    OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", 30))  # messages/second
+    OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", 1))  # per private chat/second
+    OUTBOUND_GROUP_PER_MINUTE = float(os.getenv("OUTBOUND_GROUP_PER_MINUTE", 20))
+    OUTBOUND_BULK_SHARE = float(os.getenv("OUTBOUND_BULK_SHARE", 0.7))  # of the global rate
+    
     @staticmethod
     def validate():
         """Validate all required credentials"""
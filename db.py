@@ -1,32 +1,208 @@
 import json
 import os
-from datetime import datetime
-from typing import Dict, Any, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Callable
 import threading
+import time
+from query import QueryEngine, make_index
+
+try:
+    import fcntl
+except ImportError:  # Windows: no data directory lock
+    fcntl = None
+
+class RequestScope:
+    """Identity map for one update
+    
+    Each user is read from the database once per scope; get_user() hands
+    out copies of that record, so local edits never leak into later reads.
+    update_user() changes are queued and written once when the handler
+    finishes, and dropped if it raises. Conditional writes (modify_user,
+    compare_and_update, buy/use item) flush the queue and go straight to
+    the database.
+    """
+    
+    def __init__(self, db: "Database"):
+        self.db = db
+        # user_id_str -> record as of the last read (None = no such user)
+        self.users: Dict[str, Optional[Dict]] = {}
+        # user_id_str -> changes not written yet
+        self.dirty: Dict[str, Dict] = {}
+    
+    def get(self, user_id_str: str) -> Optional[Dict]:
+        """Copy of the user's record, loaded on first use"""
+        if user_id_str not in self.users:
+            self.users[user_id_str] = self.db._read_user(user_id_str)
+        user = self.users[user_id_str]
+        return self.db._snapshot(user) if user is not None else None
+    
+    def stage(self, user_id_str: str, updates: Dict) -> bool:
+        """Queue updates and apply them to the scope's record"""
+        if user_id_str not in self.users:
+            self.get(user_id_str)
+        user = self.users[user_id_str]
+        if user is None:
+            return False
+        user.update(updates)
+        self.dirty.setdefault(user_id_str, {}).update(updates)
+        return True
+    
+    def flush_user(self, user_id_str: str):
+        """Write one user's queued changes (caller holds the db lock)"""
+        updates = self.dirty.pop(user_id_str, None)
+        if not updates:
+            return
+        user = self.db.users.get(user_id_str)
+        if user is not None:
+            self.db._apply_user_update(user_id_str, user, updates)
+        self.reload(user_id_str)
+    
+    def reload(self, user_id_str: str):
+        """Re-read a user after a direct write"""
+        self.users[user_id_str] = self.db._read_user(user_id_str)
+    
+    def flush(self):
+        """Write all queued changes, one update per user"""
+        with self.db.lock:
+            for user_id_str in list(self.dirty):
+                self.flush_user(user_id_str)
+    
+    def discard(self):
+        """Drop queued changes (the handler failed)"""
+        self.dirty.clear()
+
+# Active RequestScope of the current update, if any
+_request_scope: ContextVar[Optional[RequestScope]] = ContextVar("request_scope", default=None)
+
+class WriteConflict:
+    """modify_user() result when every retry lost to another writer
+    
+    Falsy like None, so `if not user` checks still see a failed write;
+    compare with `is WRITE_CONFLICT` to report it separately.
+    """
+    
+    def __bool__(self) -> bool:
+        return False
+    
+    def __repr__(self) -> str:
+        return "WRITE_CONFLICT"
+
+WRITE_CONFLICT = WriteConflict()
+WRITE_CONFLICT_MESSAGE = "⏳ একই সময়ে অনেক পরিবর্তন হচ্ছে, একটু পরে আবার চেষ্টা করুন!"
 
 class Database:
     """Simple JSON-based database for Termux"""
     
-    def __init__(self):
+    # Purchases kept per user in the cold record (oldest dropped first)
+    PURCHASE_LOG_LIMIT = 50
+    
+    # Negative cache for user ids that have no record (never ran /start)
+    NEGATIVE_TTL = 30  # seconds
+    NEGATIVE_MAX = 10000
+    
+    # Cold records kept in memory, least recently used dropped first
+    COLD_CACHE_MAX = 500
+    
+    # Rarely read fields, stored per user under data/cold/ and loaded on
+    # first access instead of living in users.json
+    COLD_FIELDS = frozenset({
+        "referrals", "purchases",
+        "warning_history", "last_warning",
+        "warnings_cleared_by", "warnings_cleared_at",
+        "ban_history", "ban_reason", "banned_by", "ban_start", "ban_end",
+        "ban_duration", "unbanned_by", "unban_reason", "unbanned_at",
+        "mute_reason", "muted_by", "mute_start", "mute_end", "mute_duration"
+    })
+    
+    # (collection, field, kind, bucket_fn) indexes built at startup
+    DEFAULT_INDEXES = [
+        ("users", "is_banned", "hash", None),
+        ("users", "warnings", "sorted", None),
+        ("users", "has_warning_history", "hash", None),
+        ("users", "coins", "sorted", None),
+        ("users", "last_seen", "bucket", lambda v: v[:10]),  # per day
+        ("payments", "user_id", "hash", None),
+        ("payments", "status", "hash", None)
+    ]
+    
+    def __init__(self, initial_data: Optional[Dict] = None, lock_wait: float = 0):
         self.data_dir = "data"
         self.backup_dir = "backups"
+        self.cold_dir = os.path.join(self.data_dir, "cold")
         
         # Create directories if not exist
         os.makedirs(self.data_dir, exist_ok=True)
         os.makedirs(self.backup_dir, exist_ok=True)
+        os.makedirs(self.cold_dir, exist_ok=True)
+        
+        # One writer per data directory (held until the process exits)
+        self._dir_lock = self._lock_data_dir(lock_wait)
         
         # Initialize data
-        self.users = self._load_json("users.json", {})
-        self.payments = self._load_json("payments.json", {})
-        self.shop = self._load_json("shop.json", self._default_shop())
-        self.games = self._load_json("games.json", {})
-        self.groups = self._load_json("groups.json", {})
+        if initial_data is not None:
+            # Warm start from a standby replica's in-memory copy
+            self.users = initial_data.get("users", {})
+            self.payments = initial_data.get("payments", {})
+            self.shop = initial_data.get("shop") or self._default_shop()
+            self.games = initial_data.get("games", {})
+            self.groups = initial_data.get("groups", {})
+        else:
+            self.users = self._load_json("users.json", {})
+            self.payments = self._load_json("payments.json", {})
+            self.shop = self._load_json("shop.json", self._default_shop())
+            self.games = self._load_json("games.json", {})
+            self.groups = self._load_json("groups.json", {})
+        
+        # Cold user records, filled lazily by _load_cold (LRU order)
+        self._cold = {}
+        
+        # "user:<id>" -> monotonic expiry; read without the lock
+        self._missing = {}
+        
+        # Callbacks told about every write: callback(collection, key, record)
+        self._change_listeners = []
+        
+        # Lock for thread safety (re-entrant: buy_item calls update_user)
+        self.lock = threading.RLock()
         
-        # Lock for thread safety
-        self.lock = threading.Lock()
+        # item_id -> item lookup for the shop catalog
+        self._shop_index = {}
+        self._index_shop()
+        
+        # Upgrade records written by older versions
+        self._migrate_inventories()
+        self._split_cold_fields()
+        self._flag_warning_history()
+        
+        # Secondary indexes for find()/count()
+        self.query = QueryEngine()
+        self._create_default_indexes()
         
         print("✅ Database initialized (JSON Storage)")
     
+    def _lock_data_dir(self, wait: float):
+        """Take an exclusive flock on data/.lock, waiting up to wait seconds
+        
+        Fences writers: a second bot fails to start, and a promoting standby
+        only takes over once the old primary has exited (the kernel drops
+        the lock with the process).
+        """
+        if fcntl is None:
+            return None
+        lock_file = open(os.path.join(self.data_dir, ".lock"), "a")
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return lock_file
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    lock_file.close()
+                    raise RuntimeError(f"{self.data_dir}/ is locked by another bot process")
+                time.sleep(0.2)
+    
     def _load_json(self, filename: str, default=None):
         """Load JSON file"""
         path = os.path.join(self.data_dir, filename)
@@ -49,6 +225,38 @@ class Database:
             print(f"❌ Error saving {filename}: {e}")
             return False
     
+    def save_all(self):
+        """Write every collection to disk"""
+        with self.lock:
+            self._save_json("users.json", self.users)
+            self._save_json("payments.json", self.payments)
+            self._save_json("shop.json", self.shop)
+            self._save_json("games.json", self.games)
+            self._save_json("groups.json", self.groups)
+    
+    # Change stream
+    def add_change_listener(self, callback: Callable[[str, Optional[str], Any], None]):
+        """Register a write callback
+        
+        Called under the database lock with the live record; callbacks must
+        copy or serialize it before returning. Collection "*" means the
+        collections were replaced wholesale (e.g. a backup restore).
+        """
+        self._change_listeners.append(callback)
+    
+    def remove_change_listener(self, callback):
+        """Unregister a write callback"""
+        if callback in self._change_listeners:
+            self._change_listeners.remove(callback)
+    
+    def _emit_change(self, collection: str, key: Optional[str], record: Any):
+        """Notify listeners of a write"""
+        for callback in self._change_listeners:
+            try:
+                callback(collection, key, record)
+            except Exception as e:
+                print(f"⚠️ Change listener failed: {e}")
+    
     def _default_shop(self):
         """Default shop items"""
         return {
@@ -85,16 +293,102 @@ class Database:
         }
     
     # User Management
+    def _snapshot(self, user: Dict) -> Dict:
+        """Copy a user record so callers never hold the live dict"""
+        return {
+            key: value.copy() if isinstance(value, (dict, list)) else value
+            for key, value in user.items()
+        }
+    
     def get_user(self, user_id: int) -> Optional[Dict]:
-        """Get user data"""
+        """Get a snapshot of user data (carries its "version")
+        
+        Inside request_scope() the record is read once per update and each
+        call returns a copy of it.
+        """
+        scope = self._active_scope()
+        if scope is not None:
+            return scope.get(str(user_id))
+        return self._read_user(str(user_id))
+    
+    def _read_user(self, user_id_str: str) -> Optional[Dict]:
+        """Fresh snapshot of a user record"""
+        # Unknown users are answered without waiting on the lock, which
+        # writers hold while dumping users.json
+        if self._known_missing(f"user:{user_id_str}"):
+            return None
         with self.lock:
-            return self.users.get(str(user_id))
+            user = self.users.get(user_id_str)
+            if not user:
+                self._remember_missing(f"user:{user_id_str}")
+                return None
+            return self._snapshot(user)
+    
+    # Request scope
+    @contextmanager
+    def request_scope(self):
+        """Load each user once per update and write its changes once at the end
+        
+        If the block raises, queued update_user() changes are dropped.
+        """
+        scope = _request_scope.get()
+        if scope is not None and scope.db is self:
+            yield scope  # nested: join the outer scope
+            return
+        scope = RequestScope(self)
+        token = _request_scope.set(scope)
+        try:
+            yield scope
+        except BaseException:
+            scope.discard()
+            raise
+        finally:
+            _request_scope.reset(token)
+            scope.flush()
+    
+    def _active_scope(self) -> Optional[RequestScope]:
+        """The current update's scope, if it belongs to this database"""
+        scope = _request_scope.get()
+        return scope if scope is not None and scope.db is self else None
+    
+    def _flush_scope(self):
+        """Write the current update's queued changes so queries see them"""
+        scope = self._active_scope()
+        if scope is not None and scope.dirty:
+            scope.flush()
+    
+    @contextmanager
+    def _write_through(self, user_id: int):
+        """Flush queued changes before a read-modify-write of the live record
+        and re-read the scope's record after it (caller holds the lock)"""
+        scope = self._active_scope()
+        if scope is not None:
+            scope.flush_user(str(user_id))
+        try:
+            yield
+        finally:
+            if scope is not None and str(user_id) in scope.users:
+                scope.reload(str(user_id))
+    
+    def _known_missing(self, key: str) -> bool:
+        """Lock-free negative cache check"""
+        expires = self._missing.get(key)
+        return expires is not None and expires > time.monotonic()
+    
+    def _remember_missing(self, key: str):
+        """Record a miss (caller holds the lock)"""
+        self._missing.pop(key, None)  # re-insert at the end (newest)
+        self._missing[key] = time.monotonic() + self.NEGATIVE_TTL
+        if len(self._missing) > self.NEGATIVE_MAX:
+            del self._missing[next(iter(self._missing))]
     
     def create_user(self, user_id: int, user_info: Dict) -> Dict:
         """Create new user"""
         with self.lock:
+            self._missing.pop(f"user:{user_id}", None)
             user_data = {
                 "id": user_id,
+                "version": 1,
                 "username": user_info.get("username", ""),
                 "first_name": user_info.get("first_name", ""),
                 "balance": 100.0,  # Welcome bonus
@@ -104,11 +398,13 @@ class Database:
                 "daily_streak": 0,
                 "last_daily": None,
                 "warnings": 0,
-                "inventory": [],
+                "has_warning_history": False,
+                "inventory": {},
                 "joined": datetime.now().isoformat(),
                 "last_seen": datetime.now().isoformat(),
                 "total_messages": 0,
-                "referrals": [],
+                "is_banned": False,
+                "is_muted": False,
                 "settings": {
                     "language": "bn",
                     "notifications": True
@@ -116,19 +412,208 @@ class Database:
             }
             
             self.users[str(user_id)] = user_data
+            self.query.on_write("users", str(user_id), None, user_data)
             self._save_json("users.json", self.users)
-            return user_data
+            self._emit_change("users", str(user_id), user_data)
+            scope = self._active_scope()
+            if scope is not None:
+                scope.reload(str(user_id))
+            return self._snapshot(user_data)
     
     def update_user(self, user_id: int, updates: Dict) -> bool:
-        """Update user data"""
+        """Update user data (last write wins)
+        
+        Inside request_scope() the write is deferred to the end of the
+        update; cold fields are still written immediately.
+        """
+        scope = self._active_scope()
+        if scope is not None:
+            cold = {k: v for k, v in updates.items() if k in self.COLD_FIELDS}
+            if cold and not self.update_user_cold(user_id, cold):
+                return False
+            hot = {k: v for k, v in updates.items() if k not in self.COLD_FIELDS}
+            return scope.stage(str(user_id), {**hot, **self._cold_flags(cold)})
+        return self._write_user(user_id, updates)
+    
+    def _write_user(self, user_id: int, updates: Dict) -> bool:
+        """Write user updates now"""
+        with self.lock:
+            user = self.users.get(str(user_id))
+            if user is None:
+                return False
+            return self._apply_user_update(user_id, user, updates)
+    
+    def get_user_cold(self, user_id: int) -> Dict:
+        """Get a copy of the user's cold fields (history, ban/mute details)"""
+        if self._known_missing(f"user:{user_id}"):
+            return {}
+        with self.lock:
+            if str(user_id) not in self.users:
+                # Don't touch the disk or pin an empty record for strangers
+                self._remember_missing(f"user:{user_id}")
+                return {}
+            return self._snapshot(self._load_cold(str(user_id)))
+    
+    def update_user_cold(self, user_id: int, updates: Dict) -> bool:
+        """Update cold fields without touching users.json"""
         with self.lock:
             user_id_str = str(user_id)
-            if user_id_str in self.users:
-                self.users[user_id_str].update(updates)
-                self.users[user_id_str]["last_seen"] = datetime.now().isoformat()
-                self._save_json("users.json", self.users)
+            if user_id_str not in self.users:
+                return False
+            record = self._load_cold(user_id_str)
+            record.update(updates)
+            self._emit_change("cold", user_id_str, record)
+            return self._save_cold(user_id_str, record)
+    
+    def compare_and_update(self, user_id: int, expected_version: int, changes: Dict) -> bool:
+        """Update user only if nobody wrote since expected_version was read
+        
+        Inside request_scope() queued changes for the user are written
+        first, so a version read before them no longer matches.
+        """
+        scope = self._active_scope()
+        with self.lock:
+            if scope is not None:
+                scope.flush_user(str(user_id))
+            user = self.users.get(str(user_id))
+            if user is None or user.get("version", 0) != expected_version:
+                return False
+            self._apply_user_update(user_id, user, changes)
+            if scope is not None:
+                scope.reload(str(user_id))
+            return True
+    
+    def modify_user(self, user_id: int, mutator: Callable[[Dict], Optional[Dict]],
+                    max_retries: int = 5) -> Optional[Dict]:
+        """Read-modify-write a user without lost updates
+        
+        mutator gets a fresh snapshot and returns the changes to apply, or
+        None to abort. It is re-run on a newer snapshot if another writer
+        got in first. Returns the updated snapshot, None if the user does
+        not exist or the mutator aborted, or WRITE_CONFLICT if every retry
+        conflicted.
+        Inside request_scope() this writes through, like compare_and_update.
+        """
+        scope = self._active_scope()
+        if scope is not None:
+            with self.lock:
+                scope.flush_user(str(user_id))
+        
+        for _ in range(max_retries):
+            user = self._read_user(str(user_id))
+            if not user:
+                return None
+            
+            changes = mutator(user)
+            if changes is None:
+                return None
+            
+            version = user.get("version", 0)
+            if self.compare_and_update(user_id, version, changes):
+                user.update(changes)
+                user["version"] = version + 1
+                return user
+        
+        print(f"⚠️ modify_user gave up on {user_id} after {max_retries} conflicts")
+        return WRITE_CONFLICT
+    
+    def _apply_user_update(self, user_id: int, user: Dict, updates: Dict) -> bool:
+        """Apply updates to the live record and bump its version"""
+        cold = {k: v for k, v in updates.items() if k in self.COLD_FIELDS}
+        if cold:
+            self.update_user_cold(user_id, cold)
+            updates = {k: v for k, v in updates.items() if k not in self.COLD_FIELDS}
+            updates.update(self._cold_flags(cold))
+            if not updates:
                 return True
-            return False
+        
+        old = dict(user)
+        user.update(updates)
+        user["version"] = user.get("version", 0) + 1
+        user["last_seen"] = datetime.now().isoformat()
+        self.query.on_write("users", str(user_id), old, user)
+        self._save_json("users.json", self.users)
+        self._emit_change("users", str(user_id), user)
+        return True
+    
+    # Cold storage
+    @staticmethod
+    def _cold_flags(cold: Dict) -> Dict:
+        """Hot fields that let find() see cold data (users with warning history)"""
+        if "warning_history" in cold:
+            return {"has_warning_history": bool(cold["warning_history"])}
+        return {}
+    
+    def _load_cold(self, user_id_str: str) -> Dict:
+        """Return the cached cold record, reading it from disk on a miss
+        
+        Only COLD_CACHE_MAX records stay cached, so callers pass the record
+        they changed to _save_cold rather than looking it up again.
+        """
+        record = self._cold.pop(user_id_str, None)
+        if record is None:
+            record = self._read_cold(user_id_str)
+        self._cold[user_id_str] = record  # most recently used last
+        if len(self._cold) > self.COLD_CACHE_MAX:
+            del self._cold[next(iter(self._cold))]
+        return record
+    
+    def _read_cold(self, user_id_str: str) -> Dict:
+        """Read a cold record from disk without caching it"""
+        return self._load_json(os.path.join("cold", f"{user_id_str}.json"), {})
+    
+    def _save_cold(self, user_id_str: str, record: Dict) -> bool:
+        """Persist one user's cold record"""
+        return self._save_json(os.path.join("cold", f"{user_id_str}.json"), record)
+    
+    def _rewrite_cold(self, user_id_str: str, change: Callable[[Dict], None]):
+        """Change and persist a cold record without caching it (migrations)"""
+        record = self._cold.get(user_id_str)
+        if record is None:
+            record = self._read_cold(user_id_str)
+        change(record)
+        self._save_cold(user_id_str, record)
+    
+    def _split_cold_fields(self):
+        """Move cold fields out of users.json into per-user cold records
+        
+        Records are rewritten one at a time and not kept in memory.
+        """
+        moved = 0
+        for user_id_str, user in self.users.items():
+            cold = {k: user.pop(k) for k in list(user) if k in self.COLD_FIELDS}
+            if cold:
+                self._rewrite_cold(user_id_str, lambda record: record.update(cold))
+                user.update(self._cold_flags(cold))
+                moved += 1
+        
+        # Purchase logs used to live in their own file
+        purchases_path = os.path.join(self.data_dir, "purchases.json")
+        for user_id_str, log in self._load_json("purchases.json", {}).items():
+            def merge_log(record: Dict):
+                record["purchases"] = (log + record.get("purchases", []))[-self.PURCHASE_LOG_LIMIT:]
+            self._rewrite_cold(user_id_str, merge_log)
+        if os.path.exists(purchases_path):
+            os.remove(purchases_path)
+        
+        if moved:
+            self._save_json("users.json", self.users)
+            print(f"🔄 Moved cold fields of {moved} users to {self.cold_dir}")
+    
+    def _flag_warning_history(self):
+        """Set has_warning_history on users saved before it existed"""
+        flagged = 0
+        for user_id_str, user in self.users.items():
+            if "has_warning_history" in user:
+                continue
+            path = os.path.join(self.cold_dir, f"{user_id_str}.json")
+            history = self._read_cold(user_id_str).get("warning_history") if os.path.exists(path) else None
+            user["has_warning_history"] = bool(history)
+            flagged += 1
+        
+        if flagged:
+            self._save_json("users.json", self.users)
+            print(f"🔄 Flagged warning history of {flagged} users")
     
     # Payments
     def add_payment(self, payment_data: Dict) -> str:
@@ -139,46 +624,199 @@ class Database:
             payment_data["created_at"] = datetime.now().isoformat()
             
             self.payments[payment_id] = payment_data
+            self.query.on_write("payments", payment_id, None, payment_data)
             self._save_json("payments.json", self.payments)
+            self._emit_change("payments", payment_id, payment_data)
             return payment_id
     
+    def update_payment(self, payment_id: str, updates: Dict) -> bool:
+        """Update payment record"""
+        with self.lock:
+            payment = self.payments.get(payment_id)
+            if payment is None:
+                return False
+            old = dict(payment)
+            payment.update(updates)
+            self.query.on_write("payments", payment_id, old, payment)
+            self._save_json("payments.json", self.payments)
+            self._emit_change("payments", payment_id, payment)
+            return True
+    
     def get_payments(self, user_id: int) -> list:
         """Get user's payments"""
-        user_payments = []
-        for payment in self.payments.values():
-            if payment.get("user_id") == user_id:
-                user_payments.append(payment)
-        return sorted(user_payments, key=lambda x: x.get("created_at", ""), reverse=True)
+        return self.find("payments", where={"user_id": user_id}, order_by="-created_at")
+    
+    # Queries
+    def _create_default_indexes(self):
+        """Indexes for the filters used across managers"""
+        for collection, field, kind, bucket_fn in self.DEFAULT_INDEXES:
+            self.create_index(collection, field, kind, bucket_fn)
+    
+    def _collection(self, collection: str) -> Dict[str, Dict]:
+        """Records of a queryable collection"""
+        collections = {
+            "users": self.users,
+            "payments": self.payments,
+            "games": self.games,
+            "groups": self.groups
+        }
+        if collection not in collections:
+            raise ValueError(f"Unknown collection: {collection}")
+        return collections[collection]
+    
+    def create_index(self, collection: str, field: str, kind: str = "hash",
+                     bucket_fn: Optional[Callable] = None) -> str:
+        """Add a secondary index (hash, sorted or bucket) on a field"""
+        index = make_index(field, kind, bucket_fn)
+        with self.lock:
+            return self.query.add_index(collection, index, self._collection(collection))
+    
+    def rebuild_indexes(self):
+        """Rebuild all indexes (after collections were replaced wholesale)"""
+        with self.lock:
+            for collection in self.query.indexes:
+                self.query.rebuild(collection, self._collection(collection))
+            # Collections may have been replaced wholesale (backup restore)
+            self._missing.clear()
+            self._emit_change("*", None, None)
+    
+    def find(self, collection: str, where: Optional[Dict] = None,
+             order_by: Optional[str] = None, limit: Optional[int] = None) -> list:
+        """Query a collection
+        
+        where maps field -> value, or field -> (op, value) with op one of
+        ==, !=, <, <=, >, >=, in, startswith, endswith. order_by is a field
+        name, prefixed with "-" for descending. Returns record copies.
+        """
+        with self.lock:
+            self._flush_scope()
+            records, _ = self.query.execute(collection, self._collection(collection),
+                                            where, order_by, limit)
+            return [self._snapshot(record) for record in records]
+    
+    def count(self, collection: str, where: Optional[Dict] = None) -> int:
+        """Count matching records"""
+        with self.lock:
+            self._flush_scope()
+            records, _ = self.query.execute(collection, self._collection(collection), where)
+            return len(records)
+    
+    def explain(self, collection: str, where: Optional[Dict] = None,
+                order_by: Optional[str] = None, limit: Optional[int] = None) -> Dict:
+        """Run a query and report the index used and records examined"""
+        with self.lock:
+            self._flush_scope()
+            _, plan = self.query.execute(collection, self._collection(collection),
+                                         where, order_by, limit)
+            return plan
     
     # Shop
+    def _index_shop(self):
+        """Rebuild item_id -> item lookup"""
+        self._shop_index = {item["id"]: item for item in self.shop.get("items", [])}
+    
+    def _migrate_inventories(self):
+        """Convert list inventories to item_id -> count maps"""
+        migrated = 0
+        for user_id_str, user in self.users.items():
+            inventory = user.get("inventory")
+            if not isinstance(inventory, list):
+                continue
+            
+            counts = {}
+            
+            def log_purchases(record: Dict):
+                log = record.setdefault("purchases", [])
+                for entry in inventory:
+                    item_id = entry.get("item_id")
+                    if item_id:
+                        counts[item_id] = counts.get(item_id, 0) + 1
+                        log.append(entry)
+                del log[:-self.PURCHASE_LOG_LIMIT]
+            
+            self._rewrite_cold(user_id_str, log_purchases)
+            user["inventory"] = counts
+            migrated += 1
+        
+        if migrated:
+            self._save_json("users.json", self.users)
+            print(f"🔄 Migrated {migrated} inventories to item counts")
+    
     def get_shop_items(self) -> list:
         """Get all shop items"""
         return self.shop.get("items", [])
     
+    def get_shop_item(self, item_id: str) -> Optional[Dict]:
+        """Get shop item by ID"""
+        return self._shop_index.get(item_id)
+    
+    def update_shop_items(self, items: list) -> int:
+        """Replace the catalog; returns the new catalog version"""
+        with self.lock:
+            self.shop["items"] = items
+            self.shop["version"] = self.shop.get("version", 0) + 1
+            self._index_shop()
+            self._save_json("shop.json", self.shop)
+            self._emit_change("shop", None, self.shop)
+            return self.shop["version"]
+    
     def buy_item(self, user_id: int, item_id: str) -> bool:
         """User buys an item"""
-        with self.lock:
-            user = self.get_user(user_id)
+        with self.lock, self._write_through(user_id):
+            user = self.users.get(str(user_id))
             if not user:
                 return False
             
-            item = next((i for i in self.shop["items"] if i["id"] == item_id), None)
+            item = self._shop_index.get(item_id)
             if not item:
                 return False
             
             if user["coins"] >= item["price"]:
-                user["coins"] -= item["price"]
-                user["inventory"].append({
+                inventory = user.setdefault("inventory", {})
+                inventory[item_id] = inventory.get(item_id, 0) + 1
+                
+                cold = self._load_cold(str(user_id))
+                log = cold.setdefault("purchases", [])
+                log.append({
                     "item_id": item_id,
                     "name": item["name"],
                     "purchased_at": datetime.now().isoformat()
                 })
+                del log[:-self.PURCHASE_LOG_LIMIT]
                 
-                self.update_user(user_id, user)
+                self._write_user(user_id, {
+                    "coins": user["coins"] - item["price"],
+                    "inventory": inventory
+                })
+                self._save_cold(str(user_id), cold)
                 return True
             
             return False
     
+    def use_item(self, user_id: int, item_id: str) -> bool:
+        """Remove one item from user's inventory"""
+        with self.lock, self._write_through(user_id):
+            user = self.users.get(str(user_id))
+            if not user:
+                return False
+            
+            inventory = user.get("inventory", {})
+            count = inventory.get(item_id, 0)
+            if count <= 0:
+                return False
+            
+            if count == 1:
+                del inventory[item_id]
+            else:
+                inventory[item_id] = count - 1
+            
+            self._write_user(user_id, {"inventory": inventory})
+            return True
+    
+    def get_purchase_log(self, user_id: int) -> list:
+        """Get user's recent purchases (newest last)"""
+        return self.get_user_cold(user_id).get("purchases", [])
+    
     # Games
     def update_game_stats(self, user_id: int, game_type: str, won: bool, amount: int = 0):
         """Update game statistics"""
@@ -204,6 +842,7 @@ class Database:
                 stats["total_lost"] += amount
             
             self._save_json("games.json", self.games)
+            self._emit_change("games", game_key, stats)
     
     # Backup
     def create_backup(self):
@@ -232,8 +871,9 @@ class Database:
         """Get bot statistics"""
         with self.lock:
             total_users = len(self.users)
-            active_users = sum(1 for u in self.users.values() 
-                             if (datetime.now() - datetime.fromisoformat(u.get("last_seen", "2020-01-01"))).days < 7)
+            active_users = self.count("users", where={
+                "last_seen": (">", (datetime.now() - timedelta(days=7)).isoformat())
+            })
             
             total_coins = sum(u.get("coins", 0) for u in self.users.values())
             total_payments = len(self.payments)
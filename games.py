@@ -1,7 +1,7 @@
 import random
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 from datetime import datetime
-from db import Database
+from db import Database, WRITE_CONFLICT, WRITE_CONFLICT_MESSAGE
 from utils import Utils
 
 class GamesManager:
@@ -26,19 +26,24 @@ class GamesManager:
         # Determine winner
         if user_roll > bot_roll:
             win_amount = bet * 2
-            user["coins"] += win_amount
+            delta = win_amount
             result = "WIN"
             message = f"🎲 আপনি পেলেন: {user_roll}\n🤖 বট পেলো: {bot_roll}\n🎉 আপনি জিতেছেন! +{win_amount} কয়েন"
         elif user_roll < bot_roll:
-            user["coins"] -= bet
+            delta = -bet
             result = "LOSE"
             message = f"🎲 আপনি পেলেন: {user_roll}\n🤖 বট পেলো: {bot_roll}\n😢 আপনি হারলেন! -{bet} কয়েন"
         else:
+            delta = 0
             result = "DRAW"
             message = f"🎲 আপনি পেলেন: {user_roll}\n🤖 বট পেলো: {bot_roll}\n🤝 ড্র হয়েছে!"
         
-        # Update user
-        self.db.update_user(user_id, {"coins": user["coins"]})
+        # Update user (re-checks the bet against the latest balance)
+        user = self.db.modify_user(user_id, self._settle_bet(bet, delta))
+        if user is WRITE_CONFLICT:
+            return {"success": False, "message": WRITE_CONFLICT_MESSAGE}
+        if not user:
+            return {"success": False, "message": "পর্যাপ্ত কয়েন নেই!"}
         
         # Record game stats
         self.db.update_game_stats(user_id, "dice", result == "WIN", bet if result == "WIN" else -bet)
@@ -83,14 +88,18 @@ class GamesManager:
         # Calculate winnings
         if result != "LOSE":
             win_amount = bet * multiplier
-            user["coins"] += win_amount
+            delta = win_amount
             message = f"{slots[0]} | {slots[1]} | {slots[2]}\n🎉 {result}! +{win_amount} কয়েন"
         else:
-            user["coins"] -= bet
+            delta = -bet
             message = f"{slots[0]} | {slots[1]} | {slots[2]}\n😢 হারলেন! -{bet} কয়েন"
         
-        # Update user
-        self.db.update_user(user_id, {"coins": user["coins"]})
+        # Update user (re-checks the bet against the latest balance)
+        user = self.db.modify_user(user_id, self._settle_bet(bet, delta))
+        if user is WRITE_CONFLICT:
+            return {"success": False, "message": WRITE_CONFLICT_MESSAGE}
+        if not user:
+            return {"success": False, "message": "পর্যাপ্ত কয়েন নেই!"}
         
         # Record game stats
         self.db.update_game_stats(user_id, "slot", result != "LOSE", 
@@ -163,8 +172,9 @@ class GamesManager:
         
         if correct:
             reward = 50
-            user["coins"] += reward
-            self.db.update_user(user_id, {"coins": user["coins"]})
+            user = self.db.modify_user(user_id, lambda u: {"coins": u["coins"] + reward})
+            if user is WRITE_CONFLICT:
+                return {"success": False, "message": WRITE_CONFLICT_MESSAGE}
             message = f"✅ সঠিক উত্তর! 🎉 +{reward} কয়েন"
         else:
             reward = 0
@@ -180,45 +190,54 @@ class GamesManager:
             "coins": user["coins"] if user else 0
         }
     
-    async def daily_bonus(self, user_id: int) -> Dict:
+    async def daily_bonus(self, user_id: int, max_retries: int = 5) -> Dict:
         """Daily bonus claim"""
-        user = self.db.get_user(user_id)
-        if not user:
-            return {"success": False, "message": "ইউজার খুঁজে পাওয়া যায়নি!"}
-        
-        last_daily = user.get("last_daily")
-        today = datetime.now().strftime("%Y-%m-%d")
-        
-        if last_daily == today:
-            return {"success": False, "message": "আজকের বোনাস ইতিমধ্যে নিয়েছেন!"}
-        
-        # Calculate streak bonus
-        streak = user.get("daily_streak", 0)
-        if last_daily and (datetime.now() - datetime.fromisoformat(last_daily)).days == 1:
-            streak += 1
-        else:
-            streak = 1
-        
-        # Calculate bonus
-        base_bonus = 50
-        streak_bonus = min(streak * 10, 100)  # Max 100 extra
-        total_bonus = base_bonus + streak_bonus
-        
-        # Update user
-        user["coins"] += total_bonus
-        user["daily_streak"] = streak
-        user["last_daily"] = today
-        
-        self.db.update_user(user_id, {
-            "coins": user["coins"],
-            "daily_streak": streak,
-            "last_daily": today
-        })
-        
-        return {
-            "success": True,
-            "bonus": total_bonus,
-            "streak": streak,
-            "message": f"🎁 ডেইলি বোনাস! +{total_bonus} কয়েন\n🔥 {streak} দিন স্ট্রীক!",
-            "coins": user["coins"]
-        }
\ No newline at end of file
+        for _ in range(max_retries):
+            user = self.db.get_user(user_id)
+            if not user:
+                return {"success": False, "message": "ইউজার খুঁজে পাওয়া যায়নি!"}
+            
+            last_daily = user.get("last_daily")
+            today = datetime.now().strftime("%Y-%m-%d")
+            
+            if last_daily == today:
+                return {"success": False, "message": "আজকের বোনাস ইতিমধ্যে নিয়েছেন!"}
+            
+            # Calculate streak bonus
+            streak = user.get("daily_streak", 0)
+            if last_daily and (datetime.now() - datetime.fromisoformat(last_daily)).days == 1:
+                streak += 1
+            else:
+                streak = 1
+            
+            # Calculate bonus
+            base_bonus = 50
+            streak_bonus = min(streak * 10, 100)  # Max 100 extra
+            total_bonus = base_bonus + streak_bonus
+            changes = {
+                "coins": user["coins"] + total_bonus,
+                "daily_streak": streak,
+                "last_daily": today
+            }
+            
+            # Update user only if nothing was written since the snapshot, so two
+            # concurrent claims can't both pay out; on conflict re-run the claim
+            if self.db.compare_and_update(user_id, user.get("version", 0), changes):
+                return {
+                    "success": True,
+                    "bonus": total_bonus,
+                    "streak": streak,
+                    "message": f"🎁 ডেইলি বোনাস! +{total_bonus} কয়েন\n🔥 {streak} দিন স্ট্রীক!",
+                    "coins": changes["coins"]
+                }
+        
+        return {"success": False, "message": WRITE_CONFLICT_MESSAGE}
+    
+    @staticmethod
+    def _settle_bet(bet: int, delta: int):
+        """Mutator for Database.modify_user that applies a bet outcome"""
+        def settle(user: Dict) -> Optional[Dict]:
+            if user["coins"] < bet:
+                return None
+            return {"coins": user["coins"] + delta}
+        return settle
\ No newline at end of file
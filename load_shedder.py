@@ -0,0 +1,114 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional
+
+from config import Config
+from rate_limit import RateLimiter
+
+class LoadShedder:
+    """Tightens low-value rate limits while the bot is saturated
+    
+    Every `interval` it measures event-loop lag (how late a timed sleep
+    wakes up) and the number of queued updates. Each threshold crossed
+    raises the shedding level, and the level scales the games and chat
+    limits. Payments, other commands and admins are never shed. Levels
+    rise at once and fall one step per `cooldown` of calm.
+    """
+    
+    SHED_TYPES = ("games", "messages")
+    
+    def __init__(self, rate_limiter: RateLimiter, interval: float = 0.5,
+                 lag_thresholds: List[float] = None, queue_thresholds: List[int] = None,
+                 scales: List[float] = None, cooldown: float = 10,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate_limiter = rate_limiter
+        self.interval = interval
+        self.lag_thresholds = lag_thresholds or Config.SHED_LAG_MS
+        self.queue_thresholds = queue_thresholds or Config.SHED_QUEUE_DEPTH
+        self.scales = scales or Config.SHED_SCALES
+        self.cooldown = cooldown
+        self.clock = clock
+        self.queue_depth: Callable[[], int] = lambda: 0
+        
+        self.level = 0
+        self.lag_ms = 0.0  # EWMA
+        self.peak_lag_ms = 0.0
+        self.depth = 0
+        self.calm_since: Optional[float] = None
+        self.changed_at = clock()
+        self.task = None
+    
+    def _target_level(self, lag_ms: float, depth: int) -> int:
+        """Highest level whose lag or queue threshold is crossed"""
+        lag_level = sum(1 for threshold in self.lag_thresholds if lag_ms >= threshold)
+        queue_level = sum(1 for threshold in self.queue_thresholds if depth >= threshold)
+        return min(max(lag_level, queue_level), len(self.scales) - 1)
+    
+    def update(self, lag_ms: float, depth: int, now: float) -> int:
+        """Feed one sample; returns the shedding level"""
+        self.lag_ms = 0.7 * self.lag_ms + 0.3 * lag_ms
+        self.peak_lag_ms = max(self.peak_lag_ms, lag_ms)
+        self.depth = depth
+        
+        target = self._target_level(self.lag_ms, depth)
+        if target > self.level:
+            self._set_level(target, now)
+            self.calm_since = None
+        elif target < self.level:
+            if self.calm_since is None:
+                self.calm_since = now
+            elif now - self.calm_since >= self.cooldown:
+                self._set_level(self.level - 1, now)
+                self.calm_since = now
+        else:
+            self.calm_since = None
+        return self.level
+    
+    def _set_level(self, level: int, now: float):
+        """Apply a level's scale to the shed limit types"""
+        print(f"{'🔥' if level > self.level else '🧊'} Load shedding level {self.level} -> {level} "
+              f"(lag {self.lag_ms:.0f} ms, {self.depth} queued)")
+        self.level = level
+        self.changed_at = now
+        for limit_type in self.SHED_TYPES:
+            self.rate_limiter.set_scale(limit_type, self.scales[level])
+    
+    async def run(self):
+        """Sample loop lag and queue depth forever"""
+        while True:
+            started = self.clock()
+            await asyncio.sleep(self.interval)
+            now = self.clock()
+            self.update(max(now - started - self.interval, 0) * 1000, self.queue_depth(), now)
+    
+    def start(self, queue_depth: Callable[[], int] = None) -> asyncio.Task:
+        """Start sampling on the running loop"""
+        if queue_depth is not None:
+            self.queue_depth = queue_depth
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+        return self.task
+    
+    def stop(self):
+        """Stop sampling and lift any shedding"""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.level:
+            self._set_level(0, self.clock())
+    
+    def status(self) -> Dict:
+        """Current level, measurements and thresholds"""
+        return {
+            "level": self.level,
+            "max_level": len(self.scales) - 1,
+            "scale": self.scales[self.level],
+            "shed_types": list(self.SHED_TYPES),
+            "lag_ms": self.lag_ms,
+            "peak_lag_ms": self.peak_lag_ms,
+            "queue_depth": self.depth,
+            "lag_thresholds": self.lag_thresholds,
+            "queue_thresholds": self.queue_thresholds,
+            "scales": self.scales,
+            "level_age": self.clock() - self.changed_at
+        }
\ No newline at end of file
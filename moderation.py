@@ -1,6 +1,6 @@
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
-from db import Database
+from db import Database, WRITE_CONFLICT, WRITE_CONFLICT_MESSAGE
 
 class Moderation:
     """Chat moderation system"""
@@ -31,36 +31,36 @@ class Moderation:
         if not user:
             return {"success": False, "message": "ইউজার খুঁজে পাওয়া যায়নি!"}
         
-        # Get current warnings
-        current_warnings = user.get("warnings", 0)
-        new_warnings = current_warnings + 1
+        warned_at = datetime.now().isoformat()
         
-        # Update user warnings
-        user["warnings"] = new_warnings
-        user["last_warning"] = datetime.now().isoformat()
-        
-        # Add warning to history
-        if "warning_history" not in user:
-            user["warning_history"] = []
-        
-        warning_entry = {
-            "id": f"warn_{datetime.now().strftime('%Y%m%d%H%M%S')}",
-            "reason": reason,
-            "reason_text": self.warn_reasons.get(reason, "অজানা"),
-            "warned_by": warned_by,
-            "notes": notes,
-            "timestamp": datetime.now().isoformat(),
-            "warning_number": new_warnings
-        }
-        
-        user["warning_history"].append(warning_entry)
+        def add_warning(current: Dict) -> Dict:
+            new_warnings = current.get("warnings", 0) + 1
+            
+            # Add warning to history (kept in the cold record)
+            history = self.db.get_user_cold(user_id).get("warning_history", [])
+            history.append({
+                "id": f"warn_{datetime.now().strftime('%Y%m%d%H%M%S')}",
+                "reason": reason,
+                "reason_text": self.warn_reasons.get(reason, "অজানা"),
+                "warned_by": warned_by,
+                "notes": notes,
+                "timestamp": warned_at,
+                "warning_number": new_warnings
+            })
+            
+            return {
+                "warnings": new_warnings,
+                "last_warning": warned_at,
+                "warning_history": history
+            }
         
-        # Save changes
-        self.db.update_user(user_id, {
-            "warnings": new_warnings,
-            "last_warning": user["last_warning"],
-            "warning_history": user["warning_history"]
-        })
+        # Count and log the warning in one conditional write
+        user = self.db.modify_user(user_id, add_warning)
+        if user is WRITE_CONFLICT:
+            return {"success": False, "message": WRITE_CONFLICT_MESSAGE}
+        if not user:
+            return {"success": False, "message": "ইউজার খুঁজে পাওয়া যায়নি!"}
+        new_warnings = user["warnings"]
         
         # Check if should be banned
         if new_warnings >= 3:
@@ -97,40 +97,35 @@ class Moderation:
         ban_start = datetime.now()
         ban_end = ban_start + timedelta(hours=duration_hours)
         
-        # Update user
-        user["is_banned"] = True
-        user["ban_reason"] = reason
-        user["banned_by"] = banned_by
-        user["ban_start"] = ban_start.isoformat()
-        user["ban_end"] = ban_end.isoformat()
-        user["ban_duration"] = duration_hours
-        
-        # Add to ban history
-        if "ban_history" not in user:
-            user["ban_history"] = []
-        
-        ban_entry = {
-            "id": f"ban_{datetime.now().strftime('%Y%m%d%H%M%S')}",
-            "reason": reason,
-            "banned_by": banned_by,
-            "duration": duration_hours,
-            "start": ban_start.isoformat(),
-            "end": ban_end.isoformat(),
-            "warnings": user.get("warnings", 0)
-        }
-        
-        user["ban_history"].append(ban_entry)
+        def add_ban(current: Dict) -> Dict:
+            # Add to ban history (kept in the cold record)
+            history = self.db.get_user_cold(user_id).get("ban_history", [])
+            history.append({
+                "id": f"ban_{datetime.now().strftime('%Y%m%d%H%M%S')}",
+                "reason": reason,
+                "banned_by": banned_by,
+                "duration": duration_hours,
+                "start": ban_start.isoformat(),
+                "end": ban_end.isoformat(),
+                "warnings": current.get("warnings", 0)
+            })
+            
+            return {
+                "is_banned": True,
+                "ban_reason": reason,
+                "banned_by": banned_by,
+                "ban_start": ban_start.isoformat(),
+                "ban_end": ban_end.isoformat(),
+                "ban_duration": duration_hours,
+                "ban_history": history
+            }
         
         # Save changes
-        self.db.update_user(user_id, {
-            "is_banned": True,
-            "ban_reason": reason,
-            "banned_by": banned_by,
-            "ban_start": ban_start.isoformat(),
-            "ban_end": ban_end.isoformat(),
-            "ban_duration": duration_hours,
-            "ban_history": user["ban_history"]
-        })
+        user = self.db.modify_user(user_id, add_ban)
+        if user is WRITE_CONFLICT:
+            return {"success": False, "message": WRITE_CONFLICT_MESSAGE}
+        if not user:
+            return {"success": False, "message": "ইউজার খুঁজে পাওয়া যায়নি!"}
         
         return {
             "success": True,
@@ -151,24 +146,29 @@ class Moderation:
         if not user.get("is_banned", False):
             return {"success": False, "message": "ইউজার ব্যান করা নেই!"}
         
-        # Update user
-        user["is_banned"] = False
-        user["unbanned_by"] = unbanned_by
-        user["unban_reason"] = reason
-        user["unbanned_at"] = datetime.now().isoformat()
+        unbanned_at = datetime.now().isoformat()
         
-        # Reset warnings if ban was due to warnings
-        if user.get("warnings", 0) >= 3:
-            user["warnings"] = 0
+        def lift_ban(current: Dict) -> Optional[Dict]:
+            if not current.get("is_banned", False):
+                return None
+            changes = {
+                "is_banned": False,
+                "unbanned_by": unbanned_by,
+                "unban_reason": reason,
+                "unbanned_at": unbanned_at
+            }
+            
+            # Reset warnings if ban was due to warnings
+            if current.get("warnings", 0) >= 3:
+                changes["warnings"] = 0
+            return changes
         
         # Save changes
-        self.db.update_user(user_id, {
-            "is_banned": False,
-            "unbanned_by": unbanned_by,
-            "unban_reason": reason,
-            "unbanned_at": user["unbanned_at"],
-            "warnings": user.get("warnings", 0)
-        })
+        user = self.db.modify_user(user_id, lift_ban)
+        if user is WRITE_CONFLICT:
+            return {"success": False, "message": WRITE_CONFLICT_MESSAGE}
+        if not user:
+            return {"success": False, "message": "ইউজার ব্যান করা নেই!"}
         
         return {
             "success": True,
@@ -188,16 +188,8 @@ class Moderation:
         mute_start = datetime.now()
         mute_end = mute_start + timedelta(minutes=duration_minutes)
         
-        # Update user
-        user["is_muted"] = True
-        user["mute_reason"] = reason
-        user["muted_by"] = muted_by
-        user["mute_start"] = mute_start.isoformat()
-        user["mute_end"] = mute_end.isoformat()
-        user["mute_duration"] = duration_minutes
-        
         # Save changes
-        self.db.update_user(user_id, {
+        user = self.db.modify_user(user_id, lambda current: {
             "is_muted": True,
             "mute_reason": reason,
             "muted_by": muted_by,
@@ -205,6 +197,10 @@ class Moderation:
             "mute_end": mute_end.isoformat(),
             "mute_duration": duration_minutes
         })
+        if user is WRITE_CONFLICT:
+            return {"success": False, "message": WRITE_CONFLICT_MESSAGE}
+        if not user:
+            return {"success": False, "message": "ইউজার খুঁজে পাওয়া যায়নি!"}
         
         return {
             "success": True,
@@ -224,6 +220,8 @@ class Moderation:
         if not user.get("is_banned", False):
             return None
         
+        # Ban details live in the cold record
+        user.update(self.db.get_user_cold(user_id))
         ban_end = user.get("ban_end")
         if ban_end:
             try:
@@ -262,13 +260,19 @@ class Moderation:
         if not user.get("is_muted", False):
             return None
         
+        # Mute details live in the cold record
+        user.update(self.db.get_user_cold(user_id))
         mute_end = user.get("mute_end")
         if mute_end:
             try:
                 mute_end_time = datetime.fromisoformat(mute_end)
                 if datetime.now() > mute_end_time:
-                    # Mute expired, auto unmute
-                    self.db.update_user(user_id, {"is_muted": False})
+                    # Mute expired, auto unmute (unless it was renewed meanwhile)
+                    def unmute(current: Dict) -> Optional[Dict]:
+                        if self.db.get_user_cold(user_id).get("mute_end") != mute_end:
+                            return None
+                        return {"is_muted": False}
+                    self.db.modify_user(user_id, unmute)
                     return None
                 
                 time_left = mute_end_time - datetime.now()
@@ -295,8 +299,14 @@ class Moderation:
         """Get moderation logs"""
         logs = []
         
-        for user_id_str, user_data in self.db.users.items():
-            user_id = int(user_id_str)
+        # Only banned users or users with warning history contribute entries
+        # (cleared warnings keep their history)
+        flagged = {u["id"]: u for u in self.db.find("users", where={"has_warning_history": True})}
+        flagged.update((u["id"], u) for u in self.db.find("users", where={"is_banned": True}))
+        
+        for user_id, user_data in flagged.items():
+            user_id = int(user_id)
+            user_data = {**user_data, **self.db.get_user_cold(user_id)}
             
             # Check bans
             if user_data.get("is_banned", False):
@@ -334,19 +344,24 @@ class Moderation:
         if not user:
             return {"success": False, "message": "ইউজার খুঁজে পাওয়া যায়নি!"}
         
-        warnings_cleared = user.get("warnings", 0)
+        cleared_at = datetime.now().isoformat()
+        cleared = {}
         
-        # Update user
-        user["warnings"] = 0
-        user["warnings_cleared_by"] = cleared_by
-        user["warnings_cleared_at"] = datetime.now().isoformat()
+        def reset(current: Dict) -> Dict:
+            cleared["warnings"] = current.get("warnings", 0)
+            return {
+                "warnings": 0,
+                "warnings_cleared_by": cleared_by,
+                "warnings_cleared_at": cleared_at
+            }
         
         # Save changes
-        self.db.update_user(user_id, {
-            "warnings": 0,
-            "warnings_cleared_by": cleared_by,
-            "warnings_cleared_at": user["warnings_cleared_at"]
-        })
+        user = self.db.modify_user(user_id, reset)
+        if user is WRITE_CONFLICT:
+            return {"success": False, "message": WRITE_CONFLICT_MESSAGE}
+        if not user:
+            return {"success": False, "message": "ইউজার খুঁজে পাওয়া যায়নি!"}
+        warnings_cleared = cleared["warnings"]
         
         return {
             "success": True,
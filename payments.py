@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Dict, Optional
 from config import Config
-from db import Database
+from db import Database, WRITE_CONFLICT, WRITE_CONFLICT_MESSAGE
 from utils import Utils
 
 class PaymentManager:
@@ -73,18 +73,19 @@ class PaymentManager:
         if payment["status"] != "PENDING":
             return {"success": False, "message": f"পেমেন্ট ইতিমধ্যে {payment['status']}!"}
         
-        # Update payment status
-        payment["status"] = "COMPLETED"
-        payment["confirmed_by"] = admin_id
-        payment["confirmed_at"] = datetime.now().isoformat()
-        
-        # Add to user balance
-        user = self.db.get_user(payment["user_id"])
-        if user:
-            user["balance"] = user.get("balance", 0) + payment["amount"]
-            self.db.update_user(payment["user_id"], {"balance": user["balance"]})
+        # Add to user balance first; the payment only completes once credited
+        credited = self.db.modify_user(payment["user_id"], lambda u: {"balance": u.get("balance", 0) + payment["amount"]})
+        if credited is WRITE_CONFLICT:
+            return {"success": False, "message": WRITE_CONFLICT_MESSAGE}
+        if not credited:
+            return {"success": False, "message": "ইউজার খুঁজে পাওয়া যায়নি!"}
         
-        self.db._save_json("payments.json", self.db.payments)
+        # Update payment status
+        self.db.update_payment(payment_id, {
+            "status": "COMPLETED",
+            "confirmed_by": admin_id,
+            "confirmed_at": datetime.now().isoformat()
+        })
         
         return {
             "success": True,
@@ -116,9 +117,17 @@ class PaymentManager:
             "time": datetime.now().strftime("%H:%M %d/%m/%Y")
         }
         
-        # Deduct balance immediately
-        user["balance"] -= amount
-        self.db.update_user(user_id, {"balance": user["balance"]})
+        # Deduct balance immediately (re-checked against the latest balance)
+        def deduct(current: Dict) -> Optional[Dict]:
+            if current["balance"] < amount:
+                return None
+            return {"balance": current["balance"] - amount}
+        
+        updated = self.db.modify_user(user_id, deduct)
+        if updated is WRITE_CONFLICT:
+            return {"success": False, "message": WRITE_CONFLICT_MESSAGE}
+        if not updated:
+            return {"success": False, "message": f"পর্যাপ্ত ব্যালেন্স নেই! আপনার ব্যালেন্স: {Utils.format_currency(user['balance'])}"}
         
         payment_id = self.db.add_payment(payment_data)
         
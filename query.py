@@ -0,0 +1,349 @@
+import bisect
+import operator
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Comparison operators usable in `where` clauses
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda value, options: value in options,
+    "startswith": lambda value, prefix: isinstance(value, str) and value.startswith(prefix),
+    "endswith": lambda value, suffix: isinstance(value, str) and value.endswith(suffix)
+}
+
+_MISSING = object()
+
+def parse_where(where: Optional[Dict]) -> List[Tuple[str, str, Any]]:
+    """Turn {"field": value} / {"field": (op, value)} into predicates"""
+    predicates = []
+    for field, condition in (where or {}).items():
+        if isinstance(condition, tuple) and len(condition) == 2 and condition[0] in OPERATORS:
+            op, value = condition
+        else:
+            op, value = "==", condition
+        predicates.append((field, op, value))
+    return predicates
+
+def matches(record: Dict, predicates: List[Tuple[str, str, Any]]) -> bool:
+    """Check a record against all predicates (missing/incomparable = no match)"""
+    for field, op, value in predicates:
+        current = record.get(field, _MISSING)
+        if current is _MISSING:
+            return False
+        try:
+            if not OPERATORS[op](current, value):
+                return False
+        except TypeError:
+            return False
+    return True
+
+class HashIndex:
+    """Exact-match index: value -> keys"""
+    
+    kind = "hash"
+    ops = {"==", "in"}
+    
+    def __init__(self, field: str):
+        self.field = field
+        self.buckets: Dict[Any, set] = {}
+    
+    def clear(self):
+        """Drop all entries"""
+        self.buckets = {}
+    
+    def add(self, key: str, record: Dict):
+        """Index a record"""
+        value = record.get(self.field)
+        try:
+            self.buckets.setdefault(value, set()).add(key)
+        except TypeError:
+            pass  # unhashable values are simply not indexed
+    
+    def remove(self, key: str, record: Dict):
+        """Unindex a record (using its old values)"""
+        value = record.get(self.field)
+        try:
+            bucket = self.buckets.get(value)
+        except TypeError:
+            return
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self.buckets[value]
+    
+    def estimate(self, op: str, value: Any) -> int:
+        """Number of keys a lookup would return"""
+        values = value if op == "in" else [value]
+        return sum(len(self.buckets.get(v, ())) for v in values)
+    
+    def lookup(self, op: str, value: Any) -> Iterable[str]:
+        """Keys whose value satisfies `field op value`"""
+        values = value if op == "in" else [value]
+        keys = set()
+        for v in values:
+            keys.update(self.buckets.get(v, ()))
+        return keys
+
+class SortedIndex:
+    """Ordered index for range queries and index-backed ORDER BY"""
+    
+    kind = "sorted"
+    ops = {"==", "<", "<=", ">", ">="}
+    
+    def __init__(self, field: str):
+        self.field = field
+        self.entries: List[Tuple[Any, str]] = []
+    
+    def clear(self):
+        """Drop all entries"""
+        self.entries = []
+    
+    def add(self, key: str, record: Dict):
+        """Index a record"""
+        value = record.get(self.field)
+        if value is None:
+            return
+        try:
+            bisect.insort(self.entries, (value, key))
+        except TypeError:
+            pass  # value not comparable with the rest of the index
+    
+    def remove(self, key: str, record: Dict):
+        """Unindex a record (using its old values)"""
+        value = record.get(self.field)
+        if value is None:
+            return
+        try:
+            i = bisect.bisect_left(self.entries, (value, key))
+        except TypeError:
+            return
+        if i < len(self.entries) and self.entries[i] == (value, key):
+            del self.entries[i]
+    
+    def _range(self, op: str, value: Any) -> Tuple[int, int]:
+        """Slice of entries satisfying `field op value`"""
+        # Compare on the value only: (value,) sorts before any (value, key)
+        lo = bisect.bisect_left(self.entries, (value,))
+        hi = bisect.bisect_left(self.entries, (value, chr(0x10FFFF)))
+        return {
+            "==": (lo, hi),
+            "<": (0, lo),
+            "<=": (0, hi),
+            ">": (hi, len(self.entries)),
+            ">=": (lo, len(self.entries))
+        }[op]
+    
+    def estimate(self, op: str, value: Any) -> int:
+        """Number of keys a lookup would return"""
+        try:
+            start, end = self._range(op, value)
+        except TypeError:
+            return len(self.entries)
+        return end - start
+    
+    def lookup(self, op: str, value: Any) -> Iterable[str]:
+        """Keys whose value satisfies `field op value`"""
+        try:
+            start, end = self._range(op, value)
+        except TypeError:
+            return []  # incomparable with every indexed value: no match, as in a scan
+        return [key for _, key in self.entries[start:end]]
+    
+    def ordered_keys(self, descending: bool = False) -> Iterable[str]:
+        """Keys in value order"""
+        entries = reversed(self.entries) if descending else self.entries
+        return (key for _, key in entries)
+
+class BucketIndex:
+    """Coarse range index: keys grouped by a monotonic bucket function
+    
+    E.g. BucketIndex("last_seen", lambda v: v[:10]) groups users by day.
+    Lookups return every key in the touched buckets; the exact predicate
+    is re-checked afterwards.
+    """
+    
+    kind = "bucket"
+    ops = {"==", "<", "<=", ">", ">="}
+    
+    def __init__(self, field: str, bucket_fn: Callable[[Any], Any]):
+        self.field = field
+        self.bucket_fn = bucket_fn
+        self.buckets: Dict[Any, set] = {}
+        self.bucket_ids: List[Any] = []
+    
+    def clear(self):
+        """Drop all entries"""
+        self.buckets = {}
+        self.bucket_ids = []
+    
+    def _bucket(self, value: Any):
+        """Bucket id for a value (None if it cannot be bucketed)"""
+        if value is None:
+            return None
+        try:
+            return self.bucket_fn(value)
+        except (TypeError, ValueError):
+            return None
+    
+    def add(self, key: str, record: Dict):
+        """Index a record"""
+        bucket_id = self._bucket(record.get(self.field))
+        if bucket_id is None:
+            return
+        if bucket_id not in self.buckets:
+            self.buckets[bucket_id] = set()
+            bisect.insort(self.bucket_ids, bucket_id)
+        self.buckets[bucket_id].add(key)
+    
+    def remove(self, key: str, record: Dict):
+        """Unindex a record (using its old values)"""
+        bucket_id = self._bucket(record.get(self.field))
+        bucket = self.buckets.get(bucket_id)
+        if bucket is None:
+            return
+        bucket.discard(key)
+        if not bucket:
+            del self.buckets[bucket_id]
+            del self.bucket_ids[bisect.bisect_left(self.bucket_ids, bucket_id)]
+    
+    def _touched(self, op: str, value: Any) -> List[Any]:
+        """Bucket ids that may hold matches"""
+        target = self._bucket(value)
+        if target is None:
+            return list(self.bucket_ids)
+        lo = bisect.bisect_left(self.bucket_ids, target)
+        hi = bisect.bisect_right(self.bucket_ids, target)
+        start, end = {
+            "==": (lo, hi),
+            "<": (0, hi),
+            "<=": (0, hi),
+            ">": (lo, len(self.bucket_ids)),
+            ">=": (lo, len(self.bucket_ids))
+        }[op]
+        return self.bucket_ids[start:end]
+    
+    def estimate(self, op: str, value: Any) -> int:
+        """Number of keys a lookup would return"""
+        return sum(len(self.buckets[b]) for b in self._touched(op, value))
+    
+    def lookup(self, op: str, value: Any) -> Iterable[str]:
+        """Keys whose value satisfies `field op value`"""
+        keys = set()
+        for bucket_id in self._touched(op, value):
+            keys.update(self.buckets[bucket_id])
+        return keys
+
+def make_index(field: str, kind: str = "hash", bucket_fn: Optional[Callable] = None):
+    """Build an empty index of the given kind"""
+    if kind == "hash":
+        return HashIndex(field)
+    if kind == "sorted":
+        return SortedIndex(field)
+    if kind == "bucket":
+        return BucketIndex(field, bucket_fn)
+    raise ValueError(f"Unknown index kind: {kind}")
+
+class QueryEngine:
+    """Secondary indexes and a tiny planner for Database.find"""
+    
+    def __init__(self):
+        # collection -> index name -> index
+        self.indexes: Dict[str, Dict[str, Any]] = {}
+    
+    def add_index(self, collection: str, index, records: Dict[str, Dict]) -> str:
+        """Register and build an index over existing records"""
+        name = f"{collection}.{index.field}({index.kind})"
+        for key, record in records.items():
+            index.add(key, record)
+        self.indexes.setdefault(collection, {})[name] = index
+        return name
+    
+    def rebuild(self, collection: str, records: Dict[str, Dict]):
+        """Rebuild every index of a collection from scratch"""
+        for index in self.indexes.get(collection, {}).values():
+            index.clear()
+            for key, record in records.items():
+                index.add(key, record)
+    
+    def on_write(self, collection: str, key: str, old: Optional[Dict], new: Optional[Dict]):
+        """Keep indexes in sync with an insert/update/delete"""
+        for index in self.indexes.get(collection, {}).values():
+            if old is not None:
+                index.remove(key, old)
+            if new is not None:
+                index.add(key, new)
+    
+    def execute(self, collection: str, records: Dict[str, Dict], where: Optional[Dict] = None,
+                order_by: Optional[str] = None, limit: Optional[int] = None) -> Tuple[List[Dict], Dict]:
+        """Run a query; returns (matching records, plan)"""
+        predicates = parse_where(where)
+        indexes = self.indexes.get(collection, {})
+        
+        descending = bool(order_by) and order_by.startswith("-")
+        order_field = order_by.lstrip("-") if order_by else None
+        
+        # Pick the most selective index that can answer one predicate
+        best = None
+        for field, op, value in predicates:
+            for name, index in indexes.items():
+                if index.field != field or op not in index.ops:
+                    continue
+                estimate = index.estimate(op, value)
+                if best is None or estimate < best[0]:
+                    best = (estimate, name, index, op, value)
+        
+        plan = {"collection": collection, "index": None, "strategy": "full_scan",
+                "examined": 0, "returned": 0}
+        
+        if best is not None:
+            _, name, index, op, value = best
+            plan.update(index=name, strategy="index_lookup")
+            candidates = (records[key] for key in index.lookup(op, value) if key in records)
+        else:
+            order_index = next((
+                (name, index) for name, index in indexes.items()
+                if index.kind == "sorted" and index.field == order_field
+            ), None)
+            if order_index and limit is not None:
+                # Walk the index in order and stop as soon as `limit` match
+                name, index = order_index
+                plan.update(index=name, strategy="index_order")
+                results = []
+                for key in index.ordered_keys(descending):
+                    record = records.get(key)
+                    if record is None:
+                        continue
+                    plan["examined"] += 1
+                    if matches(record, predicates):
+                        results.append(record)
+                        if len(results) >= limit:
+                            break
+                plan["returned"] = len(results)
+                return results, plan
+            candidates = records.values()
+        
+        results = []
+        for record in candidates:
+            plan["examined"] += 1
+            if matches(record, predicates):
+                results.append(record)
+        
+        if order_field:
+            results.sort(key=lambda r: _sort_key(r.get(order_field)), reverse=descending)
+        if limit is not None:
+            results = results[:limit]
+        
+        plan["returned"] = len(results)
+        return results, plan
+
+def _sort_key(value: Any):
+    """Sort key that keeps None/mixed types from raising"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, str(value))
\ No newline at end of file
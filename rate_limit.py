@@ -1,13 +1,131 @@
+import asyncio
+import ipaddress
+import itertools
+import math
+import os
+import re
+import sqlite3
+import threading
 import time
-from typing import Dict, List
-from collections import defaultdict
+from typing import Dict, List, Optional, Tuple, Union
+
+from config import Config
+
+class SQLiteRateStore:
+    """GCRA state shared by every bot process on the host (SQLite in WAL mode)
+    
+    Each acquire is one IMMEDIATE transaction, so the read-compute-write
+    of a TAT is atomic across processes. Errors (a lock held past the busy
+    timeout, a full disk) propagate; RateLimiter then falls back to its
+    per-process limits. Calls block, so the bot makes them in a worker
+    thread.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS gcra (key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID")
+        self.round_trips = 0
+    
+    def acquire(self, requests: List[Tuple[str, float, float, float]], now: float) -> Tuple[int, List[float]]:
+        """All-or-nothing GCRA step over (key, interval, window, lease) requests
+        
+        A key allows it while one interval still fits in its window, and
+        then grants as much of the lease (at least one interval) as fits.
+        Returns (-1, granted seconds) when every key allowed it, otherwise
+        (index of the refusing key, TATs up to and including its current one).
+        """
+        with self.lock:
+            self.round_trips += 1
+            try:
+                self.conn.execute("BEGIN IMMEDIATE")
+                tats = []
+                grants = []
+                for i, (key, interval, window, lease) in enumerate(requests):
+                    row = self.conn.execute("SELECT tat FROM gcra WHERE key = ?", (key,)).fetchone()
+                    tat = max(row[0] if row else now, now)
+                    if tat + interval - window > now:
+                        self.conn.execute("ROLLBACK")
+                        return i, tats + [tat]
+                    grants.append(max(min(lease, now + window - tat), interval))
+                    tats.append(tat + grants[-1])
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO gcra VALUES (?, ?)",
+                    [(request[0], tat) for request, tat in zip(requests, tats)]
+                )
+                self.conn.execute("COMMIT")
+                return -1, grants
+            except sqlite3.Error:
+                if self.conn.in_transaction:
+                    self.conn.execute("ROLLBACK")
+                raise
+    
+    def delete_prefix(self, prefix: str):
+        """Forget every key starting with prefix"""
+        with self.lock:
+            self.conn.execute("DELETE FROM gcra WHERE key >= ? AND key < ?", (prefix, prefix + chr(0x10FFFF)))
+    
+    def sweep(self, now: float) -> int:
+        """Drop drained buckets"""
+        with self.lock:
+            return self.conn.execute("DELETE FROM gcra WHERE tat <= ?", (now,)).rowcount
+
+def shared_rate_store() -> Optional[SQLiteRateStore]:
+    """The configured shared backend, or None for per-process limits"""
+    if Config.RATE_LIMIT_BACKEND != "sqlite":
+        return None
+    return SQLiteRateStore(Config.RATE_LIMIT_DB)
 
 class RateLimiter:
-    """Rate limiting system"""
+    """Rate limiting system
+    
+    Uses GCRA (a token bucket kept as one timestamp): each key stores its
+    theoretical arrival time (TAT). Every request pushes the TAT forward
+    by window / limit, and is refused while the TAT would end up more
+    than one window ahead of now. That allows bursts of `limit`, with
+    O(1) memory and time per check.
+    
+    Keys are packed ints, (id << TYPE_BITS) | limit type id, kept in
+    least-recently-used order. Drained buckets are swept every
+    sweep_interval seconds and the oldest keys go past max_keys.
     
-    def __init__(self):
-        self.user_limits = defaultdict(list)
-        self.ip_limits = defaultdict(list)
+    With a shared backend (SQLiteRateStore) the limits hold across every
+    process using it. A round trip leases a slice of a key's shared budget
+    (seconds of TAT), and later requests spend it locally until it runs
+    out or LEASE_TTL passes. A lease starts at one request and doubles
+    each time it runs out before expiring, up to LEASE_SHARE of the
+    window, so busy keys rarely touch the backend and idle ones reserve
+    no more than they use. The local tables still apply the per-process
+    limit, and take the shared TAT when the backend refuses, so that key
+    is refused without a round trip until it drains. If the backend
+    fails, checks fall back to the local tables alone for BACKEND_RETRY
+    seconds: the per-process limit still applies, only the cross-process
+    one is skipped.
+    """
+    
+    TYPE_BITS = 8
+    BACKEND_RETRY = 30
+    LEASE_TTL = 5
+    LEASE_SHARE = 0.1
+    
+    def __init__(self, max_keys: Optional[int] = 100000, sweep_interval: int = 60,
+                 backend: Optional[SQLiteRateStore] = None):
+        # packed key -> theoretical arrival time
+        self.user_limits: Dict[int, float] = {}
+        self.ip_limits: Dict[Union[int, tuple], float] = {}
+        self.max_keys = max_keys
+        self.sweep_interval = sweep_interval
+        self.next_sweep = time.time() + sweep_interval
+        self.evictions = 0
+        self.backend = backend
+        self.backend_errors = 0
+        self.backend_retry_at = 0.0  # after a backend error, local limits until then
+        # shared key -> [seconds left, expires at, size of the last grant]
+        self.leases: Dict[str, list] = {}
         
         # Rate limit configurations
         self.limits = {
@@ -30,112 +148,328 @@ class RateLimiter:
             "withdrawals": {
                 "window": 86400,  # 24 hours
                 "limit": 5       # 5 withdrawals per day
+            },
+            "compute": {
+                "window": 60,  # 60 seconds
+                "limit": 120   # 120 cost units per minute
             }
         }
         
-        # Temporary bans for excessive violations
-        self.temp_bans = {}
-    
-    def check_limit(self, user_id: int, limit_type: str, ip: str = None) -> Dict:
-        """Check rate limit for user"""
-        current_time = time.time()
+        # Cost of a command against the "compute" budget: the configured
+        # weight or the measured latency (one unit per COST_UNIT_MS), whichever
+        # is higher. Anything unlisted and unmeasured costs 1.
+        self.command_costs = {
+            "stats": 10,
+            "cachestats": 5,
+            "load": 2,
+            "userinfo": 5,
+            "broadcast": 20,
+            "backup": 40,
+            "admin_stats": 10,
+            "admin_cache": 5
+        }
+        self.measured_costs: Dict[str, float] = {}
         
-        # Clean old entries
-        self._clean_old_entries(user_id, limit_type, current_time)
+        # limit type -> multiplier on its limit (LoadShedder lowers these)
+        self.scales: Dict[str, float] = {}
         
-        if ip:
-            self._clean_old_entries_ip(ip, limit_type, current_time)
+        # limit type -> small int used in packed keys
+        self.type_ids = {limit_type: i for i, limit_type in enumerate(self.limits)}
+        
+        # Temporary bans for excessive violations (user_id -> violation data)
+        self.temp_bans = {}
+    
+    def _type_id(self, limit_type: str) -> int:
+        """Small int for a limit type (unknown types get one too)"""
+        type_id = self.type_ids.get(limit_type)
+        if type_id is None:
+            if len(self.type_ids) >= 1 << self.TYPE_BITS:
+                raise ValueError(f"Too many limit types: {limit_type}")
+            type_id = self.type_ids[limit_type] = len(self.type_ids)
+        return type_id
+    
+    def _user_key(self, user_id: int, limit_type: str) -> int:
+        """Packed user key"""
+        return (user_id << self.TYPE_BITS) | self._type_id(limit_type)
+    
+    def _ip_key(self, ip: str, limit_type: str) -> Union[int, tuple]:
+        """Packed IP key (a tuple for strings that are not IP addresses)"""
+        try:
+            return (int(ipaddress.ip_address(ip)) << self.TYPE_BITS) | self._type_id(limit_type)
+        except ValueError:
+            return (ip, self._type_id(limit_type))
+    
+    def _touch(self, table: Dict, key, value):
+        """Store as most recently used, evicting the least recent past max_keys"""
+        table.pop(key, None)
+        table[key] = value
+        if self.max_keys is not None and len(table) > self.max_keys:
+            # Evict a tenth at once: popping the front one key at a time
+            # rescans the deleted slots dicts leave behind
+            drop = len(table) - int(self.max_keys * 0.9)
+            for old_key in list(itertools.islice(table, drop)):
+                del table[old_key]
+            self.evictions += drop
+    
+    def sweep(self, current_time: float = None, shared: bool = True) -> int:
+        """Drop drained buckets and stale violation records; returns keys removed
         
-        # Get limit configuration
+        shared=False leaves the backend to the caller (see _sweep_shared).
+        """
+        current_time = current_time or time.time()
+        before = len(self.user_limits) + len(self.ip_limits) + len(self.temp_bans)
+        # Rebuilding (rather than deleting in place) also compacts the dicts
+        self.user_limits = {k: tat for k, tat in self.user_limits.items() if tat > current_time}
+        self.ip_limits = {k: tat for k, tat in self.ip_limits.items() if tat > current_time}
+        self.temp_bans = {
+            k: ban for k, ban in self.temp_bans.items()
+            if ban["temp_banned_until"] > current_time or current_time - ban["last_violation"] <= 3600
+        }
+        self.leases = {k: lease for k, lease in self.leases.items() if lease[1] > current_time}
+        self.next_sweep = current_time + self.sweep_interval
+        if shared:
+            self._sweep_shared(current_time)
+        return before - len(self.user_limits) - len(self.ip_limits) - len(self.temp_bans)
+    
+    def _sweep_shared(self, current_time: float):
+        """Drop drained buckets from the backend (blocks on it)"""
+        if self.backend is not None and current_time >= self.backend_retry_at:
+            try:
+                self.backend.sweep(current_time)
+            except sqlite3.Error as e:
+                print(f"⚠️ Shared rate limit sweep failed: {e}")
+    
+    def _budget(self, limit_type: str) -> Tuple[int, int]:
+        """(window, limit) in effect for a limit type, after scaling"""
         config = self.limits.get(limit_type, {"window": 60, "limit": 30})
-        window = config["window"]
-        limit = config["limit"]
+        scale = self.scales.get(limit_type, 1.0)
+        return config["window"], max(1, int(config["limit"] * scale))
+    
+    def set_scale(self, limit_type: str, scale: float):
+        """Scale a limit type's limit (1.0 = as configured)"""
+        if scale >= 1.0:
+            self.scales.pop(limit_type, None)
+        else:
+            self.scales[limit_type] = scale
+    
+    def _interval(self, limit_type: str, cost: float) -> Tuple[int, float]:
+        """(window, TAT increment) for a request of the given cost"""
+        window, limit = self._budget(limit_type)
+        # A single request may use at most the whole budget
+        return window, window / limit * min(cost, limit)
+    
+    def _gcra(self, table: Dict, key, limit_type: str,
+              current_time: float, cost: float = 1) -> Tuple[bool, float]:
+        """One GCRA step without committing: (allowed, new_tat or retry_after)"""
+        window, interval = self._interval(limit_type, cost)
         
-        # Check user limit
-        user_key = f"{user_id}_{limit_type}"
-        user_timestamps = self.user_limits[user_key]
+        new_tat = max(table.get(key, current_time), current_time) + interval
+        allow_at = new_tat - window
+        if current_time < allow_at:
+            return False, allow_at - current_time
+        return True, new_tat
+    
+    def check_limit(self, user_id: int, limit_type: str, ip: str = None, cost: float = 1) -> Dict:
+        """Check rate limit for user (cost = units of the limit this request uses)"""
+        return self.check_limits(user_id, {limit_type: cost}, ip)
+    
+    def check_limits(self, user_id: int, costs: Dict[str, float], ip: str = None) -> Dict:
+        """Check several limits for one request (limit type -> cost)
         
-        if len(user_timestamps) >= limit:
-            # User exceeded limit
-            oldest_request = min(user_timestamps)
-            retry_after = int(window - (current_time - oldest_request))
-            
-            # Track violation
-            self._track_violation(user_id, limit_type)
-            
-            return {
-                "allowed": False,
-                "limit_type": limit_type,
-                "retry_after": retry_after,
-                "message": f"⏳ রেট লিমিট! {retry_after} সেকেন্ড পরে চেষ্টা করুন।"
-            }
+        Nothing is used unless every limit allows the request, so a refusal
+        by one doesn't spend the others. The result describes the first.
+        With a shared backend this may block on it; the bot uses
+        check_limits_async instead.
+        """
+        current_time = time.time()
+        if current_time >= self.next_sweep:
+            self.sweep(current_time)
         
-        # Check IP limit if provided
-        if ip:
-            ip_key = f"{ip}_{limit_type}"
-            ip_timestamps = self.ip_limits[ip_key]
+        buckets = self._buckets(user_id, costs, ip)
+        refused, results = self._gcra_local(buckets, current_time)
+        needed = self._lease_requests(buckets, current_time) if refused is None else []
+        if needed:
+            outcome = self._acquire(needed, current_time)
+            refused, results = self._settle(buckets, needed, outcome, current_time)
+        return self._result(user_id, buckets, refused, results, current_time)
+    
+    async def check_limits_async(self, user_id: int, costs: Dict[str, float], ip: str = None) -> Dict:
+        """check_limits for the event loop: backend round trips run in a worker thread"""
+        current_time = time.time()
+        if current_time >= self.next_sweep:
+            self.sweep(current_time, shared=False)
+            if self.backend is not None:
+                asyncio.get_running_loop().run_in_executor(None, self._sweep_shared, current_time)
+        
+        buckets = self._buckets(user_id, costs, ip)
+        refused, results = self._gcra_local(buckets, current_time)
+        needed = self._lease_requests(buckets, current_time) if refused is None else []
+        if needed:
+            outcome = await asyncio.to_thread(self._acquire, needed, current_time)
+            refused, results = self._settle(buckets, needed, outcome, current_time)
+        return self._result(user_id, buckets, refused, results, current_time)
+    
+    def _buckets(self, user_id: int, costs: Dict[str, float], ip: Optional[str]) -> List[tuple]:
+        """(table, packed key, shared key, limit type, cost), user then IP per type"""
+        buckets = []
+        for limit_type, cost in costs.items():
+            buckets.append((self.user_limits, self._user_key(user_id, limit_type),
+                            f"u:{user_id}:{limit_type}", limit_type, cost))
+            if ip:
+                buckets.append((self.ip_limits, self._ip_key(ip, limit_type),
+                                f"i:{ip}:{limit_type}", limit_type, cost))
+        return buckets
+    
+    def _result(self, user_id: int, buckets: List[tuple], refused: Optional[int],
+                results: List[float], current_time: float) -> Dict:
+        """Commit an allowed request locally, or describe the refusal"""
+        if refused is not None:
+            table, _, _, limit_type, _ = buckets[refused]
+            retry_after = math.ceil(results[refused])
             
-            if len(ip_timestamps) >= limit:
-                oldest_request = min(ip_timestamps)
-                retry_after = int(window - (current_time - oldest_request))
+            if table is self.user_limits:
+                # User exceeded limit
+                self._track_violation(user_id, limit_type)
                 
                 return {
                     "allowed": False,
-                    "limit_type": f"ip_{limit_type}",
+                    "limit_type": limit_type,
                     "retry_after": retry_after,
-                    "message": f"⏳ IP রেট লিমিট! {retry_after} সেকেন্ড পরে চেষ্টা করুন।"
+                    "message": f"⏳ রেট লিমিট! {retry_after} সেকেন্ড পরে চেষ্টা করুন।"
                 }
+            
+            return {
+                "allowed": False,
+                "limit_type": f"ip_{limit_type}",
+                "retry_after": retry_after,
+                "message": f"⏳ IP রেট লিমিট! {retry_after} সেকেন্ড পরে চেষ্টা করুন।"
+            }
         
         # Allow request
-        user_timestamps.append(current_time)
-        
-        if ip:
-            ip_timestamps.append(current_time)
+        for (table, key, shared_key, limit_type, cost), tat in zip(buckets, results):
+            self._touch(table, key, tat)
+            lease = self.leases.get(shared_key)
+            if lease is not None:
+                # Can dip below zero if a check overlapping a round trip spent
+                # it too; the next grant pays that back first
+                lease[0] -= self._interval(limit_type, cost)[1]
         
         return {
             "allowed": True,
-            "remaining": limit - len(user_timestamps),
-            "reset_in": window
+            "remaining": self._remaining(results[0], buckets[0][3], current_time),
+            "reset_in": math.ceil(results[0] - current_time)
         }
     
-    def _clean_old_entries(self, user_id: int, limit_type: str, current_time: float):
-        """Clean old entries for user"""
-        user_key = f"{user_id}_{limit_type}"
-        if user_key in self.user_limits:
-            config = self.limits.get(limit_type, {"window": 60, "limit": 30})
-            window = config["window"]
-            
-            # Remove entries older than window
-            self.user_limits[user_key] = [
-                ts for ts in self.user_limits[user_key]
-                if current_time - ts < window
-            ]
-    
-    def _clean_old_entries_ip(self, ip: str, limit_type: str, current_time: float):
-        """Clean old entries for IP"""
-        ip_key = f"{ip}_{limit_type}"
-        if ip_key in self.ip_limits:
-            config = self.limits.get(limit_type, {"window": 60, "limit": 30})
-            window = config["window"]
-            
-            # Remove entries older than window
-            self.ip_limits[ip_key] = [
-                ts for ts in self.ip_limits[ip_key]
-                if current_time - ts < window
-            ]
+    def _gcra_local(self, buckets: List[tuple], current_time: float) -> Tuple[Optional[int], List[float]]:
+        """GCRA over the local tables without committing
+        
+        Returns (None, new TATs) when all allow it, otherwise (index of the
+        first refusing bucket, TATs before it + its retry_after).
+        """
+        results = []
+        for i, (table, key, _, limit_type, cost) in enumerate(buckets):
+            allowed, result = self._gcra(table, key, limit_type, current_time, cost)
+            if not allowed:
+                return i, results + [result]
+            results.append(result)
+        return None, results
+    
+    def _lease_requests(self, buckets: List[tuple], current_time: float) -> List[tuple]:
+        """(bucket index, shared key, interval, window, lease) for buckets whose lease can't pay"""
+        if self.backend is None or current_time < self.backend_retry_at:
+            return []
+        needed = []
+        for i, (_, _, shared_key, limit_type, cost) in enumerate(buckets):
+            window, interval = self._interval(limit_type, cost)
+            lease = self.leases.get(shared_key)
+            live = lease is not None and lease[1] > current_time
+            if live and lease[0] >= interval - 1e-9:
+                continue
+            # A live lease that ran out asks for twice as much; otherwise start over
+            size = min(lease[2] * 2, window * self.LEASE_SHARE) if live else interval
+            needed.append((i, shared_key, interval, window, max(size, interval)))
+        return needed
+    
+    def _acquire(self, needed: List[tuple], current_time: float) -> Tuple[Optional[int], list]:
+        """One backend round trip for the leases; (None, error) if it failed
+        
+        Touches nothing but the backend, so it can run in a worker thread.
+        """
+        try:
+            return self.backend.acquire([request[1:] for request in needed], current_time)
+        except sqlite3.Error as e:
+            return None, e
+    
+    def _settle(self, buckets: List[tuple], needed: List[tuple], outcome: tuple,
+                current_time: float) -> Tuple[Optional[int], List[float]]:
+        """Apply a lease round trip; returns (refused, results) like _gcra_local"""
+        refused, values = outcome
+        if refused is None:
+            # Fail open to the per-process limits
+            self.backend_errors += 1
+            self.backend_retry_at = current_time + self.BACKEND_RETRY
+            print(f"⚠️ Shared rate limit unavailable, using local limits for {self.BACKEND_RETRY}s: {values}")
+        elif refused >= 0:
+            i, _, interval, window, _ = needed[refused]
+            table, key = buckets[i][:2]
+            self._touch(table, key, values[refused])
+            return i, [0.0] * i + [values[refused] + interval - window - current_time]
+        else:
+            for (_, shared_key, _, _, size), grant in zip(needed, values):
+                lease = self.leases.get(shared_key)
+                if lease is not None and lease[1] > current_time:
+                    self.leases[shared_key] = [lease[0] + grant, current_time + self.LEASE_TTL, size]
+                else:
+                    self.leases[shared_key] = [grant, current_time + self.LEASE_TTL, size]
+        
+        # Other checks may have used the local tables during the round trip
+        return self._gcra_local(buckets, current_time)
+    
+    def command_cost(self, name: str) -> float:
+        """Units of the "compute" budget a command uses"""
+        return max(self.command_costs.get(name, 1), self.measured_costs.get(name, 0))
+    
+    def record_cost(self, name: str, seconds: float):
+        """Fold a measured handler latency into the command's cost (EWMA)
+        
+        The average starts from the configured weight and each sample is
+        capped at a quarter of the compute budget, so one slow run (a
+        stalled disk, a GC pause) can't price a command out for everyone.
+        """
+        units = min(seconds * 1000 / Config.COST_UNIT_MS, self.limits["compute"]["limit"] / 4)
+        previous = self.measured_costs.get(name)
+        if previous is None:
+            if len(self.measured_costs) >= 1000:
+                return  # names come from updates; don't let them grow unbounded
+            previous = self.command_costs.get(name, 1)
+        self.measured_costs[name] = 0.8 * previous + 0.2 * units
+    
+    @staticmethod
+    def cost_name(command: Optional[str] = None, callback_data: Optional[str] = None) -> str:
+        """Cost table name for a command or a button (trailing ids dropped)"""
+        if command is not None:
+            return command
+        if callback_data is not None:
+            return re.sub(r"[_\d]+$", "", callback_data) or "callback"
+        return "message"
+    
+    def _remaining(self, tat: float, limit_type: str, current_time: float) -> int:
+        """Requests still allowed right now for a key at this TAT"""
+        window, limit = self._budget(limit_type)
+        interval = window / limit
+        used = math.ceil(max(tat - current_time, 0) / interval - 1e-9)
+        return max(limit - used, 0)
     
     def _track_violation(self, user_id: int, limit_type: str):
         """Track rate limit violations"""
-        violation_key = f"{user_id}_violations"
-        
-        if violation_key not in self.temp_bans:
-            self.temp_bans[violation_key] = {
+        if user_id not in self.temp_bans:
+            self._touch(self.temp_bans, user_id, {
                 "count": 0,
                 "last_violation": time.time(),
                 "temp_banned_until": 0
-            }
+            })
         
-        violation_data = self.temp_bans[violation_key]
+        violation_data = self.temp_bans[user_id]
         current_time = time.time()
         
         # Reset count if last violation was more than 1 hour ago
@@ -155,10 +489,8 @@ class RateLimiter:
     
     def is_temp_banned(self, user_id: int) -> Dict:
         """Check if user is temporarily banned"""
-        violation_key = f"{user_id}_violations"
-        
-        if violation_key in self.temp_bans:
-            ban_data = self.temp_bans[violation_key]
+        if user_id in self.temp_bans:
+            ban_data = self.temp_bans[user_id]
             current_time = time.time()
             
             if current_time < ban_data["temp_banned_until"]:
@@ -180,41 +512,49 @@ class RateLimiter:
         """Clear rate limits for user or IP"""
         if user_id:
             # Clear all limits for user
-            keys_to_remove = [k for k in self.user_limits.keys() if k.startswith(f"{user_id}_")]
-            for key in keys_to_remove:
-                del self.user_limits[key]
+            for limit_type in self.type_ids:
+                self.user_limits.pop(self._user_key(user_id, limit_type), None)
             
             # Clear violations
-            violation_key = f"{user_id}_violations"
-            if violation_key in self.temp_bans:
-                del self.temp_bans[violation_key]
+            self.temp_bans.pop(user_id, None)
+            if self.backend is not None:
+                self.backend.delete_prefix(f"u:{user_id}:")
+                self._drop_leases(f"u:{user_id}:")
             
             print(f"🧹 Cleared rate limits for user {user_id}")
         
         if ip:
             # Clear all limits for IP
-            keys_to_remove = [k for k in self.ip_limits.keys() if k.startswith(f"{ip}_")]
-            for key in keys_to_remove:
-                del self.ip_limits[key]
+            for limit_type in self.type_ids:
+                self.ip_limits.pop(self._ip_key(ip, limit_type), None)
+            if self.backend is not None:
+                self.backend.delete_prefix(f"i:{ip}:")
+                self._drop_leases(f"i:{ip}:")
             
             print(f"🧹 Cleared rate limits for IP {ip}")
     
+    def _drop_leases(self, prefix: str):
+        """Forget leases on shared keys starting with prefix"""
+        for key in [key for key in self.leases if key.startswith(prefix)]:
+            del self.leases[key]
+    
     def get_user_stats(self, user_id: int) -> Dict:
         """Get rate limit statistics for user"""
         stats = {}
+        current_time = time.time()
         
         for limit_type in self.limits:
-            user_key = f"{user_id}_{limit_type}"
+            user_key = self._user_key(user_id, limit_type)
             
             if user_key in self.user_limits:
-                config = self.limits[limit_type]
-                current_count = len(self.user_limits[user_key])
+                window, limit = self._budget(limit_type)
+                remaining = self._remaining(self.user_limits[user_key], limit_type, current_time)
                 
                 stats[limit_type] = {
-                    "current": current_count,
-                    "limit": config["limit"],
-                    "remaining": config["limit"] - current_count,
-                    "window": config["window"]
+                    "current": limit - remaining,
+                    "limit": limit,
+                    "remaining": remaining,
+                    "window": window
                 }
         
         # Check temp ban status
@@ -233,8 +573,70 @@ class RateLimiter:
             "window": window,
             "limit": limit
         }
+        self._type_id(limit_type)
         print(f"⚙️ Updated limit {limit_type}: {limit} per {window} seconds")
     
     def get_all_limits(self) -> Dict:
         """Get all rate limit configurations"""
-        return self.limits.copy()
\ No newline at end of file
+        return self.limits.copy()
+    
+    def export_state(self) -> Dict:
+        """Counters and temp bans for a checkpoint
+        
+        With a shared backend the TATs already persist in its database and
+        the local tables are only a cache, so just temp bans are saved.
+        """
+        shared = self.backend is not None
+        return {
+            "type_ids": self.type_ids,
+            "user_limits": {} if shared else self.user_limits,
+            "ip_limits": {} if shared else self.ip_limits,
+            "temp_bans": self.temp_bans
+        }
+    
+    def import_state(self, state: Dict, now: float):
+        """Restore a checkpoint, dropping keys whose bucket has drained"""
+        # Packed keys are only meaningful with the type ids they were made with
+        if state.get("type_ids") != self.type_ids:
+            return
+        for target, saved in ((self.user_limits, state.get("user_limits", {})),
+                              (self.ip_limits, state.get("ip_limits", {}))):
+            for key, tat in saved.items():
+                if tat > now:
+                    target[key] = tat
+        
+        for key, ban in state.get("temp_bans", {}).items():
+            # Keep active bans and violation counts that still matter (1 hour)
+            if ban["temp_banned_until"] > now or now - ban["last_violation"] <= 3600:
+                self.temp_bans[key] = ban
+
+if __name__ == "__main__":
+    # python rate_limit.py [users]: memory used by N distinct users
+    import sys
+    import tracemalloc
+    
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    
+    tracemalloc.start()
+    baseline = {f"{user_id}_messages": [time.time()] for user_id in range(users)}
+    old_size = tracemalloc.get_traced_memory()[0]
+    del baseline
+    tracemalloc.stop()
+    print(f"📏 {users:,} string keys (old layout): {old_size / 2 ** 20:.1f} MiB")
+    
+    for max_keys in (None, 100000):
+        limiter = RateLimiter(max_keys=max_keys)
+        tracemalloc.start()
+        started = time.perf_counter()
+        for user_id in range(users):
+            limiter.check_limit(user_id, "messages")
+        elapsed = time.perf_counter() - started
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        
+        print(f"📏 max_keys={max_keys}: {len(limiter.user_limits):,} keys, "
+              f"{size / 2 ** 20:.1f} MiB ({size / max(len(limiter.user_limits), 1):.0f} B/key), "
+              f"{elapsed / users * 1e6:.2f} µs/check (traced), {limiter.evictions:,} evicted")
+        
+        removed = limiter.sweep(time.time() + limiter.limits["messages"]["window"])
+        print(f"🧹 Sweep one window later removed {removed:,} idle keys, {len(limiter.user_limits):,} left")
\ No newline at end of file
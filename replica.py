@@ -0,0 +1,326 @@
+import asyncio
+import functools
+import json
+import marshal
+import sys
+import time
+from typing import Dict, List, Optional
+
+from config import Config
+from db import Database
+from query import QueryEngine, OPERATORS, make_index
+
+# Collections streamed to standbys (cold records live on the shared disk)
+REPLICATED = ("users", "payments", "shop", "games", "groups")
+
+def _encode(message: Dict) -> bytes:
+    """One newline-delimited JSON frame"""
+    return (json.dumps(message, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+def _decode_where(where: Optional[Dict]) -> Optional[Dict]:
+    """JSON turns (op, value) tuples into lists; turn them back"""
+    if not where:
+        return where
+    decoded = {}
+    for field, condition in where.items():
+        if isinstance(condition, list) and len(condition) == 2 and condition[0] in OPERATORS:
+            condition = tuple(condition)
+        decoded[field] = condition
+    return decoded
+
+class ReplicationPublisher:
+    """Streams Database writes to standby processes over a local socket"""
+    
+    def __init__(self, db: Database, host: str = None, port: int = None, max_backlog: int = 10000):
+        self.db = db
+        self.host = host or Config.REPLICATION_HOST
+        self.port = port or Config.REPLICATION_PORT
+        self.max_backlog = max_backlog
+        self.heartbeat = max(1, Config.FAILOVER_TIMEOUT / 3)
+        
+        self.server = None
+        self.loop = None
+        self.seq = 0
+        # writer -> queue of encoded frames
+        self.standbys: Dict[asyncio.StreamWriter, asyncio.Queue] = {}
+    
+    async def start(self):
+        """Listen for standbys and subscribe to the change stream"""
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._handle_standby, self.host, self.port)
+        self.db.add_change_listener(self._on_change)
+        print(f"🔁 Replication publisher listening on {self.host}:{self.port}")
+    
+    async def stop(self):
+        """Stop streaming and disconnect standbys"""
+        self.db.remove_change_listener(self._on_change)
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for writer, queue in list(self.standbys.items()):
+            try:
+                queue.put_nowait(None)  # wakes the sender, which then closes
+            except asyncio.QueueFull:
+                writer.close()
+    
+    def _snapshot_copy(self) -> tuple:
+        """(deep copy of the replicated collections, seq), taken under the lock
+        
+        marshal copies plain dicts and lists about ten times faster than
+        encoding them as JSON, so the lock is held for the copy only.
+        """
+        with self.db.lock:
+            return marshal.dumps({name: getattr(self.db, name) for name in REPLICATED}), self.seq
+    
+    def _snapshot_frame(self, copy: tuple = None) -> bytes:
+        """Full copy of the replicated collections (encoded outside the lock)"""
+        data, seq = copy or self._snapshot_copy()
+        return _encode({"op": "snapshot", "seq": seq, "data": marshal.loads(data)})
+    
+    def _on_change(self, collection: str, key: Optional[str], record):
+        """Change listener; runs under the database lock in the writer's thread"""
+        if not self.standbys:
+            return
+        if collection == "*":
+            # Copy now, encode on the event loop once the lock is released
+            copy = self._snapshot_copy()
+            send = lambda: self._broadcast(self._snapshot_frame(copy))
+        elif collection in REPLICATED:
+            self.seq += 1
+            if key is None:
+                # Whole-document write (e.g. the shop catalog)
+                frame = _encode({"op": "replace", "seq": self.seq, "c": collection, "r": record})
+            else:
+                frame = _encode({"op": "put", "seq": self.seq, "c": collection, "k": key, "r": record})
+            send = functools.partial(self._broadcast, frame)
+        else:
+            return
+        
+        # Always via the loop's queue, so a deferred snapshot keeps its place
+        self.loop.call_soon_threadsafe(send)
+    
+    def _broadcast(self, frame: bytes):
+        """Queue a frame for every standby"""
+        for writer, queue in list(self.standbys.items()):
+            try:
+                queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                # Too far behind; drop it so it reconnects and resyncs from a snapshot
+                print("⚠️ Standby fell behind, disconnecting")
+                del self.standbys[writer]
+                writer.close()
+    
+    async def _handle_standby(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Send a snapshot, then every change, with heartbeats when idle"""
+        queue = asyncio.Queue(self.max_backlog)
+        queue.put_nowait(self._snapshot_frame())
+        self.standbys[writer] = queue
+        print(f"🔁 Standby connected: {writer.get_extra_info('peername')}")
+        
+        try:
+            while writer in self.standbys:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    frame = _encode({"op": "ping", "seq": self.seq})
+                if frame is None:
+                    break
+                writer.write(frame)
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.standbys.pop(writer, None)
+            writer.close()
+
+class StandbyReplica:
+    """In-memory copy of the primary that serves reads and can take over"""
+    
+    def __init__(self, host: str = None, port: int = None, query_port: int = None,
+                 failover_timeout: float = None):
+        self.host = host or Config.REPLICATION_HOST
+        self.port = port or Config.REPLICATION_PORT
+        self.query_port = query_port or Config.REPLICA_QUERY_PORT
+        self.failover_timeout = failover_timeout or Config.FAILOVER_TIMEOUT
+        
+        self.data: Dict[str, Dict] = {name: {} for name in REPLICATED}
+        self.query = QueryEngine()
+        for collection, field, kind, bucket_fn in Database.DEFAULT_INDEXES:
+            self.query.add_index(collection, make_index(field, kind, bucket_fn), self.data[collection])
+        
+        self.synced = False
+        self.seq = 0
+        self.last_heard = None
+        self.query_server = None
+    
+    def apply(self, message: Dict):
+        """Apply one frame from the primary"""
+        op = message.get("op")
+        if op == "snapshot":
+            self.data = {name: message["data"].get(name, {}) for name in REPLICATED}
+            for collection in self.query.indexes:
+                self.query.rebuild(collection, self.data[collection])
+            self.synced = True
+        elif op == "put":
+            collection, key, record = message["c"], message["k"], message["r"]
+            records = self.data[collection]
+            old = records.get(key)
+            records[key] = record
+            self.query.on_write(collection, key, old, record)
+        elif op == "replace":
+            self.data[message["c"]] = message["r"]
+            self.query.rebuild(message["c"], message["r"])
+        self.seq = message.get("seq", self.seq)
+        self.last_heard = time.time()
+    
+    async def follow(self):
+        """Tail the primary; returns once it has been gone for failover_timeout"""
+        delay = 1
+        while True:
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port, limit=2 ** 26)
+            except OSError:
+                if self.synced and time.time() - self.last_heard > self.failover_timeout:
+                    print(f"🚨 Primary unreachable (last seq {self.seq})")
+                    return
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+                continue
+            
+            delay = 1
+            print(f"🔁 Following primary at {self.host}:{self.port}")
+            try:
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), timeout=self.failover_timeout)
+                    if not line:
+                        break
+                    self.apply(json.loads(line))
+            except (asyncio.TimeoutError, ConnectionError, ValueError) as e:
+                print(f"⚠️ Replication stream lost: {e or type(e).__name__}")
+            finally:
+                writer.close()
+            
+            if self.synced and time.time() - self.last_heard > self.failover_timeout:
+                print(f"🚨 Primary unreachable (last seq {self.seq})")
+                return
+            # Give a restarting primary until failover_timeout to come back
+            await asyncio.sleep(1)
+    
+    def find(self, collection: str, where: Optional[Dict] = None,
+             order_by: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        """Same semantics as Database.find, against the replica"""
+        results, _ = self.query.execute(collection, self.data.get(collection, {}), where, order_by, limit)
+        return results
+    
+    async def serve_queries(self):
+        """Read-only query endpoint for analytics"""
+        self.query_server = await asyncio.start_server(self._handle_query, self.host, self.query_port)
+        print(f"📊 Replica queries on {self.host}:{self.query_port}")
+    
+    async def _handle_query(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """One JSON request per line: {"op": "find"|"count", "collection", "where", ...}"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    results = self.find(
+                        request["collection"],
+                        where=_decode_where(request.get("where")),
+                        order_by=request.get("order_by"),
+                        limit=request.get("limit")
+                    )
+                    if request.get("op") == "count":
+                        response = {"success": True, "count": len(results), "seq": self.seq}
+                    else:
+                        response = {"success": True, "results": results, "seq": self.seq}
+                except (ValueError, KeyError, TypeError) as e:
+                    response = {"success": False, "message": str(e)}
+                writer.write(_encode(response))
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+    
+    def promote(self) -> Optional[Database]:
+        """Become the primary: build a Database from memory and persist it
+        
+        The Database first takes the data directory lock, so this waits up
+        to failover_timeout for the old primary to exit and gives up (None)
+        if it is still running, e.g. alive but cut off from the standby.
+        """
+        print(f"⬆️ Promoting standby (seq {self.seq})")
+        try:
+            db = Database(initial_data=self.data, lock_wait=self.failover_timeout)
+        except RuntimeError as e:
+            print(f"❌ Not promoting: {e}")
+            return None
+        db.save_all()
+        return db
+    
+    async def run(self, takeover: bool = False) -> Optional[Database]:
+        """Follow the primary; on failure optionally promote"""
+        await self.serve_queries()
+        try:
+            await self.follow()
+        finally:
+            self.query_server.close()
+            await self.query_server.wait_closed()
+        return self.promote() if takeover else None
+
+class ReplicaClient:
+    """Sends read-only queries to a standby's query endpoint"""
+    
+    def __init__(self, host: str = None, port: int = None, timeout: float = 5):
+        self.host = host or Config.REPLICATION_HOST
+        self.port = port or Config.REPLICA_QUERY_PORT
+        self.timeout = timeout
+    
+    async def _request(self, request: Dict) -> Dict:
+        """Send one request and wait for its response"""
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port, limit=2 ** 26), timeout=self.timeout
+        )
+        try:
+            writer.write(_encode(request))
+            await writer.drain()
+            line = await asyncio.wait_for(reader.readline(), timeout=self.timeout)
+        finally:
+            writer.close()
+        response = json.loads(line)
+        if not response.get("success"):
+            raise ValueError(response.get("message", "replica query failed"))
+        return response
+    
+    async def find(self, collection: str, where: Optional[Dict] = None,
+                   order_by: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        """Database.find on the replica"""
+        response = await self._request({
+            "op": "find", "collection": collection, "where": where,
+            "order_by": order_by, "limit": limit
+        })
+        return response["results"]
+    
+    async def count(self, collection: str, where: Optional[Dict] = None) -> int:
+        """Database.count on the replica"""
+        response = await self._request({"op": "count", "collection": collection, "where": where})
+        return response["count"]
+
+if __name__ == "__main__":
+    # python replica.py [--takeover]
+    takeover = "--takeover" in sys.argv
+    standby = StandbyReplica()
+    print("🛡️ Warm standby starting" + (" (will take over on failure)" if takeover else ""))
+    
+    try:
+        db = asyncio.run(standby.run(takeover=takeover))
+    except KeyboardInterrupt:
+        print("\n👋 Standby stopped")
+        sys.exit(0)
+    
+    if db is not None:
+        from bot import MARPdBot
+        MARPdBot(db=db).run()
\ No newline at end of file
@@ -0,0 +1,278 @@
+from typing import Callable, Dict, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from utils import Utils
+
+DEFAULT_LANGUAGE = "bn"
+
+def _literal(value) -> str:
+    """Config text embedded in a template that is formatted again later"""
+    return str(value).replace("{", "{{").replace("}", "}}")
+
+def _start_bn(config, items):
+    """/start welcome (fields: first_name, balance, coins)"""
+    text = f"""
+🎉 **স্বাগতম {{first_name}}!** 🎉
+
+🤖 **{_literal(config.BOT_NAME)}** - সর্বশেষ ভার্সন {_literal(config.VERSION)}
+
+💰 **আপনার স্টার্টার বোনাস:**
+• {{balance}} ব্যালেন্স
+• {{coins}} কয়েন
+
+🎮 **গেম খেলুন:** /games
+🛍️ **শপ ব্রাউজ করুন:** /shop
+💳 **ব্যালেন্স চেক:** /balance
+
+📱 **পেমেন্ট মেথড:**
+• নগদ: {_literal(config.NAGOD_NUMBER)}
+• বিকাশ: {_literal(config.BIKASH_NUMBER)}
+
+🔧 **সাহায্যের জন্য:** /help
+
+**"সাফল্য চাইলে আগে বিশ্বাস করতে হবে!"**
+        """
+    
+    keyboard = [
+        [
+            InlineKeyboardButton("🎮 গেমস", callback_data="games_menu"),
+            InlineKeyboardButton("🛍️ শপ", callback_data="shop_menu")
+        ],
+        [
+            InlineKeyboardButton("💰 ব্যালেন্স", callback_data="balance"),
+            InlineKeyboardButton("📊 প্রোফাইল", callback_data="profile")
+        ],
+        [
+            InlineKeyboardButton("ℹ️ সাহায্য", callback_data="help"),
+            InlineKeyboardButton("⭐ ডেইলি বোনাস", callback_data="daily_bonus")
+        ]
+    ]
+    return text, InlineKeyboardMarkup(keyboard)
+
+def _help_bn(config, items):
+    """/help command list"""
+    text = """
+🆘 **সাহায্য - সকল কমান্ড**
+
+🎯 **সাধারণ কমান্ড:**
+/start - বট শুরু করুন
+/help - সাহায্য দেখুন
+/profile - আপনার প্রোফাইল
+/settings - সেটিংস (শীঘ্রই)
+
+💰 **ইকোনমি কমান্ড:**
+/balance - ব্যালেন্স চেক
+/deposit - ডিপোজিট করুন
+/withdraw - উইথড্র করুন
+/payments - পেমেন্ট হিস্টরি
+
+🎮 **গেমস কমান্ড:**
+/games - সকল গেম দেখুন
+/dice [bet] - ডাইস গেম খেলুন
+/slot [bet] - স্লট মেশিন
+/quiz - কুইজ গেম
+/daily - ডেইলি বোনাস নিন
+
+🛍️ **শপ কমান্ড:**
+/shop - শপ ব্রাউজ করুন
+/inventory - আপনার ইনভেন্টরি
+/buy [item_id] - আইটেম কিনুন
+
+👑 **অ্যাডমিন কমান্ড:**
+/admin - অ্যাডমিন প্যানেল
+/stats - বট পরিসংখ্যান
+/broadcast [msg] - ব্রডকাস্ট
+/userinfo [id] - ইউজার তথ্য
+
+📞 **সাপোর্ট:**
+রিপোর্টের জন্য সরাসরি অ্যাডমিনকে কন্টাক্ট করুন: @{}
+        """.format(config.OWNER_USERNAME)
+    return text, None
+
+def _games_bn(config, items):
+    """/games menu"""
+    text = """
+🎮 **গেমস জোন**
+
+🎲 **ডাইস গেম:**
+• বেট করে ডাইস রোল করুন
+• বটের চেয়ে বেশি পেলে জিতবেন
+• কমান্ড: `/dice [bet]`
+• ন্যূনতম বেট: 10 কয়েন
+
+🎰 **স্লট মেশিন:**
+• ৩টি মিললে জ্যাকপট!
+• কমান্ড: `/slot [bet]`
+• ন্যূনতম বেট: 20 কয়েন
+
+🧠 **কুইজ গেম:**
+• জ্ঞান পরীক্ষা করুন
+• সঠিক উত্তরে 50 কয়েন
+• কমান্ড: `/quiz`
+
+🎁 **ডেইলি বোনাস:**
+• প্রতিদিন ফ্রি কয়েন
+• স্ট্রীক বাড়লে বোনাস বাড়ে
+• কমান্ড: `/daily`
+
+🏆 **লিডারবোর্ড:**
+• শীর্ষ খেলোয়াড়দের দেখুন
+• সাপ্তাহিক পুরস্কার
+
+⚡ **টিপস:**
+• ছোট বেট দিয়ে শুরু করুন
+• ডেইলি বোনাস নিতে ভুলবেন না
+• লাকি হলে বিশাল জিততে পারেন!
+        """
+    
+    keyboard = [
+        [
+            InlineKeyboardButton("🎲 ডাইস (10)", callback_data="game_dice_10"),
+            InlineKeyboardButton("🎰 স্লট (20)", callback_data="game_slot_20")
+        ],
+        [
+            InlineKeyboardButton("🧠 কুইজ", callback_data="game_quiz"),
+            InlineKeyboardButton("🎁 ডেইলি", callback_data="daily_bonus")
+        ],
+        [
+            InlineKeyboardButton("🏆 লিডারবোর্ড", callback_data="leaderboard"),
+            InlineKeyboardButton("📊 স্ট্যাটস", callback_data="game_stats")
+        ]
+    ]
+    return text, InlineKeyboardMarkup(keyboard)
+
+def _admin_bn(config, items):
+    """/admin panel (fields: username, total_users, pending_payments, total_coins)"""
+    text = f"""
+👑 **অ্যাডমিন প্যানেল**
+
+👤 **অ্যাডমিন:** @{{username}}
+🤖 **বট:** @{_literal(config.BOT_USERNAME)}
+
+📊 **কুইক স্ট্যাটস:**
+• মোট ইউজার: {{total_users:,}}
+• অ্যাকটিভ পেমেন্ট: {{pending_payments}}
+• টোটাল কয়েন: {{total_coins}}
+
+🛠️ **অ্যাডমিন টুলস:**
+• /stats - বিস্তারিত পরিসংখ্যান
+• /broadcast [msg] - ব্রডকাস্ট বার্তা
+• /userinfo [id] - ইউজার তথ্য
+• /backup - ডাটাবেস ব্যাকআপ
+
+👤 **ইউজার ম্যানেজমেন্ট:**
+• `/warn [id] [reason]` - সতর্কতা দিন
+• `/ban [id] [reason]` - ইউজার ব্যান করুন
+• `/unban [id]` - ইউজার আনব্যান করুন
+• `/addcoins [id] [amount]` - কয়েন যোগ করুন
+
+💳 **পেমেন্ট ম্যানেজমেন্ট:**
+• পেমেন্ট আইডি দিয়ে কনফার্ম/রিজেক্ট
+• ম্যানুয়াল চেকের জন্য স্ক্রিনশট
+
+⚙️ **সিস্টেম:**
+• লগস চেক করুন
+• পারফরম্যান্স মনিটর করুন
+• ব্যাকআপ নিয়মিত নিন
+        """
+    
+    keyboard = [
+        [
+            InlineKeyboardButton("📊 স্ট্যাটস", callback_data="admin_stats"),
+            InlineKeyboardButton("📢 ব্রডকাস্ট", callback_data="admin_broadcast")
+        ],
+        [
+            InlineKeyboardButton("💾 ব্যাকআপ", callback_data="admin_backup"),
+            InlineKeyboardButton("👥 ইউজার", callback_data="admin_users")
+        ],
+        [
+            InlineKeyboardButton("💳 পেমেন্ট", callback_data="admin_payments"),
+            InlineKeyboardButton("🚨 লগস", callback_data="admin_logs")
+        ],
+        [
+            InlineKeyboardButton("🧠 ক্যাশ", callback_data="admin_cache")
+        ]
+    ]
+    return text, InlineKeyboardMarkup(keyboard)
+
+def _shop_bn(config, items):
+    """/shop catalog with buy buttons"""
+    if not items:
+        return "❌ শপে এখন কোনো আইটেম নেই!", None
+    
+    text = "🛍️ **শপ - সকল আইটেম**\n\n"
+    
+    keyboard = []
+    row = []
+    
+    for i, item in enumerate(items):
+        text += f"{item.get('icon', '📦')} **{item['name']}**\n"
+        text += f"   💰 দাম: {Utils.format_coins(item['price'])}\n"
+        text += f"   📝 {item.get('description', '')}\n"
+        text += f"   🆔 ID: `{item['id']}`\n\n"
+        
+        # Add buy button
+        row.append(InlineKeyboardButton(
+            f"{item.get('icon', '📦')} {item['price']}",
+            callback_data=f"buy_{item['id']}"
+        ))
+        
+        if len(row) == 2 or i == len(items) - 1:
+            keyboard.append(row)
+            row = []
+    
+    # Add navigation buttons
+    keyboard.append([
+        InlineKeyboardButton("📦 ইনভেন্টরি", callback_data="inventory"),
+        InlineKeyboardButton("🔄 রিফ্রেশ", callback_data="refresh_shop")
+    ])
+    
+    return text, InlineKeyboardMarkup(keyboard)
+
+# language -> response name -> builder(config, shop items) -> (text, markup)
+BUILDERS: Dict[str, Dict[str, Callable]] = {
+    "bn": {
+        "start": _start_bn,
+        "help": _help_bn,
+        "games": _games_bn,
+        "admin": _admin_bn,
+        "shop": _shop_bn
+    }
+}
+
+class ResponseRegistry:
+    """Precompiled static responses and keyboards
+    
+    Texts and InlineKeyboardMarkup objects are built once per
+    (name, language, catalog version) and reused; render() only fills in
+    the per-user fields. A catalog change bumps shop["version"], which
+    drops everything compiled for the old catalog.
+    """
+    
+    def __init__(self, config, db):
+        self.config = config
+        self.db = db
+        self.compiled: Dict[Tuple[str, str, int], Tuple[str, Optional[InlineKeyboardMarkup]]] = {}
+        self.catalog_version = None
+    
+    def get(self, name: str, language: str = DEFAULT_LANGUAGE) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+        """Compiled (template, markup) for a response"""
+        version = self.db.shop.get("version", 0)
+        if version != self.catalog_version:
+            self.compiled.clear()
+            self.catalog_version = version
+        
+        if name not in BUILDERS.get(language, {}):
+            language = DEFAULT_LANGUAGE
+        key = (name, language, version)
+        entry = self.compiled.get(key)
+        if entry is None:
+            entry = BUILDERS[language][name](self.config, self.db.get_shop_items())
+            self.compiled[key] = entry
+        return entry
+    
+    def render(self, name: str, language: str = DEFAULT_LANGUAGE, **fields) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+        """Response text with per-user fields filled in, plus its markup"""
+        template, markup = self.get(name, language)
+        return (template.format(**fields) if fields else template), markup
\ No newline at end of file
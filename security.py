@@ -1,18 +1,23 @@
 import re
 from typing import Dict, List
+from config import Config
 from db import Database
+from neardup import NearDuplicateIndex
+from wordfilter import WordFilter, load_words
 
 class SecurityManager:
     """Security and moderation system"""
     
     def __init__(self, db: Database):
         self.db = db
-        self.spam_detection = {}
+        self.spam_index = NearDuplicateIndex()
+        self.word_filter = WordFilter()
         
         # Bad words list (Bengali)
         self.bad_words = [
             "খারাপ", "অশ্লীল", "গালি", "অপমান"
         ]
+        self.word_filter.add_words(load_words(Config.BAD_WORDS_FILE))
         
         # Spam patterns
         self.spam_patterns = [
@@ -26,8 +31,10 @@ class SecurityManager:
         """Check message for security violations"""
         violations = []
         
-        # Check for spam
-        if self._is_spam(user_id, message):
+        # Check for spam: repeats count against the sender; a campaign match
+        # alone may be a shared greeting, so it only removes the message
+        spam = self.spam_index.check(user_id, message)
+        if spam == "repeat":
             violations.append("spam")
         
         # Check for bad words
@@ -40,10 +47,7 @@ class SecurityManager:
         
         if violations:
             # Update warning count
-            user = self.db.get_user(user_id)
-            if user:
-                warnings = user.get("warnings", 0) + 1
-                self.db.update_user(user_id, {"warnings": warnings})
+            self.db.modify_user(user_id, lambda u: {"warnings": u.get("warnings", 0) + 1})
             
             return {
                 "safe": False,
@@ -51,43 +55,31 @@ class SecurityManager:
                 "action": "warn" if len(violations) < 3 else "ban"
             }
         
+        if spam == "campaign":
+            return {"safe": False, "violations": ["campaign"], "action": "delete"}
+        
         return {"safe": True, "violations": []}
     
-    def _is_spam(self, user_id: int, message: str) -> bool:
-        """Check if message is spam"""
-        # Simple spam detection
-        if user_id not in self.spam_detection:
-            self.spam_detection[user_id] = {
-                "count": 0,
-                "last_message": "",
-                "timestamp": 0
-            }
-        
-        user_data = self.spam_detection[user_id]
-        
-        # Check for duplicate messages
-        if message == user_data["last_message"]:
-            user_data["count"] += 1
-        else:
-            user_data["count"] = 1
-            user_data["last_message"] = message
-        
-        # Reset after 10 seconds
-        import time
-        if time.time() - user_data["timestamp"] > 10:
-            user_data["count"] = 0
-        
-        user_data["timestamp"] = time.time()
-        
-        return user_data["count"] > 3  # More than 3 same messages is spam
+    def export_state(self) -> Dict:
+        """Recent message signatures for a checkpoint"""
+        return {"spam_index": self.spam_index.export_state()}
+    
+    def import_state(self, state: Dict, now: float):
+        """Restore message signatures still inside the spam window"""
+        self.spam_index.import_state(state.get("spam_index", []), now)
+    
+    @property
+    def bad_words(self) -> List[str]:
+        """Banned terms (assigning a new list rebuilds the matcher)"""
+        return self.word_filter.words
+    
+    @bad_words.setter
+    def bad_words(self, words: List[str]):
+        self.word_filter.set_words(words)
     
     def _contains_bad_words(self, text: str) -> bool:
-        """Check for bad words"""
-        text_lower = text.lower()
-        for word in self.bad_words:
-            if word in text_lower:
-                return True
-        return False
+        """Check for bad words (one pass over normalized text)"""
+        return self.word_filter.contains(text)
     
     def _contains_links(self, text: str) -> bool:
         """Check for links"""
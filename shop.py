@@ -1,6 +1,7 @@
 from typing import List, Dict, Optional
 from db import Database
 from utils import Utils
+from cache import memoize
 
 class ShopManager:
     """Shop management system"""
@@ -14,11 +15,7 @@ class ShopManager:
     
     def get_item_by_id(self, item_id: str) -> Optional[Dict]:
         """Get specific item by ID"""
-        items = self.get_shop_items()
-        for item in items:
-            if item["id"] == item_id:
-                return item
-        return None
+        return self.db.get_shop_item(item_id)
     
     async def buy_item(self, user_id: int, item_id: str) -> Dict:
         """Buy an item"""
@@ -41,31 +38,22 @@ class ShopManager:
                 "success": True,
                 "message": f"✅ {item['name']} কিনেছেন! -{Utils.format_coins(item['price'])}",
                 "item": item,
-                "coins": user["coins"] - item["price"]
+                "coins": self.db.get_user(user_id)["coins"]
             }
         else:
             return {"success": False, "message": "ক্রয় ব্যর্থ হয়েছে!"}
     
+    @memoize(depends_on={"users": "user_id", "shop": None})
     async def get_user_inventory(self, user_id: int) -> str:
         """Get user's inventory"""
         user = self.db.get_user(user_id)
         if not user or not user.get("inventory"):
             return "📦 আপনার ইনভেন্টরিতে কোনো আইটেম নেই!"
         
-        inventory = user["inventory"]
-        items = self.get_shop_items()
-        
         inventory_text = "🛍️ **আপনার ইনভেন্টরি:**\n\n"
         
-        # Count items
-        item_counts = {}
-        for inv_item in inventory:
-            item_id = inv_item.get("item_id")
-            if item_id:
-                item_counts[item_id] = item_counts.get(item_id, 0) + 1
-        
         # Display items
-        for item_id, count in item_counts.items():
+        for item_id, count in user["inventory"].items():
             item = self.get_item_by_id(item_id)
             if item:
                 inventory_text += f"{item.get('icon', '📦')} {item['name']} ×{count}\n"
@@ -81,14 +69,7 @@ class ShopManager:
         if not user:
             return {"success": False, "message": "ইউজার খুঁজে পাওয়া যায়নি!"}
         
-        # Find item in inventory
-        item_index = -1
-        for i, inv_item in enumerate(user.get("inventory", [])):
-            if inv_item.get("item_id") == item_id:
-                item_index = i
-                break
-        
-        if item_index == -1:
+        if not user.get("inventory", {}).get(item_id):
             return {"success": False, "message": "এই আইটেম আপনার ইনভেন্টরিতে নেই!"}
         
         item = self.get_item_by_id(item_id)
@@ -96,8 +77,8 @@ class ShopManager:
             return {"success": False, "message": "আইটেম খুঁজে পাওয়া যায়নি!"}
         
         # Remove from inventory
-        user["inventory"].pop(item_index)
-        self.db.update_user(user_id, {"inventory": user["inventory"]})
+        if not self.db.use_item(user_id, item_id):
+            return {"success": False, "message": "এই আইটেম আপনার ইনভেন্টরিতে নেই!"}
         
         # Apply item effects
         effects = self._apply_item_effect(user_id, item)
@@ -114,17 +95,13 @@ class ShopManager:
         
         if item_type == "double_xp":
             # For demonstration, just add coins
-            user = self.db.get_user(user_id)
             bonus = 100
-            user["coins"] += bonus
-            self.db.update_user(user_id, {"coins": user["coins"]})
+            self.db.modify_user(user_id, lambda u: {"coins": u["coins"] + bonus})
             return f"⚡ +{bonus} কয়েন বোনাস!"
         
         elif item_type == "coin_boost":
             bonus = 200
-            user = self.db.get_user(user_id)
-            user["coins"] += bonus
-            self.db.update_user(user_id, {"coins": user["coins"]})
+            self.db.modify_user(user_id, lambda u: {"coins": u["coins"] + bonus})
             return f"💰 +{bonus} কয়েন বোনাস!"
         
         else:
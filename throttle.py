@@ -0,0 +1,265 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from config import Config
+
+# Endpoints that count against Telegram's message limits
+THROTTLED_PREFIXES = ("send", "copy", "forward", "edit")
+
+# Running total of seconds the current handler spent in API calls, slot
+# waits included (set by the caller to measure; None = not measured)
+api_seconds: ContextVar[Optional[List[float]]] = ContextVar("api_seconds", default=None)
+
+class Priority(IntEnum):
+    """Outbound lanes, most urgent first"""
+    INTERACTIVE = 0  # replies to a user's own update
+    NOTIFY = 1       # one-off notifications
+    BULK = 2         # broadcasts
+
+class OutboundScheduler:
+    """Paces sends to a global and a per-chat budget, most urgent lane first
+    
+    Waiters queue per lane. Each dispatch releases the oldest waiter of
+    the most urgent lane whose chat is ready, one per global slot. Bulk
+    traffic only gets bulk_share of the global rate so replies always find
+    free slots. Knows nothing about Telegram (pass a fake clock to test).
+    """
+    
+    def __init__(self, global_rate: float = None, chat_rate: float = None,
+                 group_per_minute: float = None, bulk_share: float = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.global_interval = 1 / (global_rate or Config.OUTBOUND_GLOBAL_RATE)
+        self.chat_interval = 1 / (chat_rate or Config.OUTBOUND_CHAT_RATE)
+        self.group_interval = 60 / (group_per_minute or Config.OUTBOUND_GROUP_PER_MINUTE)
+        self.bulk_interval = self.global_interval / (bulk_share or Config.OUTBOUND_BULK_SHARE)
+        self.clock = clock
+        
+        # Next time a send may go: globally, per chat and for the bulk lane
+        self.global_tat = 0.0
+        self.chat_tats: Dict[Union[int, str], float] = {}
+        self.bulk_tat = 0.0
+        self.paused_until = 0.0
+        
+        # One list per lane of [chat_id, future, enqueued_at]
+        self.lanes: List[List[list]] = [[] for _ in Priority]
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+        
+        self.sent = [0] * len(Priority)
+        self.waited = [0.0] * len(Priority)
+        self.pauses = 0
+    
+    def _chat_interval(self, chat_id) -> float:
+        """Groups and channels (negative ids) get the per-minute budget"""
+        if isinstance(chat_id, int) and chat_id < 0:
+            return self.group_interval
+        return self.chat_interval
+    
+    def _dispatch(self, now: float) -> Optional[float]:
+        """Release every waiter allowed at `now`; seconds until the next try (None = idle)"""
+        while True:
+            for lane in self.lanes:
+                # Waiters whose acquire() was cancelled must not use a slot
+                if any(future.done() for _, future, _ in lane):
+                    lane[:] = [waiter for waiter in lane if not waiter[1].done()]
+            if not any(self.lanes):
+                return None
+            start = max(self.paused_until, self.global_tat)
+            if start > now:
+                return start - now
+            
+            released = False
+            next_ready = None
+            for priority, lane in enumerate(self.lanes):
+                if priority == Priority.BULK and self.bulk_tat > now:
+                    if lane:
+                        next_ready = min(next_ready or self.bulk_tat, self.bulk_tat)
+                    continue
+                for i, waiter in enumerate(lane):
+                    chat_tat = self.chat_tats.get(waiter[0], 0.0)
+                    if chat_tat > now:
+                        next_ready = min(next_ready or chat_tat, chat_tat)
+                        continue
+                    del lane[i]
+                    self._release(waiter, priority, now)
+                    released = True
+                    break
+                if released:
+                    break
+            
+            if not released:
+                return (next_ready - now) if next_ready is not None else self.global_interval
+    
+    def _release(self, waiter: list, priority: int, now: float):
+        """Reserve the slots and wake the sender"""
+        chat_id, future, enqueued_at = waiter
+        self.global_tat = now + self.global_interval
+        if chat_id is not None:
+            self.chat_tats[chat_id] = now + self._chat_interval(chat_id)
+        if priority == Priority.BULK:
+            self.bulk_tat = now + self.bulk_interval
+        
+        self.sent[priority] += 1
+        self.waited[priority] += now - enqueued_at
+        if not future.done():
+            future.set_result(None)
+        
+        if len(self.chat_tats) > 10000:
+            self.chat_tats = {k: tat for k, tat in self.chat_tats.items() if tat > now}
+    
+    async def _run(self):
+        """Dispatcher: sleeps until the next slot or a new waiter"""
+        while True:
+            delay = self._dispatch(self.clock())
+            self.wakeup.clear()
+            if delay is None:
+                await self.wakeup.wait()
+            elif delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+    
+    def start(self):
+        """Start the dispatcher on the running loop"""
+        if self.task is None or self.task.done():
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def stop(self):
+        """Stop the dispatcher and fail anyone still waiting"""
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        for lane in self.lanes:
+            for _, future, _ in lane:
+                future.cancel()
+            lane.clear()
+    
+    async def acquire(self, chat_id, priority: int = Priority.INTERACTIVE):
+        """Wait for a send slot for chat_id"""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.lanes[priority].append([chat_id, future, self.clock()])
+        self.wakeup.set()
+        await future
+    
+    def pause(self, seconds: float):
+        """Hold all sends for `seconds` (Telegram's retry_after)"""
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+        self.pauses += 1
+        if self.wakeup is not None:
+            self.wakeup.set()
+    
+    def stats(self) -> Dict:
+        """Queue lengths and per-lane counters"""
+        stats = {
+            lane.name.lower(): {
+                "queued": len(self.lanes[lane]),
+                "sent": self.sent[lane],
+                "avg_wait_ms": round(self.waited[lane] / self.sent[lane] * 1000) if self.sent[lane] else 0
+            }
+            for lane in Priority
+        }
+        stats["pauses"] = self.pauses
+        stats["paused_for"] = max(self.paused_until - self.clock(), 0)
+        return stats
+
+class TelegramThrottler(BaseRateLimiter):
+    """python-telegram-bot rate limiter backed by OutboundScheduler
+    
+    Pick a lane per call with rate_limit_args={"priority": Priority.BULK};
+    the default is INTERACTIVE. A 429 pauses every send for retry_after
+    and the request is retried up to max_retries times.
+    """
+    
+    def __init__(self, scheduler: OutboundScheduler = None, max_retries: int = 3):
+        self.scheduler = scheduler or OutboundScheduler()
+        self.max_retries = max_retries
+    
+    async def initialize(self):
+        """Start the dispatcher (called by Application.initialize)"""
+        self.scheduler.start()
+    
+    async def shutdown(self):
+        """Stop the dispatcher (called by Application.shutdown)"""
+        await self.scheduler.stop()
+    
+    async def process_request(self, callback: Callable, args: Any, kwargs: Dict[str, Any],
+                              endpoint: str, data: Dict[str, Any], rate_limit_args: Optional[Dict]):
+        """Wait for a slot, then make the API call (timed into api_seconds)"""
+        started = time.perf_counter()
+        try:
+            return await self._send(callback, args, kwargs, endpoint, data, rate_limit_args)
+        finally:
+            total = api_seconds.get()
+            if total is not None:
+                total[0] += time.perf_counter() - started
+    
+    async def _send(self, callback: Callable, args: Any, kwargs: Dict[str, Any],
+                    endpoint: str, data: Dict[str, Any], rate_limit_args: Optional[Dict]):
+        """Acquire a slot and call, retrying after 429s"""
+        priority = (rate_limit_args or {}).get("priority", Priority.INTERACTIVE)
+        throttled = endpoint.startswith(THROTTLED_PREFIXES)
+        
+        for attempt in range(self.max_retries + 1):
+            if throttled:
+                await self.scheduler.acquire(data.get("chat_id"), priority)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"⏳ Telegram flood limit on {endpoint}, pausing sends for {e.retry_after}s")
+                self.scheduler.pause(float(e.retry_after))
+
+if __name__ == "__main__":
+    # python throttle.py: a broadcast and interactive replies through a fake bot
+    class FakeBot:
+        """Records send times per chat; raises one 429 halfway through"""
+        
+        def __init__(self):
+            self.sends: List[tuple] = []
+            self.flooded = False
+        
+        async def send_message(self, chat_id, text):
+            if len(self.sends) == 40 and not self.flooded:
+                self.flooded = True
+                raise RetryAfter(1)
+            self.sends.append((time.monotonic(), chat_id))
+            return True
+    
+    async def main():
+        bot = FakeBot()
+        limiter = TelegramThrottler(OutboundScheduler(global_rate=30, chat_rate=1, bulk_share=0.7))
+        await limiter.initialize()
+        
+        async def send(chat_id, priority):
+            started = time.monotonic()
+            await limiter.process_request(
+                bot.send_message, (chat_id, "hi"), {}, "sendMessage",
+                {"chat_id": chat_id}, {"priority": priority}
+            )
+            return time.monotonic() - started
+        
+        started = time.monotonic()
+        bulk = [asyncio.create_task(send(1000 + i, Priority.BULK)) for i in range(90)]
+        await asyncio.sleep(0.5)
+        replies = await asyncio.gather(*(send(7, Priority.INTERACTIVE) for _ in range(3)))
+        await asyncio.gather(*bulk)
+        elapsed = time.monotonic() - started
+        
+        times = [t for t, _ in bot.sends]
+        peak = max(sum(1 for u in times if t <= u < t + 1) for t in times)
+        print(f"📤 {len(bot.sends)} sends in {elapsed:.1f}s, peak {peak}/s")
+        print(f"💬 Interactive waits (same chat): {', '.join(f'{w * 1000:.0f} ms' for w in replies)}")
+        print(f"📊 {limiter.scheduler.stats()}")
+        await limiter.shutdown()
+    
+    asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,248 @@
+import os
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# Characters that only hide a word from matching: zero-width joiners and
+# spaces, BOM, soft hyphen (ZWJ/ZWNJ also carry no meaning for matching)
+_INVISIBLE = dict.fromkeys(map(ord, "​‌‍⁠﻿­"), None)
+
+# Look-alike characters folded to one Latin letter: Cyrillic, Greek,
+# common leetspeak, and Bengali digits (via ASCII digits)
+_HOMOGLYPHS = {
+    # Cyrillic
+    "а": "a", "в": "b", "е": "e", "ё": "e", "к": "k", "м": "m", "н": "h", "о": "o",
+    "р": "p", "с": "c", "т": "t", "у": "y", "х": "x", "і": "i", "ї": "i", "ј": "j",
+    "ѕ": "s", "ԁ": "d", "ӏ": "l", "ԛ": "q", "ԝ": "w",
+    # Greek
+    "α": "a", "β": "b", "ε": "e", "η": "n", "ι": "i", "κ": "k", "ν": "v", "ο": "o",
+    "ρ": "p", "τ": "t", "υ": "u", "χ": "x", "ω": "w",
+    # Leetspeak
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s", "!": "i",
+    # Bengali digits
+    "০": "o", "১": "i", "৩": "e", "৪": "a", "৫": "s", "৭": "t"
+}
+_LOOKALIKE = {ord(k): v for k, v in _HOMOGLYPHS.items()}
+_FOLD = {**_INVISIBLE, **_LOOKALIKE}
+
+# Terms this short (in code points) never take a suffix
+SHORT_TERM = 3
+
+# Bengali inflections a longer Bengali term may carry (case endings,
+# plurals, classifiers, emphasis)
+SUFFIXES = frozenset(unicodedata.normalize("NFKC", s) for s in [
+    "ে", "র", "ের", "য়", "য়ের", "কে", "তে", "রা", "েরা", "দের", "টা", "টি", "টো",
+    "গুলো", "গুলি", "গুলোকে", "ই", "ও", "টাই", "মি", "ভাবে"
+])
+
+def normalize(text: str) -> str:
+    """Canonical form for matching: NFKC, casefold, invisibles dropped, homoglyphs folded"""
+    return unicodedata.normalize("NFKC", text).casefold().translate(_FOLD)
+
+def is_word_char(ch: str) -> bool:
+    """Letters, digits and combining marks (Bengali vowel signs, hasanta)"""
+    return ch.isalnum() or ch == "_" or unicodedata.category(ch)[0] == "M"
+
+class AhoCorasick:
+    """Multi-pattern substring matcher: one pass over the text for all patterns"""
+    
+    def __init__(self, patterns: Iterable[str]):
+        # State 0 is the root; per state: transitions, failure link, matches
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[tuple] = [()]
+        self.patterns: List[str] = []
+        
+        for pattern in dict.fromkeys(p for p in patterns if p):
+            self._add(pattern)
+        self._link()
+    
+    def _add(self, pattern: str):
+        """Insert a pattern into the trie"""
+        state = 0
+        for ch in pattern:
+            next_state = self.goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][ch] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(())
+            state = next_state
+        self.output[state] += (len(self.patterns),)
+        self.patterns.append(pattern)
+    
+    def _link(self):
+        """Breadth-first failure links; outputs inherit their fallback's"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(ch, 0)
+                self.fail[child] = target if target != child else 0
+                if self.output[self.fail[child]]:
+                    self.output[child] += self.output[self.fail[child]]
+    
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """(end position, pattern index) of every occurrence, left to right"""
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for position, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in output[state]:
+                yield position, index
+    
+    def search(self, text: str) -> bool:
+        """True if any pattern occurs in text"""
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                return True
+        return False
+    
+    def find_all(self, text: str) -> List[str]:
+        """Every pattern occurring in text, in order of first occurrence"""
+        goto, fail, output = self.goto, self.fail, self.output
+        found = {}
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in output[state]:
+                found.setdefault(index, None)
+        return [self.patterns[index] for index in found]
+    
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+class WordFilter:
+    """Banned-term matcher over normalized text
+    
+    Every term must start at a word boundary and end at one. Longer
+    Bengali terms may also end in one of SUFFIXES, so inflected forms
+    still match; Latin and short terms may not.
+    """
+    
+    def __init__(self, words: Iterable[str] = ()):
+        self.words: List[str] = []
+        self.matcher = AhoCorasick(())
+        self.whole_word: List[bool] = []
+        self.set_words(words)
+    
+    def set_words(self, words: Iterable[str]):
+        """Replace the term list and rebuild the automaton"""
+        self.words = list(dict.fromkeys(w.strip() for w in words if w and w.strip()))
+        self.matcher = AhoCorasick(normalize(w) for w in self.words)
+        self.whole_word = [
+            len(pattern) <= SHORT_TERM or any(ch.isascii() and ch.isalpha() for ch in pattern)
+            for pattern in self.matcher.patterns
+        ]
+    
+    def _matches(self, text: str) -> Iterator[int]:
+        """Pattern indexes of occurrences that sit on the boundaries their term needs
+        
+        Boundaries are judged before look-alikes are folded, so "bad!" still
+        ends at the "!" while "ph1sh" does not contain a word "his".
+        """
+        plain = unicodedata.normalize("NFKC", text).casefold().translate(_INVISIBLE)
+        folded = plain.translate(_LOOKALIKE)
+        patterns, whole_word = self.matcher.patterns, self.whole_word
+        for end, index in self.matcher.iter_matches(folded):
+            before = end - len(patterns[index])
+            if before >= 0 and is_word_char(plain[before]):
+                continue
+            after = end + 1
+            while after < len(plain) and is_word_char(plain[after]):
+                after += 1
+            if after > end + 1 and (whole_word[index] or plain[end + 1:after] not in SUFFIXES):
+                continue
+            yield index
+    
+    def add_words(self, words: Iterable[str]):
+        """Add terms and rebuild the automaton"""
+        self.set_words(self.words + list(words))
+    
+    def contains(self, text: str) -> bool:
+        """True if the text contains any banned term"""
+        return next(self._matches(text), None) is not None
+    
+    def matches(self, text: str) -> List[str]:
+        """Normalized banned terms found in the text"""
+        found = dict.fromkeys(self._matches(text))
+        return [self.matcher.patterns[index] for index in found]
+
+def load_words(path: str) -> List[str]:
+    """One term per line; blank lines and # comments ignored (missing file = none)"""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+if __name__ == "__main__":
+    # python wordfilter.py [terms] [messages]: throughput on synthetic chat
+    import random
+    import sys
+    import time
+    
+    term_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    message_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    rng = random.Random(42)
+    
+    consonants = "কখগঘচছজঝটঠডঢতথদধনপফবভমযরলশসহ"
+    vowel_signs = ["", "া", "ি", "ী", "ু", "ূ", "ে", "ো"]
+    latin = "bcdfghjklmnprstvz"
+    
+    def bengali_word():
+        return "".join(rng.choice(consonants) + rng.choice(vowel_signs) for _ in range(rng.randint(2, 4)))
+    
+    def latin_word():
+        return "".join(rng.choice(latin) + rng.choice("aeiou") for _ in range(rng.randint(2, 4)))
+    
+    terms = [bengali_word() if i % 2 else latin_word() for i in range(term_count)]
+    vocabulary = [bengali_word() for _ in range(3000)] + [latin_word() for _ in range(2000)]
+    planted = [rng.random() < 0.02 for _ in range(message_count)]
+    messages = [
+        " ".join(rng.choice(vocabulary) for _ in range(rng.randint(3, 25)))
+        + (" " + rng.choice(terms) if plant else "")
+        for plant in planted
+    ]
+    # Vocabulary words that happen to be terms are true hits too
+    banned = set(terms)
+    expected = [plant or any(w in banned for w in m.split()) for plant, m in zip(planted, messages)]
+    chars = sum(len(m) for m in messages)
+    
+    started = time.perf_counter()
+    word_filter = WordFilter(terms)
+    build_ms = (time.perf_counter() - started) * 1000
+    print(f"🔧 Built automaton for {len(word_filter.matcher):,} terms "
+          f"({len(word_filter.matcher.goto):,} states) in {build_ms:.0f} ms")
+    
+    started = time.perf_counter()
+    flagged = [word_filter.contains(m) for m in messages]
+    elapsed = time.perf_counter() - started
+    clean = expected.count(False)
+    false_positives = sum(f and not e for f, e in zip(flagged, expected))
+    detected = sum(f and e for f, e in zip(flagged, expected))
+    print(f"⚡ Aho-Corasick: {message_count / elapsed:,.0f} msg/s, "
+          f"{chars / elapsed / 1e6:.2f} M chars/s, {sum(flagged)} flagged")
+    print(f"🎯 Detected {detected}/{message_count - clean}, "
+          f"false positives {false_positives}/{clean} ({false_positives / max(1, clean):.1%})")
+    
+    lowered = [normalize(t) for t in terms]
+    sample = messages[:max(1, message_count // 20)]
+    started = time.perf_counter()
+    naive_hits = sum(any(t in normalize(m) for t in lowered) for m in sample)
+    elapsed = time.perf_counter() - started
+    print(f"🐢 Substring per term (no boundaries): {len(sample) / elapsed:,.0f} msg/s "
+          f"({naive_hits} flagged of {len(sample)})")
\ No newline at end of file